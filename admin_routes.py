@@ -0,0 +1,356 @@
+import json
+from datetime import datetime
+from functools import wraps
+from flask import Blueprint, render_template, request, abort, session, redirect, url_for, flash, jsonify, Response, stream_with_context
+from sqlalchemy import Date
+from models import db, User, Alias, Game, Book, Page, Character, AdminKey
+from b2blaze import upload_file
+from image_cache import cached_url
+import api_v1
+import archive_export
+import archive_stats
+import db_routing
+import metrics
+import profiler
+import table_browser
+
+# Admin pages: login, the dashboard, table editing, tagging, image and title
+# edits, backups, request profiles, and /metrics for the scraper.
+
+bp = Blueprint('admin', __name__)
+
+# Decorator to protect admin routes
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not session.get('is_admin'):
+            return "Unauthorized", 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+# 1. The "Login" Route - Now handles the POST from your Navbar
+@bp.route('/admin/auth', methods=['POST'])
+def admin_auth():
+    # Use .form.get because the navbar uses a POST form
+    key = request.form.get('admin_key') 
+    
+    all_keys = AdminKey.query.all()
+    for admin_key in all_keys:
+        if admin_key.check_key(key):
+            session['is_admin'] = True
+            session.permanent = True # Keeps you logged in for a while
+            flash("Admin access granted.")
+            # Redirect back to where you were, or dashboard if unknown
+            return redirect(url_for('admin.admin_dashboard'))
+    
+    flash("Invalid Admin Key.")
+    return redirect(url_for('public.index'))
+
+# 2. The Dashboard
+@bp.route('/admin/dashboard')
+@admin_required
+def admin_dashboard():
+    # needs to try to login here
+
+    return render_template('admin/dashboard.html', tables=MODEL_MAP.keys(),
+                           db_pools=db_routing.pool_stats(db.engines),
+                           profiles=profiler.recent())
+
+@bp.route('/admin/profiles/<profile_id>')
+@admin_required
+def admin_profile(profile_id):
+    # speedscope JSON (open it at speedscope.app), or collapsed stacks for flamegraph.pl
+    document = profiler.load(profile_id)
+    if not document:
+        abort(404)
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(document), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename={profile_id}.collapsed.txt'})
+    return Response(json.dumps(document), mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename={profile_id}.speedscope.json'})
+
+# Full backup of the archive, streamed as it's read (see archive_export.py)
+@bp.route('/admin/export')
+@admin_required
+def admin_export():
+    stamp = datetime.now().strftime('%Y%m%d-%H%M')
+    if request.args.get('format') == 'zip':
+        chunks = archive_export.iter_zip(include_images=request.args.get('images') == '1')
+        filename, mimetype = f"bpp-archive-{stamp}.zip", 'application/zip'
+    else:
+        chunks = archive_export.iter_ndjson()
+        filename, mimetype = f"bpp-archive-{stamp}.ndjson", 'application/x-ndjson'
+
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+# 4. Manage Keys
+@bp.route('/admin/keys/add', methods=['POST'])
+@admin_required
+def add_admin_key():
+    name = request.form.get('name')
+    plain_key = request.form.get('key').strip()
+    
+    new_admin = AdminKey(key_name=name)
+    new_admin.set_key(plain_key)
+    db.session.add(new_admin)
+    db.session.commit()
+    return "Key Added"
+
+# Map strings to models for dynamic routing
+MODEL_MAP = {
+    'users': User,
+    'aliases': Alias,
+    'games': Game,
+    'books': Book,
+    'pages': Page,
+    'characters': Character,
+    'admin_keys': AdminKey
+}
+
+@bp.route('/admin/tables')
+@admin_required
+def list_tables():
+    return render_template('admin/tables_list.html', tables=MODEL_MAP.keys())
+
+@bp.route('/admin/table/<table_name>')
+@admin_required
+def data_table_detail(table_name):
+    model = MODEL_MAP.get(table_name)
+    if not model:
+        return "Table not found", 404
+
+    # Column values only, keyset paging and indexed filters/sorts (see table_browser.py)
+    try:
+        view = table_browser.browse(model, request.args)
+    except api_v1.ApiError as e:
+        flash(str(e))
+        return redirect(url_for('admin.data_table_detail', table_name=table_name))
+
+    return render_template(
+        'admin/table_view.html', 
+        table_name=table_name, 
+        per_page=table_browser.PER_PAGE,
+        **view
+    )
+@bp.route('/admin/table/<table_name>/edit/<int:item_id>', methods=['GET', 'POST'])
+@bp.route('/admin/table/<table_name>/add', methods=['GET', 'POST'])
+@admin_required
+def edit_item(table_name, item_id=None):
+    model = MODEL_MAP.get(table_name)
+    columns = [c for c in model.__table__.columns if not c.primary_key]
+    item = model.query.get(item_id) if item_id else model()
+
+    if request.method == 'POST':
+        for col in columns:
+            val = request.form.get(col.name)
+            
+            if val == "" or val is None:
+                setattr(item, col.name, None)
+                continue
+
+            # --- THE FIX: Convert String to Date ---
+            if isinstance(col.type, Date):
+                try:
+                    # HTML <input type="date"> sends YYYY-MM-DD
+                    date_obj = datetime.strptime(val, '%Y-%m-%d').date()
+                    setattr(item, col.name, date_obj)
+                except ValueError:
+                    flash(f"Invalid date format for {col.name}")
+            else:
+                setattr(item, col.name, val)
+        
+        if not item_id:
+            db.session.add(item)
+            
+        db.session.commit()
+        archive_stats.flush_dirty()
+        flash(f"Item in {table_name} updated!")
+        return redirect(url_for('admin.data_table_detail', table_name=table_name))
+
+    return render_template('admin/edit_item.html', table_name=table_name, item=item, columns=columns)
+
+@bp.route('/admin/table/<table_name>/delete/<int:item_id>', methods=['POST'])
+@admin_required
+def delete_item(table_name, item_id):
+    model = MODEL_MAP.get(table_name)
+    item = model.query.get_or_404(item_id)
+    db.session.delete(item)
+    db.session.commit()
+    archive_stats.flush_dirty()
+    flash("Item deleted.")
+    return redirect(url_for('admin.data_table_detail', table_name=table_name))
+
+@bp.route('/admin/add-character', methods=['POST'])
+@admin_required
+def add_character():
+    import cooccurrence
+
+    name = request.form.get('name')
+    panel = request.form.get('page_id')
+
+    if not name or not panel:
+        flash("Name and panel are required!")
+        return redirect(request.referrer)
+
+    # check if character with same name exists
+    character = Character.query.filter_by(name=name).first()
+    page = Page.query.get(panel)
+
+    if not page:
+        flash("Invalid panel specified!")
+        return redirect(request.referrer)
+
+    character_exists = character is not None
+
+    if character_exists:
+        if character not in page.characters:
+            page.characters.append(character)
+    else:
+        character = Character(name=name, image_url="")
+        db.session.add(character)
+
+        character.pages.append(page)
+
+    db.session.commit()
+    # New characters had no id when tagged, so include this one explicitly
+    cooccurrence.mark_characters_dirty([character.id] + [c.id for c in page.characters])
+    cooccurrence.refresh_dirty_characters()
+    archive_stats.mark_dirty(characters=[character.id])
+    archive_stats.flush_dirty()
+
+    # Check if request is AJAX
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify({
+            "id": character.id,
+            "name": character.name,
+            "imgSrc": cached_url(character.image_url) if character_exists else None
+        })
+
+    return redirect(url_for('public.panel_detail', page_id=request.form.get('page_id')))
+
+@bp.route('/admin/tag-character', methods=['POST'])
+@admin_required
+def tag_character():
+    import cooccurrence
+
+    page_id = request.form.get('page_id')
+    char_id = request.form.get('character_id')
+    
+    if not page_id or not char_id:
+        flash("Missing page or character ID!")
+        return redirect(request.referrer)
+
+    panel = Page.query.get(page_id)
+    character = Character.query.get(char_id)
+    
+    if panel and character and character not in panel.characters:
+        panel.characters.append(character)
+        db.session.commit()
+        cooccurrence.refresh_dirty_characters()
+        archive_stats.flush_dirty()
+    
+        # Check if request is AJAX
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({
+                "status": "success",
+                "id": character.id,
+                "name": character.name,
+                "imgSrc": cached_url(character.image_url)
+            })
+
+    return redirect(url_for('public.panel_detail', page_id=page_id))
+
+@bp.route('/admin/untag-character', methods=['POST'])
+@admin_required
+def untag_character():
+    import cooccurrence
+
+    page_id = request.form.get('page_id')
+    char_id = request.form.get('character_id')
+    
+    panel = Page.query.get(page_id)
+    character = Character.query.get(char_id)
+    
+    if panel and character and character in panel.characters:
+        panel.characters.remove(character)
+        db.session.commit()
+        cooccurrence.refresh_dirty_characters()
+        archive_stats.flush_dirty()
+        flash(f"Removed {character.name} from panel.")
+    
+    return redirect(url_for('public.panel_detail', page_id=page_id))
+
+@bp.route('/admin/update-image/<string:model_type>/<int:item_id>', methods=['POST'])
+@admin_required
+def update_image(model_type, item_id):
+    from image_optimize import recompress, record_savings, data_size
+
+    # 1. Get the image from the form
+    image_file = request.files.get('new_image')
+    if not image_file:
+        flash("No image selected!")
+        return redirect(request.referrer)
+
+    # 2. Upload to storage (losslessly recompressed first). The upload is
+    # streamed straight from the request's temp file unless recompression wins.
+    original_size = data_size(image_file.stream)
+    image_data, _, content_type = recompress(image_file.stream)
+    stored_size = data_size(image_data)
+    new_url = upload_file(image_data, model_type + 's', content_type=content_type) # Organize by model type
+    record_savings(new_url, original_size, stored_size)
+
+    # 3. Update the Database
+    if model_type == 'character':
+        item = Character.query.get_or_404(item_id)
+        item.image_url = new_url
+        redirect_url = url_for('public.character_detail', char_id=item_id)
+    elif model_type == 'game':
+        item = Game.query.get_or_404(item_id)
+        # We need a field to store an override image
+        # Let's call it override_image_url
+        item.override_image_url = new_url 
+        redirect_url = url_for('public.game_list')
+        
+    db.session.commit()
+    flash(f"Updated {model_type} image!")
+    return redirect(redirect_url)
+
+@bp.route('/admin/edit-game-name/<int:game_id>', methods=['POST'])
+@admin_required
+def edit_game_name(game_id):
+    game = Game.query.get_or_404(game_id)
+    new_name = request.form.get('new_name')
+    
+    if new_name and new_name.strip():
+        game.title = new_name.strip()
+        db.session.commit()
+        flash("Game title updated!")
+    
+    return redirect(url_for('public.game_detail', game_id=game.id))
+
+@bp.route('/admin/edit-game-video/<int:game_id>', methods=['POST'])
+@admin_required
+def edit_game_video(game_id):
+    game = Game.query.get_or_404(game_id)
+    new_video_link = request.form.get('video_link')
+    
+    game.video_link = new_video_link.strip() if new_video_link else None
+    db.session.commit()
+    flash("Game video link updated!")
+    
+    return redirect(url_for('public.game_detail', game_id=game.id))
+
+@bp.route('/logout', methods=['POST'])
+def logout():
+    session.clear()
+    flash("Logged out successfully.")
+    return redirect(url_for('public.index'))
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    # Scraped by Prometheus (or anything that reads the text format); summed over all workers
+    if not metrics.authorized(request.headers.get('Authorization'), session.get('is_admin')):
+        abort(401)
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
@@ -0,0 +1,221 @@
+import threading
+import time
+import unicodedata
+from typing import NamedTuple
+from sqlalchemy import func, literal, select, tuple_, union_all
+from models import db, User, Alias, Page
+
+# Works out who the authors in an import are, so the mapping form in step 1
+# comes pre-filled and the admin only checks it.
+#
+# For each author name, best match first:
+#   exact       an alias with exactly this name (one query for all authors)
+#   user        a user whose true_name is exactly this name
+#   normalized  same name ignoring case, accents, spaces and punctuation
+#   fuzzy       close by edit distance ("BobbyB" / "Bobby_B2"), from trigram candidates
+# Each match has a confidence; at PREFILL_MIN and above the form selects that
+# user, below it the form still defaults to a new user and just shows the guess.
+#
+# The normalized and fuzzy lookups use an in-memory trigram index of all alias
+# and user names. Like the character index, each worker keeps its own, drops it
+# when aliases or users change here (model events in app.py), and reloads it
+# every MAX_AGE seconds otherwise. The exact lookup always asks the database,
+# since a game imported on another worker a minute ago matters most.
+#
+# Step 2 then finds or creates every alias with set-based statements
+# (create_aliases) instead of a query per author.
+
+MAX_AGE = 600  # seconds
+PREFILL_MIN = 0.75
+FUZZY_MIN = 0.6   # weaker guesses aren't shown at all
+CANDIDATES = 20   # trigram candidates checked by edit distance
+
+CONFIDENCE = {'exact': 1.0, 'user': 0.95, 'normalized': 0.9}
+AMBIGUOUS = 0.85  # exact alias, but several users have used it
+FUZZY_SCALE = 0.9  # a fuzzy match scores at most this; one typo in 7 letters still pre-fills
+
+
+def normalize(name):
+    """Lowercase letters and digits only, accents dropped: "Zoë_B." -> "zoeb"."""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    return ''.join(ch for ch in decomposed.casefold() if ch.isalnum())
+
+
+def trigrams(norm):
+    padded = f" {norm} "  # so short names still have a few
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b):
+    if not a or not b:
+        return 0.0
+    return 1 - edit_distance(a, b) / max(len(a), len(b))
+
+
+class Match(NamedTuple):
+    user_id: int
+    name: str          # the alias or user name that matched
+    method: str        # exact, user, normalized or fuzzy
+    confidence: float
+
+    @property
+    def prefill(self):
+        return self.confidence >= PREFILL_MIN
+
+
+class AliasIndex:
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._names = {}     # normalized name -> [(user_id, alias or user name)]
+        self._trigrams = {}  # trigram -> set of normalized names
+        self._pages = {}     # user_id -> panels drawn, to break ties
+
+    def load(self):
+        """(Re)build the index: one query for aliases with their panel counts, one for users."""
+        aliases = db.session.query(Alias.name, Alias.user_id, func.count(Page.id)) \
+            .outerjoin(Page, Page.alias_id == Alias.id) \
+            .filter(Alias.user_id.isnot(None)) \
+            .group_by(Alias.id, Alias.name, Alias.user_id) \
+            .all()
+        users = db.session.query(User.id, User.true_name).all()
+
+        with self._lock:
+            self._names = {}
+            self._trigrams = {}
+            self._pages = {}
+            for name, user_id, pages in aliases:
+                self._add(normalize(name), (user_id, name))
+                self._pages[user_id] = self._pages.get(user_id, 0) + pages
+            for user_id, true_name in users:
+                self._add(normalize(true_name), (user_id, true_name))
+            self._loaded_at = time.monotonic()
+
+    def _add(self, norm, entry):
+        if not norm:
+            return
+        if norm not in self._names:
+            self._names[norm] = []
+            for gram in trigrams(norm):
+                self._trigrams.setdefault(gram, set()).add(norm)
+        self._names[norm].append(entry)
+
+    def ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _most_active(self, user_ids):
+        return max(user_ids, key=lambda u: (self._pages.get(u, 0), -u))
+
+    # --- lookups ---
+
+    def resolve(self, authors):
+        """{author: Match or None} for a list of export author names."""
+        authors = list(authors)
+        self.ensure_fresh()
+        result = dict.fromkeys(authors)
+
+        # Exact names, for every author at once
+        exact = {}
+        if authors:
+            query = union_all(
+                select(Alias.name, Alias.user_id, literal('exact').label('method'))
+                .where(Alias.name.in_(authors), Alias.user_id.isnot(None)),
+                select(User.true_name, User.id, literal('user')).where(User.true_name.in_(authors)),
+            )
+            for name, user_id, method in db.session.execute(query):
+                exact.setdefault(name, {}).setdefault(method, set()).add(user_id)
+
+        with self._lock:
+            for author in authors:
+                found = exact.get(author, {})
+                if found.get('exact'):
+                    users = found['exact']
+                    # Several users wrote as this name: the one who also has it as true name, else the busiest
+                    user_id = next(iter(users & found.get('user', set())), None) or self._most_active(users)
+                    confidence = CONFIDENCE['exact'] if len(users) == 1 else AMBIGUOUS
+                    result[author] = Match(user_id, author, 'exact', confidence)
+                elif found.get('user'):
+                    result[author] = Match(next(iter(found['user'])), author, 'user', CONFIDENCE['user'])
+                else:
+                    result[author] = self._closest(author)
+        return result
+
+    def _closest(self, author):
+        norm = normalize(author)
+        if not norm:
+            return None
+        entries = self._names.get(norm)
+        if entries:
+            user_id = self._most_active({user_id for user_id, _ in entries})
+            name = next(name for u, name in entries if u == user_id)
+            return Match(user_id, name, 'normalized', CONFIDENCE['normalized'])
+
+        # Names sharing the most trigrams, then the closest of those by edit distance
+        shared = {}
+        for gram in trigrams(norm):
+            for candidate in self._trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        best = None
+        for candidate in sorted(shared, key=shared.get, reverse=True)[:CANDIDATES]:
+            score = similarity(norm, candidate)
+            if score >= FUZZY_MIN and (best is None or score > best[0]):
+                best = (score, candidate)
+        if best is None:
+            return None
+        score, candidate = best
+        entries = self._names[candidate]
+        user_id = self._most_active({user_id for user_id, _ in entries})
+        name = next(name for u, name in entries if u == user_id)
+        return Match(user_id, name, 'fuzzy', round(score * FUZZY_SCALE, 2))
+
+
+alias_index = AliasIndex()
+
+
+def create_aliases(mapping):
+    """
+    mapping: author name -> user id, or 'NEW' for a new user named after them.
+    Returns author name -> Alias.id, reusing aliases that already exist. The
+    new users, the lookup and the new aliases are one statement each, however
+    many authors there are. Flushes, doesn't commit.
+    """
+    new_users = {author: User(true_name=author) for author, choice in mapping.items() if choice == 'NEW'}
+    if new_users:
+        db.session.add_all(new_users.values())
+        db.session.flush()
+    pairs = {author: (author, new_users[author].id if author in new_users else int(choice))
+             for author, choice in mapping.items()}
+
+    alias_ids = {}
+    if pairs:
+        rows = db.session.execute(
+            select(Alias.id, Alias.name, Alias.user_id)
+            .where(tuple_(Alias.name, Alias.user_id).in_(list(set(pairs.values()))))
+            .order_by(Alias.id)
+        )
+        for alias_id, name, user_id in rows:
+            alias_ids.setdefault((name, user_id), alias_id)  # the oldest, like .first() did
+
+    missing = {pair: Alias(name=pair[0], user_id=pair[1]) for pair in set(pairs.values()) if pair not in alias_ids}
+    if missing:
+        db.session.add_all(missing.values())
+        db.session.flush()
+        alias_ids.update((pair, alias.id) for pair, alias in missing.items())
+    return {author: alias_ids[pair] for author, pair in pairs.items()}
@@ -0,0 +1,92 @@
+from flask import Blueprint, request, abort, url_for, jsonify
+from sqlalchemy import func
+from models import db, Game, Page
+from character_index import character_index
+from game_summary import get_game_summary
+from image_cache import cached_url
+import api_v1
+
+# JSON endpoints: the Random panel, the tagging typeahead, game summaries and
+# the read-only /api/v1 (see api_v1.py).
+
+bp = Blueprint('api', __name__)
+
+@bp.route('/api/panel/random')
+def api_panel_random():
+    untagged_only = request.args.get('untagged', 'false').lower() == 'true'
+    panel_id = _random_panel_id(untagged_only)
+    if not panel_id:
+        return jsonify({"error": "No panels found"}), 404
+
+    # Prepare data for JSON (from column tuples, no lazy loads)
+    panel = api_v1.fetch_panels([panel_id])[0]
+    prompt = db.session.query(Page.content_text) \
+        .filter(Page.book_id == panel["book_id"]).order_by(Page.sequence).limit(1).scalar()
+    return jsonify({
+        "id": panel["id"],
+        "content_url": cached_url(panel["image_url"]),
+        "book_id": panel["book_id"],
+        "game_id": panel["game_id"],
+        "author": panel["alias"],
+        "author_id": panel["user_id"],
+        "prompt": prompt, # The first text page
+        "sequence": panel["sequence"]
+    })
+
+def _random_panel_id(untagged_only=False):
+    query = db.session.query(Page.id).filter(Page.type == 'image')
+    if untagged_only:
+        query = query.filter(~Page.characters.any())
+    return query.order_by(func.random()).limit(1).scalar()
+
+# --- /api/v1: read-only JSON API, see api_v1.py ---
+
+def _api_v1_response(doc):
+    response = jsonify(doc)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.errorhandler(api_v1.ApiError)
+def api_v1_error(e):
+    return jsonify({"error": str(e)}), e.status
+
+@bp.route('/api/v1/<kind>')
+def api_v1_list(kind):
+    if kind not in api_v1.FETCHERS:
+        abort(404)
+    ids, next_cursor = api_v1.list_ids(kind, request.args)
+    return _api_v1_response(api_v1.document(kind, ids, request.args, next_cursor=next_cursor))
+
+@bp.route('/api/v1/<kind>/<int:item_id>')
+def api_v1_item(kind, item_id):
+    if kind not in api_v1.FETCHERS:
+        abort(404)
+    return _api_v1_response(api_v1.document(kind, [item_id], request.args, many=False))
+
+@bp.route('/api/v1/panels/random')
+def api_v1_random_panel():
+    panel_id = _random_panel_id(request.args.get('untagged', 'false').lower() == 'true')
+    if not panel_id:
+        raise api_v1.ApiError("No panels found", 404)
+    response = jsonify(api_v1.document('panels', [panel_id], request.args, many=False))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@bp.route('/api/characters/suggest')
+def api_character_suggest():
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+
+    results = character_index.suggest(query, limit=limit)
+    default_img = url_for('static', filename='default_char.png')
+    for r in results:
+        r['imgSrc'] = cached_url(r['imgSrc']) or default_img
+
+    return jsonify({"query": query, "results": results})
+
+@bp.route('/api/game/<int:game_id>/summary')
+def api_game_summary(game_id):
+    game = Game.query.get_or_404(game_id)
+    summary = get_game_summary(game.id)
+    return jsonify(dict(summary, title=game.display_title, date=game.date.isoformat()))
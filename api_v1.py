@@ -0,0 +1,276 @@
+import base64
+import json
+from collections import defaultdict
+from sqlalchemy import select, tuple_
+from models import db, User, Alias, Game, Book, Page, Character, page_characters
+
+# Read-only JSON API (/api/v1), routed from app.py.
+#
+# Every response is {"data": ..., "included": {type: [...]}, "next": cursor}.
+# Rows are serialized straight from column tuples (no ORM objects, no lazy
+# loads), and each resource type is fetched with one or two queries however
+# many ids are asked for.
+#
+#   include=book,characters    related resources, added to "included"
+#   fields[panels]=id,image_url  only these attributes (fields=... for the primary type)
+#   limit=50&cursor=...        keyset pagination; "next" is the cursor for the next page
+#
+# Books always carry their pages, so a whole book is one request.
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+# --- fetch by ids (one query per type, plus one for tags) ---
+
+def _tags(page_ids):
+    tags = defaultdict(list)
+    if page_ids:
+        rows = db.session.execute(
+            select(page_characters.c.page_id, page_characters.c.character_id)
+            .where(page_characters.c.page_id.in_(page_ids))
+            .order_by(page_characters.c.page_id, page_characters.c.character_id)
+        )
+        for page_id, char_id in rows:
+            tags[page_id].append(char_id)
+    return tags
+
+
+def _page_rows(where):
+    rows = db.session.execute(
+        select(Page.id, Page.book_id, Book.game_id, Page.sequence, Page.type, Page.content_text,
+               Page.content_url, Alias.name.label('alias'), Alias.user_id)
+        .join(Book, Page.book_id == Book.id)
+        .outerjoin(Alias, Page.alias_id == Alias.id)
+        .where(where)
+        .order_by(Page.book_id, Page.sequence)
+    ).all()
+    tags = _tags([r.id for r in rows])
+    return [
+        {
+            "id": r.id,
+            "book_id": r.book_id,
+            "game_id": r.game_id,
+            "sequence": r.sequence,
+            "type": r.type,
+            "text": r.content_text,
+            "image_url": r.content_url,
+            "alias": r.alias,
+            "user_id": r.user_id,
+            "character_ids": tags.get(r.id, [])
+        }
+        for r in rows
+    ]
+
+
+def fetch_panels(ids):
+    return _page_rows(Page.id.in_(ids))
+
+
+def fetch_books(ids):
+    pages = defaultdict(list)
+    for page in _page_rows(Page.book_id.in_(ids)):
+        pages[page["book_id"]].append(page)
+    rows = db.session.execute(select(Book.id, Book.game_id).where(Book.id.in_(ids))).all()
+    return [{"id": r.id, "game_id": r.game_id, "pages": pages.get(r.id, [])} for r in rows]
+
+
+def fetch_games(ids):
+    book_ids = defaultdict(list)
+    for book_id, game_id in db.session.execute(
+            select(Book.id, Book.game_id).where(Book.game_id.in_(ids)).order_by(Book.id)):
+        book_ids[game_id].append(book_id)
+    rows = db.session.execute(
+        select(Game.id, Game.date, Game.title, Game.video_link, Game.override_image_url).where(Game.id.in_(ids))
+    ).all()
+    return [
+        {
+            "id": r.id,
+            "date": r.date.isoformat() if r.date else None,
+            "title": r.title or f"Game Night {r.date.strftime('%m/%d/%Y')}",  # same as Game.display_title
+            "video_link": r.video_link,
+            "image_url": r.override_image_url,
+            "book_ids": book_ids.get(r.id, [])
+        }
+        for r in rows
+    ]
+
+
+def fetch_users(ids):
+    aliases = defaultdict(list)
+    for user_id, name in db.session.execute(
+            select(Alias.user_id, Alias.name).where(Alias.user_id.in_(ids)).order_by(Alias.id)):
+        aliases[user_id].append(name)
+    rows = db.session.execute(select(User.id, User.true_name, User.description).where(User.id.in_(ids))).all()
+    return [
+        {"id": r.id, "name": r.true_name, "description": r.description, "aliases": aliases.get(r.id, [])}
+        for r in rows
+    ]
+
+
+def fetch_characters(ids):
+    rows = db.session.execute(
+        select(Character.id, Character.name, Character.description, Character.image_url)
+        .where(Character.id.in_(ids))
+    ).all()
+    return [dict(r._mapping) for r in rows]
+
+
+FETCHERS = {
+    "games": fetch_games,
+    "books": fetch_books,
+    "panels": fetch_panels,
+    "users": fetch_users,
+    "characters": fetch_characters,
+}
+
+
+# --- includes: (primary type, include name) -> (included type, ids from the primary items) ---
+
+def _flat(items, key):
+    return {i for item in items for i in item[key]}
+
+
+def _pages_of(items):
+    return [p for item in items for p in item.get("pages", [])]
+
+
+def _game_users(games):
+    rows = db.session.execute(
+        select(Alias.user_id).distinct()
+        .join(Page, Page.alias_id == Alias.id)
+        .join(Book, Page.book_id == Book.id)
+        .where(Book.game_id.in_([g["id"] for g in games]), Alias.user_id.isnot(None))
+    )
+    return {user_id for (user_id,) in rows}
+
+
+INCLUDES = {
+    ("games", "books"): ("books", lambda items: _flat(items, "book_ids")),
+    ("games", "users"): ("users", _game_users),
+    ("books", "game"): ("games", lambda items: {i["game_id"] for i in items}),
+    ("books", "users"): ("users", lambda items: {p["user_id"] for p in _pages_of(items)} - {None}),
+    ("books", "characters"): ("characters", lambda items: _flat(_pages_of(items), "character_ids")),
+    ("panels", "book"): ("books", lambda items: {i["book_id"] for i in items}),
+    ("panels", "game"): ("games", lambda items: {i["game_id"] for i in items}),
+    ("panels", "user"): ("users", lambda items: {i["user_id"] for i in items} - {None}),
+    ("panels", "characters"): ("characters", lambda items: _flat(items, "character_ids")),
+}
+
+
+# --- lists: keyset ordering and filters per type ---
+
+LISTS = {
+    # type: (order columns, descending?, {filter param: column})
+    "games": ((Game.date, Game.id), True, {}),
+    "books": ((Book.id,), False, {"game_id": Book.game_id}),
+    "panels": ((Page.id,), False, {"book_id": Page.book_id}),
+    "users": ((User.id,), False, {}),
+    "characters": ((Character.id,), False, {}),
+}
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if len(values) != len(columns):
+            raise ValueError
+        # Dates come back as strings, turn them back into dates
+        return [column.type.python_type.fromisoformat(v) if isinstance(v, str) and
+                hasattr(column.type.python_type, 'fromisoformat') else v
+                for column, v in zip(columns, values)]
+    except (ValueError, TypeError, NotImplementedError):
+        raise ApiError("Invalid cursor")
+
+
+def list_ids(kind, args):
+    """(ids for this page, cursor for the next page or None)"""
+    columns, descending, filters = LISTS[kind]
+    limit = min(max(args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+
+    query = select(*columns)
+    if kind == "panels":
+        query = query.where(Page.type == 'image')
+        # Panels are also filterable by who drew them, what game, and who's in them
+        if args.get('game_id', type=int):
+            query = query.join(Book, Page.book_id == Book.id).where(Book.game_id == args.get('game_id', type=int))
+        if args.get('user_id', type=int):
+            query = query.join(Alias, Page.alias_id == Alias.id).where(Alias.user_id == args.get('user_id', type=int))
+        if args.get('character_id', type=int):
+            query = query.where(Page.id.in_(
+                select(page_characters.c.page_id).where(page_characters.c.character_id == args.get('character_id', type=int))
+            ))
+    for param, column in filters.items():
+        if args.get(param, type=int):
+            query = query.where(column == args.get(param, type=int))
+
+    cursor = args.get('cursor')
+    if cursor:
+        key = decode_cursor(cursor, columns)
+        if len(columns) == 1:
+            query = query.where(columns[0] < key[0] if descending else columns[0] > key[0])
+        else:
+            query = query.where(tuple_(*columns) < tuple_(*key) if descending else tuple_(*columns) > tuple_(*key))
+
+    order = [c.desc() if descending else c.asc() for c in columns]
+    rows = db.session.execute(query.order_by(*order).limit(limit + 1)).all()
+
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [row[-1] for row in rows[:limit]], next_cursor
+
+
+# --- documents ---
+
+def _parse_fields(args, primary):
+    """{type: set of attribute names} from fields[type]=a,b (and fields=a,b for the primary type)."""
+    fields = {}
+    for key, value in args.items():
+        if key == 'fields':
+            fields[primary] = set(value.split(','))
+        elif key.startswith('fields[') and key.endswith(']'):
+            fields[key[7:-1]] = set(value.split(','))
+    return fields
+
+
+def _select_fields(items, names):
+    if not names:
+        return items
+    names = names | {"id"}
+    return [{k: v for k, v in item.items() if k in names} for item in items]
+
+
+def document(kind, ids, args, many=True, next_cursor=None):
+    """Build the response document for primary items of `kind` with these ids, in this order."""
+    items = FETCHERS[kind](ids) if ids else []
+    by_id = {item["id"]: item for item in items}
+    items = [by_id[i] for i in ids if i in by_id]
+    if not many and not items:
+        raise ApiError(f"{kind[:-1].capitalize()} not found", 404)
+
+    included = {}
+    for name in filter(None, args.get('include', '').split(',')):
+        if (kind, name) not in INCLUDES:
+            raise ApiError(f"Can't include '{name}' on {kind}")
+        target, related_ids = INCLUDES[kind, name]
+        wanted = sorted(related_ids(items) - {i["id"] for i in included.get(target, [])})
+        included.setdefault(target, []).extend(FETCHERS[target](wanted) if wanted else [])
+
+    fields = _parse_fields(args, kind)
+    data = _select_fields(items, fields.get(kind))
+    doc = {"data": data if many else data[0]}
+    if included:
+        doc["included"] = {t: _select_fields(v, fields.get(t)) for t, v in included.items()}
+    if many:
+        doc["next"] = next_cursor
+    return doc
@@ -1,945 +1,183 @@
-from flask import Flask, render_template, request, abort, session, redirect, url_for, flash, copy_current_request_context, jsonify
-from models import db, User, Alias, Game, Book, Page, Character, AdminKey, DailyChallenge, page_characters
-from sqlalchemy import Engine, or_, Date, event, func, text, select
-from sqlalchemy.exc import IntegrityError
-from functools import wraps
+from flask import Flask, request, session, before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
+from models import db, User, Alias, Game, Book, Page, Character, PanelFingerprint
+from sqlalchemy import Engine, event, func, select, inspect as sa_inspect
 import os
-from datetime import datetime, date, timedelta
-import random
-import uuid
-from import_bpp import process_html_content
-import json
-from b2blaze import upload_b64img_to_b2, delete_b2_file
+from b2blaze import delete_b2_file
+from character_index import character_index
+from search_index import page_index
+from alias_resolver import alias_index
+from image_cache import cached_url
+import game_summary
+import archive_stats
+import sqlite_mode
+import db_routing
+import metrics
+import profiler
+import assets
+import public_routes
+import api_routes
+import admin_routes
+import import_routes
 from dotenv import load_dotenv
-import base64
-import threading
-import pytz
-import gc
+import sqlite3
 
 load_dotenv()
 
-app = Flask(__name__)
-
-# Get the database URL from environment variables (Render will provide this)
-# If no URL is found, fall back to your local SQLite file
-database_url = os.environ.get('DATABASE_URL')
-
-if database_url:
-    # Fix for Render/Supabase: they often provide 'postgres://' 
-    # but SQLAlchemy 1.4+ requires 'postgresql://'
-    if database_url.startswith("postgres://"):
-        database_url = database_url.replace("postgres://", "postgresql://", 1)
-    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///brokenpicturephone.db'
-
-# Important for Postgres: prevents connection timeout issues
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "pool_pre_ping": True,
-    "pool_size": 5,
-    "max_overflow": 0 # don't allow extra connections beyond pool_size
-}
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-for-sessions')
-app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # 25 MB upload limit
-db.init_app(app)
-
-@app.route('/')
-def index():
-    # Show the 3 most recent games at the top
-    recent_games = Game.query.order_by(Game.date.desc()).limit(4).all()
-
-    # Get today's challenge ID to pass to the JS
-    tz = pytz.timezone('America/New_York')
-    today_date = datetime.now(tz).date()
-    challenge = DailyChallenge.query.filter_by(date=today_date).first()
-    challenge_id = challenge.id if challenge else None
-
-    return render_template('index.html', recent_games=recent_games, challenge_id=challenge_id)
-
-@app.route('/search')
-def search():
-    query = request.args.get('q', '')
-    if not query:
-        return render_template('search.html')
-
-    books = []
-    characters = []
-    users = []
-    games = []
-    advanced_pages = None
-    
-    # 1. Advanced Character Search (Comma-separated)
-    if ',' in query:
-        parts = [p.strip() for p in query.split(',') if p.strip()]
-        if len(parts) > 1:
-            # For each part, find characters that match
-            matching_pages_sets = []
-            for part in parts:
-                # Find characters matching this part
-                chars_for_part = Character.query.filter(Character.name.ilike(f'%{part}%')).all()
-                
-                if not chars_for_part:
-                    # If any part finds no characters, no pages can match all parts
-                    matching_pages_sets.append(set())
-                    break
-                
-                # Find pages that contain at least one of these matching characters
-                char_ids = [c.id for c in chars_for_part]
-                pages_for_part = Page.query.filter(
-                    Page.type == 'image',
-                    Page.characters.any(Character.id.in_(char_ids))
-                ).all()
-                
-                matching_pages_sets.append(set(p.id for p in pages_for_part))
-            
-            # Find the intersection of all page sets
-            if matching_pages_sets:
-                intersected_page_ids = set.intersection(*matching_pages_sets)
-                if intersected_page_ids:
-                    # Fetch the actual Page objects for the intersection
-                    advanced_pages = Page.query.filter(Page.id.in_(intersected_page_ids)).all()
-                else:
-                    advanced_pages = [] # Empty list to indicate we tried but found nothing
-
-    # If it wasn't an advanced search, or we want to show standard results as well:
-    # We still show standard results for the FULL query string, just in case
-    
-    # 2. Books by first text page
-    books = Book.query.join(Page).filter(
-        Page.type == 'text',
-        Page.sequence == 1,
-        Page.content_text.ilike(f'%{query}%')
-    ).all()
-    
-    # 3. Characters by name
-    characters = Character.query.filter(Character.name.ilike(f'%{query}%')).all()
-    
-    # 4. Users by True Name
-    users = User.query.filter(User.true_name.ilike(f'%{query}%')).all()
-
-    # 5. Games by Title
-    games = Game.query.filter(Game.title.ilike(f'%{query}%')).all()
-
-    return render_template('search.html', 
-                            query=query, 
-                            books=books, 
-                            characters=characters, 
-                            users=users, 
-                            games=games,
-                            advanced_pages=advanced_pages)
-
-@app.route('/advanced-search')
-def advanced_search():
-    # 1. Fetch Users and Characters for the form
-    users = User.query.order_by(User.true_name).all()
-    characters = Character.query.order_by(Character.name).all()
-
-    # 2. Extract arguments
-    start_date_str = request.args.get('start_date')
-    end_date_str = request.args.get('end_date')
-    artists = request.args.getlist('artists') # List of User IDs
-    artist_filter_type = request.args.get('artist_filter_type', 'include') # 'include' or 'exclude'
-    whitelist_chars = request.args.getlist('whitelist_characters') # List of Character IDs
-    blacklist_chars = request.args.getlist('blacklist_characters') # List of Character IDs
-
-    # Are there any active filters?
-    has_filters = any([start_date_str, end_date_str, artists, whitelist_chars, blacklist_chars])
-
-    results = None
-    if has_filters:
-        # Base query for image pages
-        query = Page.query.join(Book, Page.book_id == Book.id).join(Game, Book.game_id == Game.id).join(Alias, Page.alias_id == Alias.id).filter(Page.type == 'image')
-
-        # Date Filters
-        if start_date_str:
-            try:
-                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
-                query = query.filter(Game.date >= start_date)
-            except ValueError:
-                pass
-        
-        if end_date_str:
-            try:
-                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-                query = query.filter(Game.date <= end_date)
-            except ValueError:
-                pass
-
-        # Artist Filters
-        if artists:
-            artist_ids = [int(a) for a in artists if a.isdigit()]
-            if artist_ids:
-                if artist_filter_type == 'include':
-                    query = query.filter(Alias.user_id.in_(artist_ids))
-                elif artist_filter_type == 'exclude':
-                    query = query.filter(Alias.user_id.notin_(artist_ids))
-
-        # Character Filters
-        if whitelist_chars:
-            char_ids = [int(c) for c in whitelist_chars if c.isdigit()]
-            for char_id in char_ids:
-                query = query.filter(Page.characters.any(Character.id == char_id))
-        
-        if blacklist_chars:
-            char_ids = [int(c) for c in blacklist_chars if c.isdigit()]
-            if char_ids:
-                query = query.filter(~Page.characters.any(Character.id.in_(char_ids)))
-
-        page = request.args.get('page', 1, type=int)
-        results = query.order_by(Game.date.desc(), Page.book_id.desc(), Page.sequence.desc()).paginate(page=page, per_page=20, error_out=False)
-
-    # Build query args excluding 'page' for pagination links
-    query_args = {}
-    for key in request.args.keys():
-        if key != 'page':
-            # use getlist to preserve multiple values for artists, characters, etc.
-            vals = request.args.getlist(key)
-            query_args[key] = vals if len(vals) > 1 else vals[0]
-
-    return render_template('advanced_search.html', 
-                           users=users, 
-                           characters=characters, 
-                           results=results,
-                           query_args=query_args)
-
-@app.route('/panel/<int:page_id>')
-def panel_detail(page_id):
-    panel = Page.query.get_or_404(page_id)
-
-    all_characters = []
-    # Don't load all characters unless admin, save bandwidth
-    if session.get('is_admin'):
-        all_characters = Character.query.order_by(Character.name).all()
-    return render_template('panel_detail.html', panel=panel, all_characters=all_characters)
-
-@app.route('/panel/random')
-def panel_random():
-    # This just loads the empty "shell" page
-    return render_template('panel_random.html')
-
-@app.route('/api/panel/random')
-def api_panel_random():
-    untagged_only = request.args.get('untagged', 'false').lower() == 'true'
-
-    # Get a random panel
-    panel = Page.query.filter(Page.type == 'image')
-
-    if untagged_only:
-        panel = panel.filter(~Page.characters.any())
-
-    panel = panel.order_by(func.random()).first()
-    
-    if not panel:
-        return jsonify({"error": "No panels found"}), 404
-
-    # Prepare data for JSON
-    return jsonify({
-        "id": panel.id,
-        "content_url": panel.content_url,
-        "book_id": panel.book_id,
-        "game_id": panel.book.game_id,
-        "author": panel.author_alias.name,
-        "author_id": panel.author_alias.user_id,
-        "prompt": panel.book.pages[0].content_text, # The first text page
-        "sequence": panel.sequence
-    })
-
-@app.route('/game/<int:game_id>')
-def game_detail(game_id):
-    game = Game.query.get_or_404(game_id)
-    
-    # Get all users involved in this game via their aliases in the pages
-    # This is a complex join: Game -> Book -> Page -> Alias -> User
-    involved_users = set()
-    for book in game.books:
-        for page in book.pages:
-            if page.author_alias and page.author_alias.user:
-                involved_users.add((page.author_alias.user, page.author_alias))
-    
-    return render_template('game_detail.html', game=game, participants=involved_users)
-
-@app.route('/games')
-def game_list():
-    page = request.args.get('page', 1, type=int)
-    sort = request.args.get('sort', 'desc') # 'desc' for newest first, 'asc' for oldest
-    
-    query = Game.query
-    if sort == 'asc':
-        query = query.order_by(Game.date.asc())
-    else:
-        query = query.order_by(Game.date.desc())
-        
-    pagination = query.paginate(page=page, per_page=12, error_out=False)
-    games = pagination.items
-    
-    return render_template('game_list.html', 
-                           games=games, 
-                           pagination=pagination, 
-                           current_sort=sort)
-
-@app.route('/book/<int:book_id>')
-def book_detail(book_id):
-    book = Book.query.get_or_404(book_id)
-    return render_template('book_detail.html', book=book)
-
-@app.route('/users')
-def user_list():
-    page = request.args.get('page', 1, type=int)
-
-    random_page = (
-        select(Page.content_url.label("page_image_url"), Alias.user_id)
-        .select_from(Alias)
-        .join(Page, Page.alias_id == Alias.id)
-        .where(
-            Alias.user_id == User.id,
-            Page.type == "image"
-        )
-        .order_by(func.random())
-        .limit(1)
-        .lateral()
-    )
-
-    pagination = (
-        db.session.query(
-            User,
-            func.count(Page.id).label('page_count'),
-            random_page.c.page_image_url
-        )
-        .join(Alias, User.id == Alias.user_id)
-        .join(Page, Alias.id == Page.alias_id)
-        .join(random_page, random_page.c.user_id == Alias.user_id)
-        .filter(Page.type == "image")
-        .group_by(User.id, random_page.c.page_image_url)
-        .order_by(func.count(Page.id).desc())
-        .paginate(page=page, per_page=18, error_out=False)
-    )
-
-    users = pagination.items
-    return render_template('user_list.html', users=users, pagination=pagination)
-
-@app.route('/user/<int:user_id>')
-def user_detail(user_id):
-    user = User.query.get_or_404(user_id)
-    
-    # 1. Get the current page from the query string (default to 1)
-    page_num = request.args.get('page', 1, type=int)
-    
-    # 2. Define how many drawings to show per page
-    per_page = 20 
-    
-    # 3. Get alias IDs
-    aliases_ids = [a.id for a in user.aliases]
-    
-    # 4. Change .all() to .paginate()
-    # This returns a Pagination object instead of a list
-    drawings_pagination = Page.query\
-        .join(Book, Page.book_id == Book.id)\
-        .join(Game, Book.game_id == Game.id)\
-        .filter(
-            Page.alias_id.in_(aliases_ids), 
-            Page.type == 'image'
-        )\
-        .order_by(Game.date.desc(), Page.book_id.desc(), Page.sequence.desc())\
-        .paginate(page=page_num, per_page=per_page, error_out=False)
-    
-    return render_template('user_detail.html', 
-                           user=user, 
-                           drawings=drawings_pagination)
-
-@app.route('/characters')
-def character_list():
-    page = request.args.get('page', 1, type=int)
-    # Sort by count
-    pagination = db.session.query(
-        Character, 
-        func.count(Page.id).label('appearance_count')
-    ).outerjoin(Character.pages) \
-     .group_by(Character.id) \
-     .order_by(func.count(Page.id).desc()) \
-     .paginate(
-        page=page, per_page=18, error_out=False
-    )
-    characters = pagination.items
-    return render_template('character_list.html', characters=characters, pagination=pagination)
-
-@app.route('/character/<int:char_id>')
-def character_detail(char_id):
-    character = Character.query.get_or_404(char_id)
-    
-    # Get current page from URL
-    page_num = request.args.get('page', 1, type=int)
-    per_page = 15  # 5 columns x 3 rows looks great on a grid
-    
-    pagination = Page.query\
-        .join(Book, Page.book_id == Book.id)\
-        .join(Game, Book.game_id == Game.id)\
-        .filter(
-            Page.characters.any(id=char_id), 
-            Page.type == 'image'
-        )\
-        .order_by(Game.date.desc(), Page.book_id.desc(), Page.sequence.desc())\
-        .paginate(page=page_num, per_page=per_page, error_out=False)
-        
-    return render_template('character_detail.html', 
-                           character=character, 
-                           drawings=pagination)
-
-@app.route('/character/<int:char_id>/statistics')
-def character_statistics(char_id):
-    character = Character.query.get_or_404(char_id)
-    
-    # Query 1: Appearances over time
-    appearances = db.session.query(Page.id, Game.date)\
-        .join(Book, Page.book_id == Book.id)\
-        .join(Game, Book.game_id == Game.id)\
-        .filter(Page.characters.any(id=char_id), Page.type == 'image')\
-        .all()
-    
-    monthly_counts = {}
-    yearly_counts = {}
-    for _, game_date in appearances:
-        if game_date:
-            month_key = game_date.strftime('%Y-%m') # "YYYY-MM"
-            year_key = game_date.strftime('%Y')     # "YYYY"
-            monthly_counts[month_key] = monthly_counts.get(month_key, 0) + 1
-            yearly_counts[year_key] = yearly_counts.get(year_key, 0) + 1
-            
-    # Sort chronologically
-    monthly_counts = {k: v for k, v in sorted(monthly_counts.items())}
-    yearly_counts = {k: v for k, v in sorted(yearly_counts.items())}
-    
-    # Query 2: Artist Distribution
-    artist_data = db.session.query(User.id, User.true_name, func.count(Page.id).label('count'))\
-        .join(Alias, Alias.user_id == User.id)\
-        .join(Page, Page.alias_id == Alias.id)\
-        .filter(Page.characters.any(id=char_id), Page.type == 'image')\
-        .group_by(User.id, User.true_name)\
-        .order_by(func.count(Page.id).desc())\
-        .all()
-        
-    artist_counts = [{"id": row[0], "name": row[1], "count": row[2]} for row in artist_data]
-    
-    return render_template('character_statistics.html',
-                           character=character,
-                           monthly_counts=monthly_counts,
-                           yearly_counts=yearly_counts,
-                           artist_counts=artist_counts)
-
-@app.route('/daily')
-@app.route('/daily/<date_str>')
-def daily_game(date_str=None):
-    tz = pytz.timezone('America/New_York')
-    today_date = datetime.now(tz).date()
-
-    target_date = today_date
-    if date_str:
-        try:
-            target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-        except ValueError:
-            target_date = today_date
-            
-        if target_date > today_date:
-            return redirect(url_for('daily_game'))
-
-    # 1. Check if the challenge already exists
-    challenge = DailyChallenge.query.filter_by(date=target_date).first()
-
-    if not challenge:
-        # 2. Convert date to a float between -1 and 1 for Postgres setseed()
-        # We use the integer timestamp and a bit of math to generate a seed
-        seed_value = int(target_date.strftime('%Y%m%d')) / 100000000.0
-        
-        # 3. Set the seed in the current database session
-        db.session.execute(text(f"SELECT setseed({seed_value})"))
-
-        # 4. Use the DB to pick the panel. 
-        # Because the seed is set, func.random() will return the SAME panel for this date.
-        sql_query = text("""
-            select p.*
-            from page p
-            join alias a on a.id = p.alias_id
-            where p.type = 'image'
-            and a.user_id is not null
-            and not exists (
-                select 1
-                from page_characters pc
-                where pc.page_id = p.id
-                and (pc.character_id = 164 or pc.character_id = 169 or pc.character_id = 253)
-            )
-            order by random()
-            limit 1;
-        """)
-
-        daily_panel = db.session.execute(sql_query).fetchone()
-
-        if daily_panel:
-            new_challenge = DailyChallenge(date=target_date, page_id=daily_panel.id)
-            db.session.add(new_challenge)
-            try:
-                db.session.commit()
-                challenge = new_challenge
-            except IntegrityError:
-                # Someone else's request finished a millisecond faster
-                db.session.rollback()
-                challenge = DailyChallenge.query.filter_by(date=target_date).first()
-
-    # 3. Use the stored panel
-    panel = challenge.panel
-    
-    # Get the first text prompt for the clue
-    first_prompt = Page.query.filter_by(book_id=panel.book_id, type='text')\
-                             .order_by(Page.sequence.asc()).first()
-    
-    correct_author_id = panel.author_alias.user_id if panel.author_alias else None
-
-    authors = db.session.query(User.id, User.true_name).all()
-    # sort authors by true_name
-    authors = sorted(authors, key=lambda u: u.true_name.lower())
-    
-    # Navigation logic
-    prev_date = target_date - timedelta(days=1)
-    next_date = target_date + timedelta(days=1) if target_date < today_date else None
-    
-    # History for calendar (14-day window centered around target_date)
-    window_end = min(today_date, target_date + timedelta(days=6))
-    history_dates = [(window_end - timedelta(days=i)) for i in range(14)]
-    recent_challenges = DailyChallenge.query.filter(DailyChallenge.date.in_(history_dates)).all()
-    history_dict = {c.date.strftime('%Y-%m-%d'): c.id for c in recent_challenges}
-    
-    return render_template('daily.html', 
-                           panel=panel, 
-                           challenge=challenge,
-                           correct_author_id=correct_author_id,
-                           first_prompt=first_prompt, 
-                           authors=authors,
-                           target_date=target_date,
-                           prev_date=prev_date,
-                           next_date=next_date,
-                           history_dates=[d.strftime('%Y-%m-%d') for d in history_dates],
-                           history_dict=history_dict,
-                           today_date=today_date)
-
-# Decorator to protect admin routes
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not session.get('is_admin'):
-            return "Unauthorized", 401
-        return f(*args, **kwargs)
-    return decorated_function
-
-# 1. The "Login" Route - Now handles the POST from your Navbar
-@app.route('/admin/auth', methods=['POST'])
-def admin_auth():
-    # Use .form.get because the navbar uses a POST form
-    key = request.form.get('admin_key') 
-    
-    all_keys = AdminKey.query.all()
-    for admin_key in all_keys:
-        if admin_key.check_key(key):
-            session['is_admin'] = True
-            session.permanent = True # Keeps you logged in for a while
-            flash("Admin access granted.")
-            # Redirect back to where you were, or dashboard if unknown
-            return redirect(url_for('admin_dashboard'))
-    
-    flash("Invalid Admin Key.")
-    return redirect(url_for('index'))
-
-# 2. The Dashboard
-@app.route('/admin/dashboard')
-@admin_required
-def admin_dashboard():
-    # needs to try to login here
-
-    return render_template('admin/dashboard.html', tables=MODEL_MAP.keys())
-
-# 3. upload logic
-@app.route('/admin/import/step1', methods=['POST'])
-@admin_required
-def import_step1():
-    file = request.files.get('game_file')
-    if not file: return "No file", 400
-    
-    # Use your existing process_html_content function
-    html_content = file.read().decode('utf-8')
-    game_data = process_html_content(html_content)
-    
-    # Extract unique authors from the parsed data
-    found_authors = set()
-    for book in game_data['books']:
-        for page in book['pages']:
-            found_authors.add(page['author'])
-    
-    # Store game data in session (Careful: sessions have size limits, 
-    # for very large games, saving to a temp JSON file is better)
-    # session['temp_game_data'] = game_data
-
-    # Instead, save to a temp JSON file and store the filename in session
-    temp_filename = f"temp_game_{uuid.uuid4()}.json"
-    temp_filepath = os.path.join('instance', 'temp', temp_filename)
-    os.makedirs(os.path.dirname(temp_filepath), exist_ok=True)
-    with open(temp_filepath, 'w') as f:
-        json.dump(game_data, f)
-    session['temp_game_data_file'] = temp_filename
-    
-    # Fetch all existing users for the mapping dropdown
-    existing_users = User.query.all()
-
-    # sort users by true_name
-    existing_users = sorted(existing_users, key=lambda u: u.true_name.lower())
-    
-    return render_template('admin/import_map.html', 
-                           authors=sorted(list(found_authors)), 
-                           users=existing_users)
-
-@app.route('/admin/import/step2', methods=['POST'])
-@admin_required
-def import_step2():
-    temp_filename = session.get('temp_game_data_file')
-    if not temp_filename: return "Session expired", 400
-    temp_filepath = os.path.join('instance', 'temp', temp_filename)
-    
-    with open(temp_filepath, 'r') as f:
-        game_data = json.load(f)
-    
-    mapping = request.form.to_dict()
-    
-    # --- PRE-PROCESS USERS (Do this in the main thread to get IDs) ---
-    user_map = {} # Maps author_name string to Alias.id
-    for author_name, choice in mapping.items():
-        if choice == 'NEW':
-            u = User(true_name=author_name)
-            db.session.add(u)
-            db.session.flush() # Now u.id exists
-            alias = Alias(name=author_name, user_id=u.id)
-        else:
-            user_id = int(choice)
-            alias = Alias.query.filter_by(name=author_name, user_id=user_id).first()
-            if not alias:
-                alias = Alias(name=author_name, user_id=user_id)
-        
-        db.session.add(alias)
-        db.session.flush()
-        user_map[author_name] = alias.id # Store the actual ID
-
-    db.session.commit() # Save the users so the background thread can see them
-
-    # 2. DEFINE THE BACKGROUND TASK
-    @copy_current_request_context
-    def run_combined_import(data, user_id_map, filepath):
-        with app.app_context():
-            try:
-                # A. Parallel Uploads First
-                image_tasks = []
-                for b in data['books']:
-                    for p in b['pages']:
-                        if p['type'] == 'drawing':
-                            b64_content = p['content']
-                            b2_url = upload_b64img_to_b2(b64_content, folder='panels')
-                            p['b2_url'] = b2_url
-
-                # B. Database Insertion (Now fast since images are done)
-                new_game = Game(date=datetime.fromisoformat(data['date']).date())
-                db.session.add(new_game)
-                db.session.flush()
-
-                for book_data in data['books']:
-                    new_book = Book(game_id=new_game.id)
-                    db.session.add(new_book)
-                    db.session.flush()
-
-                    for page_data in book_data['pages']:
-                        p_type = 'image' if page_data['type'] == 'drawing' else 'text'
-                        content = page_data.get('b2_url') if p_type == 'image' else page_data['content']
-
-                        new_page = Page(
-                            book_id=new_book.id,
-                            alias_id=user_id_map[page_data['author']],
-                            sequence=page_data['sequence'],
-                            type=p_type,
-                            content_text=content if p_type == 'text' else None,
-                            content_url=content if p_type == 'image' else None
-                        )
-                        db.session.add(new_page)
-                
-                db.session.commit()
-                
-                # Explicitly clean up
-                del data
-                db.session.remove()
-                gc.collect() # Force Python to release memory back to the OS
-                
-            except Exception as e:
-                print(f"ASYNC IMPORT ERROR: {e}")
-                db.session.rollback()
-            finally:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-
-    # 3. FIRE AND FORGET
-    thread = threading.Thread(target=run_combined_import, args=(game_data, user_map, temp_filepath))
-    thread.start()
-
-    flash("Background import started! Check back in a few seconds.")
-    return redirect(url_for('admin_dashboard'))
-
-# 4. Manage Keys
-@app.route('/admin/keys/add', methods=['POST'])
-@admin_required
-def add_admin_key():
-    name = request.form.get('name')
-    plain_key = request.form.get('key').strip()
-    
-    new_admin = AdminKey(key_name=name)
-    new_admin.set_key(plain_key)
-    db.session.add(new_admin)
-    db.session.commit()
-    return "Key Added"
-
-# Map strings to models for dynamic routing
-MODEL_MAP = {
-    'users': User,
-    'aliases': Alias,
-    'games': Game,
-    'books': Book,
-    'pages': Page,
-    'characters': Character,
-    'admin_keys': AdminKey
-}
-
-@app.route('/admin/tables')
-@admin_required
-def list_tables():
-    return render_template('admin/tables_list.html', tables=MODEL_MAP.keys())
-
-@app.route('/admin/table/<table_name>')
-@admin_required
-def data_table_detail(table_name):
-    model = MODEL_MAP.get(table_name)
-    if not model:
-        return "Table not found", 404
-
-    # 1. Get the current page from the URL (?page=1)
-    page = request.args.get('page', 1, type=int)
-    per_page = 25  # Keep this low for the Free Tier memory limit
-
-    # 2. Use paginate instead of all()
-    # error_out=False prevents 404s if a user enters a page that doesn't exist
-    pagination = model.query.order_by(model.id.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    items = pagination.items
-    columns = model.__table__.columns.keys()
-
-    return render_template(
-        'admin/table_view.html', 
-        table_name=table_name, 
-        items=items, 
-        columns=columns, 
-        pagination=pagination # Pass the whole pagination object to the HTML
-    )
-@app.route('/admin/table/<table_name>/edit/<int:item_id>', methods=['GET', 'POST'])
-@app.route('/admin/table/<table_name>/add', methods=['GET', 'POST'])
-@admin_required
-def edit_item(table_name, item_id=None):
-    model = MODEL_MAP.get(table_name)
-    columns = [c for c in model.__table__.columns if not c.primary_key]
-    item = model.query.get(item_id) if item_id else model()
-
-    if request.method == 'POST':
-        for col in columns:
-            val = request.form.get(col.name)
-            
-            if val == "" or val is None:
-                setattr(item, col.name, None)
-                continue
-
-            # --- THE FIX: Convert String to Date ---
-            if isinstance(col.type, Date):
-                try:
-                    # HTML <input type="date"> sends YYYY-MM-DD
-                    date_obj = datetime.strptime(val, '%Y-%m-%d').date()
-                    setattr(item, col.name, date_obj)
-                except ValueError:
-                    flash(f"Invalid date format for {col.name}")
-            else:
-                setattr(item, col.name, val)
-        
-        if not item_id:
-            db.session.add(item)
-            
-        db.session.commit()
-        flash(f"Item in {table_name} updated!")
-        return redirect(url_for('data_table_detail', table_name=table_name))
-
-    return render_template('admin/edit_item.html', table_name=table_name, item=item, columns=columns)
-
-@app.route('/admin/table/<table_name>/delete/<int:item_id>', methods=['POST'])
-@admin_required
-def delete_item(table_name, item_id):
-    model = MODEL_MAP.get(table_name)
-    item = model.query.get_or_404(item_id)
-    db.session.delete(item)
-    db.session.commit()
-    flash("Item deleted.")
-    return redirect(url_for('data_table_detail', table_name=table_name))
-
-@app.route('/admin/add-character', methods=['POST'])
-@admin_required
-def add_character():
-    name = request.form.get('name')
-    panel = request.form.get('page_id')
-
-    if not name or not panel:
-        flash("Name and panel are required!")
-        return redirect(request.referrer)
-
-    # check if character with same name exists
-    character = Character.query.filter_by(name=name).first()
-    page = Page.query.get(panel)
-
-    if not page:
-        flash("Invalid panel specified!")
-        return redirect(request.referrer)
-
-    character_exists = character is not None
-
-    if character_exists:
-        if character not in page.characters:
-            page.characters.append(character)
+# create_app() builds the Flask app from four blueprints:
+#   public_routes  the archive pages          api_routes     JSON endpoints
+#   admin_routes   admin pages and /metrics   import_routes  the game import
+# Heavy dependencies (BeautifulSoup, Pillow, numpy/scipy, b2sdk) are imported by
+# the views that need them, and compiled templates are cached in JINJA_CACHE_DIR,
+# so a worker boots on Flask and SQLAlchemy alone (see bench_startup.py).
+#
+# wsgi.py calls create_app(); scripts that do `from app import app` get a
+# shared instance, built the first time they ask for it.
+
+JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", os.path.join('instance', 'jinja_cache'))
+
+# Files, not pages: these skip the session-reading hooks, since touching the
+# session adds "Vary: Cookie" and a shared cache couldn't reuse the response
+STATIC_ENDPOINTS = ('static', 'asset')
+
+
+def create_app():
+    app = Flask(__name__)
+
+    # Get the database URL from environment variables (Render will provide this)
+    # If no URL is found, fall back to your local SQLite file
+    database_url = os.environ.get('DATABASE_URL')
+
+    if database_url:
+        # Fix for Render/Supabase: they often provide 'postgres://' 
+        # but SQLAlchemy 1.4+ requires 'postgresql://'
+        if database_url.startswith("postgres://"):
+            database_url = database_url.replace("postgres://", "postgresql://", 1)
+        app.config['SQLALCHEMY_DATABASE_URI'] = database_url
     else:
-        character = Character(name=name, image_url="")
-        db.session.add(character)
-
-        character.pages.append(page)
-
-    db.session.commit()
-
-    # Check if request is AJAX
-    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-        return jsonify({
-            "id": character.id,
-            "name": character.name,
-            "imgSrc": character.image_url if character_exists else None
-        })
-
-    return redirect(url_for('panel_detail', page_id=request.form.get('page_id')))
-
-@app.route('/admin/tag-character', methods=['POST'])
-@admin_required
-def tag_character():
-    page_id = request.form.get('page_id')
-    char_id = request.form.get('character_id')
-    
-    if not page_id or not char_id:
-        flash("Missing page or character ID!")
-        return redirect(request.referrer)
-
-    panel = Page.query.get(page_id)
-    character = Character.query.get(char_id)
-    
-    if panel and character and character not in panel.characters:
-        panel.characters.append(character)
-        db.session.commit()
-    
-        # Check if request is AJAX
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-            return jsonify({
-                "status": "success",
-                "id": character.id,
-                "name": character.name,
-                "imgSrc": character.image_url
-            })
-
-    return redirect(url_for('panel_detail', page_id=page_id))
-
-@app.route('/admin/untag-character', methods=['POST'])
-@admin_required
-def untag_character():
-    page_id = request.form.get('page_id')
-    char_id = request.form.get('character_id')
-    
-    panel = Page.query.get(page_id)
-    character = Character.query.get(char_id)
-    
-    if panel and character and character in panel.characters:
-        panel.characters.remove(character)
-        db.session.commit()
-        flash(f"Removed {character.name} from panel.")
-    
-    return redirect(url_for('panel_detail', page_id=page_id))
-
-@app.route('/admin/update-image/<string:model_type>/<int:item_id>', methods=['POST'])
-@admin_required
-def update_image(model_type, item_id):
-    # 1. Get the image from the form
-    image_file = request.files.get('new_image')
-    if not image_file:
-        flash("No image selected!")
-        return redirect(request.referrer)
-
-    # 2. Upload to Backblaze B2
-    # We convert the file to a base64-like string for our existing helper
-    # or modify upload_to_b2 to accept raw bytes
-
-    image_bytes = image_file.read()
-    b64_string = base64.b64encode(image_bytes).decode('utf-8')
-    new_url = upload_b64img_to_b2(b64_string, folder=model_type + 's') # Organize by model type in B2
-
-    # 3. Update the Database
-    if model_type == 'character':
-        item = Character.query.get_or_404(item_id)
-        item.image_url = new_url
-        redirect_url = url_for('character_detail', char_id=item_id)
-    elif model_type == 'game':
-        item = Game.query.get_or_404(item_id)
-        # We need a field to store an override image
-        # Let's call it override_image_url
-        item.override_image_url = new_url 
-        redirect_url = url_for('game_list')
-        
-    db.session.commit()
-    flash(f"Updated {model_type} image!")
-    return redirect(redirect_url)
-
-@app.route('/admin/edit-game-name/<int:game_id>', methods=['POST'])
-@admin_required
-def edit_game_name(game_id):
-    game = Game.query.get_or_404(game_id)
-    new_name = request.form.get('new_name')
-    
-    if new_name and new_name.strip():
-        game.title = new_name.strip()
-        db.session.commit()
-        flash("Game title updated!")
-    
-    return redirect(url_for('game_detail', game_id=game.id))
-
-@app.route('/admin/edit-game-video/<int:game_id>', methods=['POST'])
-@admin_required
-def edit_game_video(game_id):
-    game = Game.query.get_or_404(game_id)
-    new_video_link = request.form.get('video_link')
-    
-    game.video_link = new_video_link.strip() if new_video_link else None
-    db.session.commit()
-    flash("Game video link updated!")
-    
-    return redirect(url_for('game_detail', game_id=game.id))
-
-@app.route('/logout', methods=['POST'])
-def logout():
-    session.clear()
-    flash("Logged out successfully.")
-    return redirect(url_for('index'))
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///brokenpicturephone.db'
+
+    # Pool sizes, the background pool and the optional read replica (see db_routing.py)
+    db_routing.configure(app, app.config['SQLALCHEMY_DATABASE_URI'])
+
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-for-sessions')
+    app.config['MAX_CONTENT_LENGTH'] = 25 * 1024 * 1024  # 25 MB upload limit
+    db.init_app(app)
+
+    # Templates compile once per deploy rather than once per worker
+    os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+    app.before_request(start_request_timer)
+    app.before_request(start_profiling)
+    app.before_request(route_reads_to_replica)
+    app.after_request(save_profile)
+    app.after_request(record_request_metrics)
+    app.teardown_request(save_failed_profile)
+    app.teardown_request(record_failed_request_metrics)
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_time, app)
+
+    app.register_blueprint(public_routes.bp)
+    app.register_blueprint(api_routes.bp)
+    app.register_blueprint(admin_routes.bp)
+    app.register_blueprint(import_routes.bp)
+
+    # Fingerprinted static files from `python assets.py`, cached for good (see assets.py)
+    app.add_url_rule('/static/dist/<path:filename>', 'asset', assets.send_asset)
+    app.add_template_global(assets.asset_url, 'asset_url')
+
+    app.add_template_filter(img_filter, 'img')
+    app.context_processor(utility_processor)
+    return app
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `from app import app` builds the shared instance on first use
+    global _app
+    if name == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# SQLite (no DATABASE_URL): WAL, foreign keys etc. on every connection, see sqlite_mode.py
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        sqlite_mode.apply_pragmas(dbapi_connection)
+
+@event.listens_for(Engine, "begin")
+def begin_sqlite_transaction(conn):
+    if conn.dialect.name == 'sqlite':
+        conn.exec_driver_sql(sqlite_mode.begin_sql())
+
+# Request and template timings for /metrics (see metrics.py)
+def start_request_timer():
+    metrics.request_started()
+
+def record_request_metrics(response):
+    metrics.request_finished(request.endpoint, request.method, response.status_code)
+    return response
+
+def record_failed_request_metrics(exc):
+    # after_request is skipped when a view raises; counted as a 500 then
+    metrics.request_finished(request.endpoint, request.method, 500)
+
+def start_template_timer(sender, template, context, **extra):
+    metrics.template_started(template.name)
+
+def record_template_time(sender, template, context, **extra):
+    metrics.template_finished(template.name)
+
+# Sampling profiles of single requests, for admins (?_profile=1) or PROFILE_SAMPLE_RATE of traffic (see profiler.py)
+def start_profiling():
+    if request.endpoint in STATIC_ENDPOINTS:
+        return
+    if profiler.should_profile(session.get('is_admin'), request.args.get('_profile') or request.headers.get('X-Profile')):
+        profiler.start()
+
+def save_profile(response):
+    profile_id = profiler.finish(request.endpoint, request.method, request.full_path.rstrip('?'), response.status_code)
+    if profile_id:
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+def save_failed_profile(exc):
+    profiler.finish(request.endpoint, request.method, request.full_path.rstrip('?'), 500)
+
+def route_reads_to_replica():
+    # Visitors' page views can read from the replica; admins see the primary
+    if request.endpoint in STATIC_ENDPOINTS:
+        return
+    if request.method in ('GET', 'HEAD') and not session.get('is_admin') and not request.path.startswith('/admin'):
+        db_routing.use_replica(db)
+
+def img_filter(url):
+    return cached_url(url)
+
+def utility_processor():
+    return dict(getattr=getattr)
 
 @event.listens_for(Page, 'after_delete')
 def delete_page_file(mapper, connection, target):
     if target.type == 'image' and target.content_url:
-        # delete from b2 using the URL
-        delete_b2_file(target.content_url)
+        # Duplicate drawings share one file, so only delete it with the last panel using it
+        still_used = connection.execute(
+            select(func.count()).select_from(Page.__table__).where(Page.content_url == target.content_url)
+        ).scalar()
+        if not still_used:
+            # delete from b2 using the URL
+            delete_b2_file(target.content_url)
+
+        # SQLite doesn't enforce the cascade, so drop the fingerprint here
+        connection.execute(PanelFingerprint.__table__.delete().where(PanelFingerprint.page_id == target.id))
+        from panel_hash import panel_hashes
+        panel_hashes.remove(target.id)
 
 # We listen to the 'characters' attribute on the Page model
 @event.listens_for(Page.characters, 'append')
@@ -953,12 +191,107 @@ def set_initial_character_image(target_page, value_character, initiator):
         value_character.image_url = target_page.content_url
         # No need to commit here; SQLAlchemy handles it in the current transaction
 
-@app.context_processor
-def utility_processor():
-    return dict(getattr=getattr)
+# Keep the typeahead index in sync with character edits and tagging
+@event.listens_for(Page.characters, 'append')
+def index_tag_added(target_page, value_character, initiator):
+    import cooccurrence  # numpy/scipy, only once someone tags
+    character_index.bump(value_character.id, 1)
+    page_index.tag(target_page.id, value_character.id)
+    cooccurrence.mark_characters_dirty([value_character.id] + [c.id for c in target_page.characters])
+    archive_stats.mark_dirty(characters=[value_character.id])
+
+@event.listens_for(Page.characters, 'remove')
+def index_tag_removed(target_page, value_character, initiator):
+    import cooccurrence
+    character_index.bump(value_character.id, -1)
+    page_index.untag(target_page.id, value_character.id)
+    cooccurrence.mark_characters_dirty([value_character.id] + [c.id for c in target_page.characters])
+    archive_stats.mark_dirty(characters=[value_character.id])
+
+@event.listens_for(Character, 'after_insert')
+def index_new_character(mapper, connection, target):
+    # Pages appended before the first flush had no id to bump, so count them here
+    character_index.upsert(target.id, target.name, target.image_url,
+                           count=len(target.__dict__.get('pages') or []))
+
+@event.listens_for(Character, 'after_update')
+def index_character(mapper, connection, target):
+    character_index.upsert(target.id, target.name, target.image_url)
+
+@event.listens_for(Character, 'after_delete')
+def unindex_character(mapper, connection, target):
+    character_index.remove(target.id)
+    page_index.remove_character(target.id)
+
+@event.listens_for(Page, 'after_delete')
+def unindex_page(mapper, connection, target):
+    page_index.remove_page(target.id)
+
+# These can move panels between artist/date buckets; let the search index reload.
+# (Tagging marks a Page dirty too, so only column changes count.)
+@event.listens_for(Alias, 'after_update')
+@event.listens_for(Game, 'after_update')
+@event.listens_for(Page, 'after_update')
+def invalidate_page_index(mapper, connection, target):
+    if db.session.is_modified(target, include_collections=False):
+        page_index.invalidate()
+        game_summary.invalidate()
+
+@event.listens_for(Alias, 'after_delete')
+def invalidate_page_index_alias(mapper, connection, target):
+    page_index.invalidate()
+    game_summary.invalidate()
+
+# New or deleted panels change the per-game participant counts
+@event.listens_for(Page, 'after_insert')
+@event.listens_for(Page, 'after_delete')
+@event.listens_for(User, 'after_update')
+def invalidate_game_summary(mapper, connection, target):
+    game_summary.invalidate()
+
+# New, renamed or deleted names change the import author guesses (see alias_resolver.py)
+@event.listens_for(Alias, 'after_insert')
+@event.listens_for(Alias, 'after_update')
+@event.listens_for(Alias, 'after_delete')
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_alias_index(mapper, connection, target):
+    alias_index.invalidate()
+
+# Work out which /stats rollups a flush touches; archive_stats.flush_dirty() recounts them after commit
+@event.listens_for(db.session, 'before_flush')
+def mark_stats_dirty(session, flush_context, instances):
+    books, days, users, characters = set(), set(), set(), set()
+    with session.no_autoflush:
+        for obj in session.new:
+            if isinstance(obj, Page):
+                books.add(obj.book_id)
+        for obj in session.deleted:
+            if isinstance(obj, Page):
+                books.add(obj.book_id)
+                characters.update(c.id for c in obj.characters)
+            elif isinstance(obj, Book):
+                days.add(obj.game.date)
+            elif isinstance(obj, Game):
+                days.add(obj.date)
+            elif isinstance(obj, Alias):
+                users.add(obj.user_id)
+            elif isinstance(obj, Character):
+                characters.add(obj.id)
+        for obj in session.dirty:
+            state = sa_inspect(obj)
+            if isinstance(obj, Page) and any(state.attrs[k].history.has_changes() for k in ('book_id', 'alias_id', 'type')):
+                books.update(state.attrs.book_id.history.sum())
+            elif isinstance(obj, Game) and state.attrs.date.history.has_changes():
+                days.update(state.attrs.date.history.sum())
+            elif isinstance(obj, Alias) and state.attrs.user_id.history.has_changes():
+                users.update(state.attrs.user_id.history.sum())
+    archive_stats.mark_dirty(days=days, books=books - {None}, users=users, characters=characters)
 
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
         db.create_all()
 
-    app.run(debug=True, port=5001)
\ No newline at end of file
+    app.run(debug=True, port=5001)
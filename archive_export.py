@@ -0,0 +1,327 @@
+import argparse
+import hashlib
+import io
+import json
+import posixpath
+import sys
+import zipfile
+from datetime import date, datetime
+from sqlalchemy import insert, select, text
+from models import db, User, Alias, Game, Book, Page, Character, DailyChallenge, page_characters
+
+# Full archive export/import, for backups and moving between databases.
+#
+# The export is NDJSON: users, aliases and characters first, then one record per
+# game with its books, pages and tags nested inside, then the daily challenges.
+# The ZIP variant holds the same archive.ndjson plus, optionally, every image
+# under images/<sha1 of its url>. Rows are streamed with yield_per (server-side
+# cursors on Postgres) and written out as they're read, so memory use doesn't
+# depend on the size of the archive.
+#
+# Derived tables (fingerprints, neighbors, analytics) aren't exported; rebuild
+# them after importing with the backfill scripts.
+#
+#   python archive_export.py export backup.ndjson
+#   python archive_export.py export backup.zip --images
+#   python archive_export.py import backup.zip --images   # into an empty database
+
+FORMAT_VERSION = 1
+BATCH_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"Can't serialize {type(value).__name__}")
+
+
+def _line(record):
+    return (json.dumps(record, default=_json_default, separators=(',', ':')) + "\n").encode('utf-8')
+
+
+def _stream(statement):
+    return db.session.execute(statement.execution_options(yield_per=BATCH_SIZE))
+
+
+def image_path(url):
+    """Name of an image inside the ZIP. Derived from the URL alone so the importer can find it."""
+    ext = posixpath.splitext(url.split('?')[0])[1][:8]
+    return f"images/{hashlib.sha1(url.encode('utf-8')).hexdigest()}{ext}"
+
+
+# --- export ---
+
+def iter_records():
+    """Every record of the archive, in the order the importer needs them."""
+    yield {"type": "meta", "version": FORMAT_VERSION, "exported_at": datetime.utcnow()}
+
+    for row in _stream(select(User.id, User.true_name, User.description).order_by(User.id)):
+        yield {"type": "user", **row._asdict()}
+    for row in _stream(select(Alias.id, Alias.name, Alias.user_id).order_by(Alias.id)):
+        yield {"type": "alias", **row._asdict()}
+    for row in _stream(select(Character.id, Character.name, Character.description, Character.image_url)
+                       .order_by(Character.id)):
+        yield {"type": "character", **row._asdict()}
+
+    # Games, books, pages and tags in one ordered pass; a page appears once per tag
+    rows = _stream(
+        select(Game.id.label('game_id'), Game.date, Game.title, Game.override_image_url, Game.video_link,
+               Book.id.label('book_id'), Page.id, Page.sequence, Page.type, Page.alias_id, Page.content_text,
+               Page.content_url, page_characters.c.character_id)
+        .select_from(Game)
+        .outerjoin(Book, Book.game_id == Game.id)
+        .outerjoin(Page, Page.book_id == Book.id)
+        .outerjoin(page_characters, page_characters.c.page_id == Page.id)
+        .order_by(Game.id, Book.id, Page.sequence, Page.id)
+    )
+    game = book = page = None
+    for row in rows:
+        if game is None or game["id"] != row.game_id:
+            if game is not None:
+                yield game
+            game = {"type": "game", "id": row.game_id, "date": row.date, "title": row.title,
+                    "override_image_url": row.override_image_url, "video_link": row.video_link, "books": []}
+            book = page = None
+        if row.book_id is None:
+            continue
+        if book is None or book["id"] != row.book_id:
+            book = {"id": row.book_id, "pages": []}
+            game["books"].append(book)
+            page = None
+        if row.id is None:
+            continue
+        if page is None or page["id"] != row.id:
+            page = {"id": row.id, "sequence": row.sequence, "type": row.type, "alias_id": row.alias_id,
+                    "content_text": row.content_text, "content_url": row.content_url, "characters": []}
+            book["pages"].append(page)
+        if row.character_id is not None:
+            page["characters"].append(row.character_id)
+    if game is not None:
+        yield game
+
+    for row in _stream(select(DailyChallenge.id, DailyChallenge.date, DailyChallenge.page_id)
+                       .order_by(DailyChallenge.id)):
+        yield {"type": "daily", **row._asdict()}
+
+
+def iter_ndjson():
+    buffer = []
+    size = 0
+    for record in iter_records():
+        line = _line(record)
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _image_urls():
+    seen = set()
+    statements = [
+        select(Page.content_url).where(Page.type == 'image', Page.content_url.isnot(None)).order_by(Page.id),
+        select(Character.image_url).where(Character.image_url.isnot(None)).order_by(Character.id),
+        select(Game.override_image_url).where(Game.override_image_url.isnot(None)).order_by(Game.id),
+    ]
+    for statement in statements:
+        for (url,) in _stream(statement):
+            if url and url not in seen:
+                seen.add(url)
+                yield url
+
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file that collects what zipfile writes, so it can be streamed."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(include_images=False):
+    from b2blaze import open_file
+
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open('archive.ndjson', 'w', force_zip64=True) as entry:
+            for chunk in iter_ndjson():
+                entry.write(chunk)
+                yield sink.drain()
+
+        if include_images:
+            for url in _image_urls():
+                try:
+                    src = open_file(url)
+                    if src is None:
+                        continue  # not in our storage (placeholders etc.)
+                    # Images are already compressed, so store them as-is
+                    info = zipfile.ZipInfo(image_path(url), date_time=datetime.utcnow().timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    with src, zf.open(info, 'w', force_zip64=True) as entry:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            entry.write(chunk)
+                            yield sink.drain()
+                except Exception as e:
+                    print(f"Export: skipping image {url}: {e}")
+    yield sink.drain()
+
+
+# --- import ---
+
+class _Loader:
+    """Batches rows per table and inserts them with executemany."""
+
+    def __init__(self):
+        self.pending = {}
+        self.counts = {}
+
+    def add(self, table, row):
+        rows = self.pending.setdefault(table, [])
+        rows.append(row)
+        if len(rows) >= BATCH_SIZE:
+            self.flush(table)
+
+    def flush(self, table=None):
+        # Parents before children, so foreign keys are satisfied
+        order = [User.__table__, Alias.__table__, Character.__table__, Game.__table__, Book.__table__,
+                 Page.__table__, page_characters, DailyChallenge.__table__]
+        tables = order if table is None else order[:order.index(table) + 1]
+        for t in tables:
+            rows = self.pending.pop(t, None)
+            if rows:
+                db.session.execute(insert(t), rows)
+                self.counts[t.name] = self.counts.get(t.name, 0) + len(rows)
+
+
+def _reset_sequences():
+    # Explicit ids leave Postgres sequences behind; SQLite works it out itself
+    if db.engine.dialect.name != 'postgresql':
+        return
+    for table in (User.__table__, Alias.__table__, Character.__table__, Game.__table__, Book.__table__,
+                  Page.__table__, DailyChallenge.__table__):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM \"{table.name}\"), 1))"
+        ))
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def import_records(lines, rewrite_url=None):
+    """Load NDJSON lines (bytes or str) into an empty database. Returns row counts per table."""
+    if db.session.query(Game.id).first() is not None or db.session.query(User.id).first() is not None:
+        raise ValueError("The database already has data; import into an empty database")
+
+    def rewrite(url):
+        return rewrite_url(url) if rewrite_url and url else url
+
+    loader = _Loader()
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        kind = record.pop("type")
+
+        if kind == "meta":
+            if record.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported export version {record.get('version')}")
+        elif kind == "user":
+            loader.add(User.__table__, record)
+        elif kind == "alias":
+            loader.add(Alias.__table__, record)
+        elif kind == "character":
+            record["image_url"] = rewrite(record["image_url"])
+            loader.add(Character.__table__, record)
+        elif kind == "game":
+            books = record.pop("books")
+            record["date"] = _parse_date(record["date"])
+            record["override_image_url"] = rewrite(record["override_image_url"])
+            loader.add(Game.__table__, record)
+            for book in books:
+                loader.add(Book.__table__, {"id": book["id"], "game_id": record["id"]})
+                for page in book["pages"]:
+                    characters = page.pop("characters")
+                    page["book_id"] = book["id"]
+                    page["content_url"] = rewrite(page["content_url"])
+                    loader.add(Page.__table__, page)
+                    for char_id in characters:
+                        loader.add(page_characters, {"page_id": page["id"], "character_id": char_id})
+        elif kind == "daily":
+            record["date"] = _parse_date(record["date"])
+            loader.add(DailyChallenge.__table__, record)
+
+    loader.flush()
+    _reset_sequences()
+    db.session.commit()
+    return loader.counts
+
+
+def _upload_images(zf):
+    """Upload every image in the ZIP to the current storage. Returns {image path: new url}."""
+    from b2blaze import upload_file
+
+    uploaded = {}
+    for info in zf.infolist():
+        if info.filename.startswith('images/') and not info.is_dir():
+            with zf.open(info) as src:
+                uploaded[info.filename] = upload_file(src, folder='imported',
+                                                      ext=posixpath.splitext(info.filename)[1][1:] or None)
+    return uploaded
+
+
+def import_archive(path, include_images=False):
+    if not zipfile.is_zipfile(path):
+        with open(path, 'rb') as f:
+            return import_records(f)
+
+    with zipfile.ZipFile(path) as zf:
+        uploaded = _upload_images(zf) if include_images else {}
+        with zf.open('archive.ndjson') as f:
+            return import_records(f, rewrite_url=lambda url: uploaded.get(image_path(url), url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import the whole archive.")
+    parser.add_argument('action', choices=['export', 'import'])
+    parser.add_argument('path', help="file to write/read; .zip for a ZIP, anything else for NDJSON ('-' for stdout)")
+    parser.add_argument('--images', action='store_true', help="include (or re-upload) image files; ZIP only")
+    args = parser.parse_args()
+
+    from app import app
+
+    with app.app_context():
+        if args.action == 'export':
+            chunks = iter_zip(args.images) if args.path.endswith('.zip') else iter_ndjson()
+            out = sys.stdout.buffer if args.path == '-' else open(args.path, 'wb')
+            with out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            db.create_all()  # usually a fresh database
+            counts = import_archive(args.path, include_images=args.images)
+            for table, count in counts.items():
+                print(f"{table}: {count}")
+            print("Now rebuild derived data: panel_hash.py backfill, import_index.py, cooccurrence.py, chain_drift.py")
+
+
+if __name__ == "__main__":
+    main()
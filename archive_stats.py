@@ -0,0 +1,259 @@
+import threading
+from collections import defaultdict
+from sqlalchemy import delete, func, insert, select
+import sqlite_mode
+from models import (db, User, Alias, Game, Book, Page, Character, page_characters,
+                    DailyStat, UserDailyStat, CharacterStat, BookStat)
+
+# Archive-wide statistics for /stats, kept in small rollup tables:
+#   DailyStat      games, books, text and image pages per game day
+#   UserDailyStat  panels and captions per user per game day
+#   CharacterStat  appearances (and first/last day) per character
+#   BookStat       page count per book, for "longest books"
+#
+# Everything comes from one streaming pass over page/book/game/alias/tags
+# (_aggregate). Changes only redo the keys they touch: an import refreshes its
+# game's day, tagging refreshes the tagged characters, and a session listener in
+# app.py marks whatever edits and deletes affect (mark_dirty / flush_dirty).
+# Only writers flush: the import thread and the admin routes call flush_dirty()
+# after committing, and the first flush on an empty archive builds everything.
+# The /stats page itself only reads (it's served from the replica), so until
+# then it shows zeros.
+# Counting happens before the write lock is taken; only the delete and insert
+# of the affected rollup rows run inside sqlite_mode.serialized_writes().
+# Run `python archive_stats.py` to rebuild everything.
+
+TOP_ARTISTS = 8
+TOP_N = 10
+
+_dirty = {"days": set(), "books": set(), "users": set(), "characters": set()}
+_dirty_lock = threading.Lock()
+_built = False
+
+
+def _aggregate(*where):
+    """One pass over every page matching `where`; returns the rollups as dicts."""
+    days = defaultdict(lambda: {"games": set(), "books": set(), "text_pages": 0, "image_pages": 0})
+    user_days = defaultdict(lambda: {"panels": 0, "captions": 0})
+    books = {}
+    characters = {}
+
+    rows = db.session.execute(
+        select(Page.id, Page.type, Page.book_id, Book.game_id, Game.date, Alias.user_id,
+               page_characters.c.character_id)
+        .join(Book, Page.book_id == Book.id)
+        .join(Game, Book.game_id == Game.id)
+        .outerjoin(Alias, Page.alias_id == Alias.id)
+        .outerjoin(page_characters, page_characters.c.page_id == Page.id)
+        .where(*where)
+        .order_by(Page.id)
+        .execution_options(yield_per=5000)
+    )
+
+    last_page = None
+    for page_id, page_type, book_id, game_id, day, user_id, char_id in rows:
+        # A page comes back once per tag; count it once
+        if page_id != last_page:
+            last_page = page_id
+            d = days[day]
+            d["games"].add(game_id)
+            d["books"].add(book_id)
+            d["image_pages" if page_type == 'image' else "text_pages"] += 1
+            if user_id is not None:
+                user_days[user_id, day]["panels" if page_type == 'image' else "captions"] += 1
+            book = books.setdefault(book_id, {"game_id": game_id, "day": day, "pages": 0})
+            book["pages"] += 1
+
+        if char_id is not None and page_type == 'image':
+            c = characters.setdefault(char_id, {"appearances": 0, "first_day": day, "last_day": day})
+            c["appearances"] += 1
+            c["first_day"] = min(c["first_day"], day)
+            c["last_day"] = max(c["last_day"], day)
+
+    return days, user_days, books, characters
+
+
+def _write_days(days, user_days, books, keys=None):
+    """Replace the day-keyed rollups (all of them, or just these days)."""
+    for model in (DailyStat, UserDailyStat, BookStat):
+        statement = delete(model)
+        if keys is not None:
+            statement = statement.where(model.day.in_(keys))
+        db.session.execute(statement)
+
+    if days:
+        db.session.execute(insert(DailyStat), [
+            {"day": day, "games": len(d["games"]), "books": len(d["books"]),
+             "text_pages": d["text_pages"], "image_pages": d["image_pages"]}
+            for day, d in days.items()
+        ])
+    _write_user_days(user_days)
+    if books:
+        db.session.execute(insert(BookStat), [{"book_id": book_id, **b} for book_id, b in books.items()])
+
+
+def _write_user_days(user_days):
+    if user_days:
+        db.session.execute(insert(UserDailyStat), [
+            {"user_id": user_id, "day": day, **counts} for (user_id, day), counts in user_days.items()
+        ])
+
+
+def _write_characters(characters, keys=None):
+    statement = delete(CharacterStat)
+    if keys is not None:
+        statement = statement.where(CharacterStat.character_id.in_(keys))
+    db.session.execute(statement)
+    if characters:
+        db.session.execute(insert(CharacterStat), [
+            {"character_id": char_id, **c} for char_id, c in characters.items()
+        ])
+
+
+def rebuild():
+    global _built
+    days, user_days, books, characters = _aggregate()
+    with sqlite_mode.serialized_writes(db.session):
+        _write_days(days, user_days, books)
+        _write_characters(characters)
+        db.session.commit()
+    _built = True
+
+
+def refresh_days(day_keys):
+    """Recount everything for these game days (after an import, a date change, deletes)."""
+    day_keys = [d for d in set(day_keys) if d is not None]
+    if not day_keys:
+        return
+    days, user_days, books, _ = _aggregate(Game.date.in_(day_keys))
+    with sqlite_mode.serialized_writes(db.session):
+        _write_days(days, user_days, books, keys=day_keys)
+        db.session.commit()
+
+
+def refresh_users(user_ids):
+    """Recount these users on every day (after aliases are reassigned)."""
+    user_ids = [u for u in set(user_ids) if u is not None]
+    if not user_ids:
+        return
+    _, user_days, _, _ = _aggregate(Alias.user_id.in_(user_ids))
+    with sqlite_mode.serialized_writes(db.session):
+        db.session.execute(delete(UserDailyStat).where(UserDailyStat.user_id.in_(user_ids)))
+        _write_user_days(user_days)
+        db.session.commit()
+
+
+def refresh_characters(char_ids):
+    """Recount these characters (after tagging)."""
+    char_ids = [c for c in set(char_ids) if c is not None]
+    if not char_ids:
+        return
+    _, _, _, characters = _aggregate(page_characters.c.character_id.in_(char_ids))
+    with sqlite_mode.serialized_writes(db.session):
+        _write_characters(characters, keys=char_ids)
+        db.session.commit()
+
+
+def mark_dirty(days=(), books=(), users=(), characters=()):
+    with _dirty_lock:
+        _dirty["days"].update(days)
+        _dirty["books"].update(books)
+        _dirty["users"].update(users)
+        _dirty["characters"].update(characters)
+
+
+def flush_dirty():
+    """Refresh everything marked since the last call. Call after committing."""
+    # Partial refreshes on empty tables would look like a finished build
+    _ensure_built()
+    with _dirty_lock:
+        days, books, users, characters = (set(_dirty[k]) for k in ("days", "books", "users", "characters"))
+        for keys in _dirty.values():
+            keys.clear()
+    if books:
+        days.update(d for (d,) in db.session.query(Game.date).join(Book, Book.game_id == Game.id)
+                    .filter(Book.id.in_(books)).distinct())
+    refresh_days(days)
+    refresh_users(users)
+    refresh_characters(characters)
+
+
+def _ensure_built():
+    global _built
+    if _built:
+        return
+    if db.session.query(DailyStat.day).first() is None and db.session.query(Page.id).first() is not None:
+        rebuild()
+    _built = True
+
+
+# --- reads for the dashboard ---
+
+def dashboard():
+    # Per-day totals: one row per game day, so this stays small
+    games_per_month = defaultdict(int)
+    totals = {"games": 0, "books": 0, "text_pages": 0, "image_pages": 0}
+    for row in db.session.query(DailyStat).order_by(DailyStat.day):
+        games_per_month[row.day.strftime('%Y-%m')] += row.games
+        for key in totals:
+            totals[key] += getattr(row, key)
+
+    top_artists = db.session.query(User.id, User.true_name, func.sum(UserDailyStat.panels).label('panels')) \
+        .join(UserDailyStat, UserDailyStat.user_id == User.id) \
+        .group_by(User.id, User.true_name) \
+        .order_by(func.sum(UserDailyStat.panels).desc()) \
+        .limit(TOP_ARTISTS) \
+        .all()
+
+    artist_years = defaultdict(lambda: defaultdict(int))
+    years = set()
+    if top_artists:
+        for user_id, day, panels in db.session.query(UserDailyStat.user_id, UserDailyStat.day, UserDailyStat.panels) \
+                .filter(UserDailyStat.user_id.in_([a.id for a in top_artists])):
+            artist_years[user_id][day.year] += panels
+            years.add(day.year)
+    years = sorted(years)
+
+    top_characters = db.session.query(Character.id, Character.name, Character.image_url,
+                                      CharacterStat.appearances, CharacterStat.first_day, CharacterStat.last_day) \
+        .join(CharacterStat, CharacterStat.character_id == Character.id) \
+        .filter(CharacterStat.appearances > 0) \
+        .order_by(CharacterStat.appearances.desc(), Character.id) \
+        .limit(TOP_N) \
+        .all()
+
+    longest = db.session.query(BookStat.book_id, BookStat.game_id, BookStat.day, BookStat.pages) \
+        .order_by(BookStat.pages.desc(), BookStat.book_id) \
+        .limit(TOP_N) \
+        .all()
+    prompts = {}
+    if longest:
+        for book_id, text in db.session.query(Page.book_id, Page.content_text) \
+                .filter(Page.book_id.in_([b.book_id for b in longest]), Page.type == 'text') \
+                .order_by(Page.book_id, Page.sequence):
+            prompts.setdefault(book_id, text)
+
+    return {
+        "totals": totals,
+        "games_per_month": dict(games_per_month),
+        "years": years,
+        "artists": [
+            {"id": a.id, "name": a.true_name, "panels": int(a.panels or 0),
+             "per_year": [artist_years[a.id].get(y, 0) for y in years]}
+            for a in top_artists
+        ],
+        "characters": top_characters,
+        "longest_books": [
+            {"id": b.book_id, "game_id": b.game_id, "day": b.day, "pages": b.pages, "prompt": prompts.get(b.book_id)}
+            for b in longest
+        ],
+    }
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        rebuild()
+        print(f"Rolled up {DailyStat.query.count()} days, {UserDailyStat.query.count()} user-days, "
+              f"{CharacterStat.query.count()} characters, {BookStat.query.count()} books.")
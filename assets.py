@@ -0,0 +1,175 @@
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.security import safe_join
+
+# Fingerprinted, precompressed static files.
+#
+# `python assets.py` copies everything under static/ into static/dist/ with a
+# content hash in the name (js/daily.js -> js/daily.3f9a0c1b2d.js), writes
+# .gz and .br next to the text files, and records the names in
+# static/dist/manifest.json. It needs nothing but the files on disk, so it can
+# run in the Docker build. Templates link files with asset_url('js/daily.js'),
+# which looks the hashed name up in the manifest, or falls back to the plain
+# /static/ URL if assets haven't been built (or in debug mode, so edits show up
+# without a rebuild).
+#
+# A hashed name never changes content, so /static/dist/ is served with
+# "Cache-Control: public, max-age=31536000, immutable" and the browser never
+# asks again; a new deploy links new names. The app sends the .br or .gz
+# variant itself when the browser accepts it; behind nginx it can be served
+# without touching gunicorn:
+#
+#   location /static/dist/ {
+#       alias /srv/app/static/dist/;
+#       gzip_static on;
+#       brotli_static on;  # with ngx_brotli
+#       add_header Cache-Control "public, max-age=31536000, immutable";
+#   }
+#
+# .br needs the `brotli` package (in requirements.txt); without it only .gz is written.
+# Old hashed files are kept (pages cached before a deploy still point at them)
+# until `python assets.py --clean`.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+HASH_LENGTH = 10
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.map')
+MIN_COMPRESS_BYTES = 256  # smaller files aren't worth a second request header
+
+_manifest = None
+
+
+# --- build ---
+
+def _sources():
+    for dirpath, dirnames, filenames in os.walk(STATIC_DIR):
+        if os.path.abspath(dirpath) == STATIC_DIR:
+            dirnames[:] = [d for d in dirnames if d != 'dist']
+        for name in filenames:
+            if not name.startswith('.'):
+                path = os.path.join(dirpath, name)
+                yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path
+
+
+def _hashed_name(name, data):
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest}{ext}"
+
+
+def _write(path, data):
+    if os.path.exists(path):
+        return False  # same name means same content
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def build(clean=False):
+    """Write the hashed files, their .gz/.br variants and the manifest; returns the manifest."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    manifest = {}
+    written = 0
+    for name, path in sorted(_sources()):
+        with open(path, 'rb') as f:
+            data = f.read()
+        hashed = manifest[name] = _hashed_name(name, data)
+        target = os.path.join(DIST_DIR, hashed)
+        written += _write(target, data)
+        if name.endswith(COMPRESSIBLE) and len(data) >= MIN_COMPRESS_BYTES:
+            # mtime=0 so the same input always gives the same .gz
+            _write(target + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli:
+                _write(target + '.br', brotli.compress(data, quality=11))
+
+    os.makedirs(DIST_DIR, exist_ok=True)
+    tmp_path = MANIFEST + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST)
+
+    if clean:
+        keep = set(manifest.values())
+        for name, path in list(_dist_files()):
+            base = name[:-3] if name.endswith(('.gz', '.br')) else name
+            if base not in keep and name != 'manifest.json':
+                os.remove(path)
+
+    print(f"{len(manifest)} assets, {written} new{'' if brotli else ' (no brotli: .gz only)'}")
+    return manifest
+
+
+def _dist_files():
+    for dirpath, dirnames, filenames in os.walk(DIST_DIR):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            yield os.path.relpath(path, DIST_DIR).replace(os.sep, '/'), path
+
+
+# --- serving ---
+
+def manifest():
+    """Logical name -> hashed name, read once per process ({} if assets aren't built)."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST) as f:
+                _manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(filename, **kwargs):
+    """url_for('static', filename=...) for templates, pointing at the fingerprinted copy when there is one."""
+    hashed = None if current_app.debug else manifest().get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename, **kwargs)
+    return url_for('asset', filename=hashed, **kwargs)
+
+
+def send_asset(filename):
+    # Same file, smaller: pick the precompressed variant the browser can take
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = None
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        path = safe_join(DIST_DIR, filename + suffix)
+        if request.accept_encodings[encoding] and path and os.path.isfile(path):
+            response = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static/ into static/dist/.")
+    parser.add_argument('--clean', action='store_true', help="remove hashed files the new manifest doesn't use")
+    parser.add_argument('--force', action='store_true', help="rebuild static/dist/ from scratch")
+    args = parser.parse_args()
+    if args.force:
+        shutil.rmtree(DIST_DIR, ignore_errors=True)
+    build(clean=args.clean)
+
+
+if __name__ == "__main__":
+    main()
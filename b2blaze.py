@@ -1,8 +1,12 @@
-import base64
-import uuid
-from b2sdk.v2 import InMemoryAccountInfo, B2Api
+import mimetypes
 import os
+import shutil
+import tempfile
+import threading
+import urllib.request
+import uuid
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()  # Load environment variables from .env file
 
@@ -12,43 +16,220 @@ B2_APPLICATION_KEY = os.getenv("B2_APPLICATION_KEY", "your_application_key")
 B2_BUCKET_NAME = os.getenv("B2_BUCKET_NAME", "your_bucket_name")
 IMAGE_SERVER_URL = os.getenv("IMAGE_SERVER_URL", "https://images.freefnafgamesbecauseipiratedthem.com")
 
-info = InMemoryAccountInfo()
-b2_api = B2Api(info)
-b2_api.authorize_account("production", B2_KEY_ID, B2_APPLICATION_KEY)
-bucket = b2_api.get_bucket_by_name(B2_BUCKET_NAME)
-
-def upload_b64img_to_b2(base64_str, folder="panels"):
-    if "base64," in base64_str:
-        base64_str = base64_str.split("base64,")[1]
-    
-    image_data = base64.b64decode(base64_str)
-    filename = f"{folder}/{uuid.uuid4()}.png"
-    
-    # Upload to B2
-    file_info = bucket.upload_bytes(image_data, filename)
-    
-    # Construct the public URL
-    # Format: https://f005.backblazeb2.com/file/BUCKET_NAME/FILENAME
-    # Note: Check your B2 bucket settings to find your specific "Friendly URL" endpoint
-    # public_url = f"https://f005.backblazeb2.com/file/{B2_BUCKET_NAME}/{filename}"
-
-    # we use cloudflare to serve the files, so the url is different
-    public_url = f"{IMAGE_SERVER_URL}/file/{B2_BUCKET_NAME}/{filename}"
-
-    return public_url
+# "b2" (default) or "local". The local backend keeps files on disk and app.py
+# serves them under LOCAL_STORAGE_URL, so development doesn't need B2 credentials.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "b2").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join('instance', 'uploads'))
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/uploads")
+
+# Files bigger than this are streamed to B2 as a multipart upload instead of
+# being read into memory in one piece
+MULTIPART_THRESHOLD = int(os.getenv("B2_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+
+CHUNK_SIZE = 1024 * 1024
+
+# Magic bytes -> MIME type, for uploads that don't say what they are
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/gif": "gif", "image/webp": "webp"}
+
+
+def sniff_content_type(head):
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def _stream_size(fileobj):
+    """Bytes left in a seekable file, or None if it can't seek."""
+    try:
+        position = fileobj.tell()
+        end = fileobj.seek(0, os.SEEK_END)
+        fileobj.seek(position)
+        return end - position
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _peek(fileobj, size=16):
+    try:
+        position = fileobj.tell()
+        head = fileobj.read(size)
+        fileobj.seek(position)
+        return head
+    except (AttributeError, OSError, ValueError):
+        return b""
+
+
+class B2Storage:
+    def __init__(self):
+        from b2sdk.v2 import InMemoryAccountInfo, B2Api
+
+        info = InMemoryAccountInfo()
+        self.api = B2Api(info)
+        self.api.authorize_account("production", B2_KEY_ID, B2_APPLICATION_KEY)
+        self.bucket = self.api.get_bucket_by_name(B2_BUCKET_NAME)
+
+    def url(self, filename):
+        # Note: Check your B2 bucket settings to find your specific "Friendly URL" endpoint
+        # public_url = f"https://f005.backblazeb2.com/file/{B2_BUCKET_NAME}/{filename}"
+        # we use cloudflare to serve the files, so the url is different
+        return f"{IMAGE_SERVER_URL}/file/{B2_BUCKET_NAME}/{filename}"
+
+    def filename_from_url(self, file_url):
+        # Assuming file_url is in the format: https://f005.backblazeb2.com/file/BUCKET_NAME/FILENAME
+        parts = file_url.split('/')
+        if len(parts) < 6 or parts[4] != B2_BUCKET_NAME:
+            return None  # Invalid URL format, or not our bucket
+        return '/'.join(parts[5:])  # Get everything after the bucket name
+
+    def put(self, data, filename, content_type):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.bucket.upload_bytes(bytes(data), filename, content_type=content_type)
+            return
+
+        size = _stream_size(data)
+        if size is not None and size <= MULTIPART_THRESHOLD:
+            self.bucket.upload_bytes(data.read(), filename, content_type=content_type)
+        else:
+            # Reads the stream part by part, uploading each as it fills
+            self.bucket.upload_unbound_stream(data, filename, content_type=content_type)
+
+    def replace(self, filename, data, content_type):
+        # Upload a new version under the same name (so the URL doesn't change),
+        # then delete the old versions to actually free the storage
+        old_versions = list(self.bucket.list_file_versions(filename))
+        self.put(data, filename, content_type)
+        for version in old_versions:
+            self.bucket.delete_file_version(version.id_, filename)
+
+    def delete(self, filename):
+        file_info = self.bucket.get_file_info_by_name(filename)
+        self.bucket.delete_file_version(file_info.id_, filename)
+
+    def open(self, filename, timeout=60):
+        return urllib.request.urlopen(self.url(filename), timeout=timeout)
+
+
+class LocalStorage:
+    def __init__(self, root=LOCAL_STORAGE_DIR, base_url=LOCAL_STORAGE_URL):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+
+    def _path(self, filename):
+        path = os.path.abspath(os.path.join(self.root, filename))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Refusing to touch {filename!r} outside the storage root")
+        return path
+
+    def url(self, filename):
+        return f"{self.base_url}/{filename}"
+
+    def filename_from_url(self, file_url):
+        prefix = self.base_url + '/'
+        if not file_url.startswith(prefix):
+            return None
+        return file_url[len(prefix):]
+
+    def put(self, data, filename, content_type):
+        path = self._path(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    out.write(data)
+                else:
+                    shutil.copyfileobj(data, out, CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def replace(self, filename, data, content_type):
+        self.put(data, filename, content_type)
+
+    def delete(self, filename):
+        os.remove(self._path(filename))
+
+    def open(self, filename, timeout=None):
+        return open(self._path(filename), 'rb')
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """The configured backend, created on first use (B2 authenticates over the network)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = LocalStorage() if STORAGE_BACKEND == "local" else B2Storage()
+    return _storage
+
+
+def upload_file(data, folder="panels", ext=None, content_type=None):
+    """
+    Store bytes or a file-like object under a fresh name and return its public URL.
+    The content type is sniffed from the data when not given, and the extension
+    follows the content type.
+    """
+    if content_type is None:
+        head = bytes(data[:16]) if isinstance(data, (bytes, bytearray, memoryview)) else _peek(data)
+        content_type = sniff_content_type(head)
+    if content_type is None and ext:
+        content_type = mimetypes.guess_type(f"file.{ext}")[0]
+    content_type = content_type or "application/octet-stream"
+    ext = ext or EXTENSIONS.get(content_type, "bin")
+
+    filename = f"{folder}/{uuid.uuid4()}.{ext}"
+    size = len(data) if isinstance(data, (bytes, bytearray, memoryview)) else _stream_size(data)
+    with metrics.track_storage('upload', size):
+        get_storage().put(data, filename, content_type)
+    return get_storage().url(filename)
+
+
+def filename_from_url(file_url):
+    return get_storage().filename_from_url(file_url)
+
+
+def open_file(file_url):
+    """Readable file object for a stored file, or None if the URL isn't ours."""
+    filename = filename_from_url(file_url)
+    return get_storage().open(filename) if filename else None
+
+
+def replace_b2_file(file_url, data, content_type="image/png"):
+    filename = filename_from_url(file_url)
+    if not filename:
+        return False
+    try:
+        with metrics.track_storage('replace', len(data) if isinstance(data, (bytes, bytearray, memoryview)) else None):
+            get_storage().replace(filename, data, content_type)
+        return True
+    except Exception as e:
+        print(f"Error replacing stored file: {e}")
+        return False
+
 
 def delete_b2_file(file_url):
-    # Extract the filename from the URL
-    # Assuming file_url is in the format: https://f005.backblazeb2.com/file/BUCKET_NAME/FILENAME
-    parts = file_url.split('/')
-    if len(parts) < 5:
+    filename = filename_from_url(file_url)
+    if not filename:
         return False  # Invalid URL format
-    
-    filename = '/'.join(parts[5:])  # Get everything after the bucket name
     try:
-        file_info = bucket.get_file_info_by_name(filename)
-        bucket.delete_file_version(file_info.id_, filename)
+        with metrics.track_storage('delete'):
+            get_storage().delete(filename)
         return True
     except Exception as e:
-        print(f"Error deleting file from B2: {e}")
-        return False    
+        print(f"Error deleting stored file: {e}")
+        return False
@@ -0,0 +1,244 @@
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from sqlalchemy import event, func
+
+# Per-route benchmark through the Flask test client: latency, SQL queries and
+# peak Python memory for every route in app.py, against whatever database
+# DATABASE_URL points at (use synth_archive.py for a realistic one).
+#
+#   python bench_routes.py --save before.json
+#   ... change things ...
+#   python bench_routes.py --compare before.json      # exits 1 on regressions
+#
+# Each URL gets one cold request (caches and in-memory indexes warming up),
+# then --repeat timed ones, then one more under tracemalloc for memory. GET
+# routes use ids picked from the database (the busiest user and character, a
+# mid-sized book, ...). The POST routes that can be undone (tag/untag, renaming
+# a game to its own name) run too; the rest are listed as skipped.
+
+# Regression thresholds for --compare
+SLOWER = 1.25            # p50 latency ratio...
+SLOWER_MIN_MS = 2.0      # ...and at least this many ms slower
+MORE_MEMORY = 1.25
+MORE_MEMORY_MIN_KB = 256
+
+SKIPPED = {
+    'static': "static files",
+    'asset': "static files",
+    'public.local_upload': "serves stored files",
+    'public.cached_image': "fetches from the image origin",
+    'admin.admin_auth': "logs in",
+    'admin.logout': "logs out",
+    'import.import_step1': "needs an uploaded export (see load_test.py --import)",
+    'import.import_step2': "needs an uploaded export (see load_test.py --import)",
+    'admin.add_admin_key': "creates rows",
+    'admin.add_character': "creates rows",
+    'admin.delete_item': "deletes rows",
+    'admin.update_image': "uploads files",
+}
+
+
+def _sample_ids():
+    from models import db, Alias, Game, Book, Page, Character, page_characters
+
+    def median_id(column):
+        count = db.session.query(func.count(column)).scalar()
+        return db.session.query(column).order_by(column).offset(count // 2).limit(1).scalar() if count else None
+
+    busiest_user = db.session.query(Alias.user_id).join(Page, Page.alias_id == Alias.id) \
+        .filter(Alias.user_id.isnot(None)).group_by(Alias.user_id) \
+        .order_by(func.count(Page.id).desc()).limit(1).scalar()
+    busiest_character = db.session.query(page_characters.c.character_id) \
+        .group_by(page_characters.c.character_id) \
+        .order_by(func.count().desc()).limit(1).scalar()
+    panel = db.session.query(Page.id).filter(Page.type == 'image').order_by(Page.id) \
+        .offset(db.session.query(func.count(Page.id)).filter(Page.type == 'image').scalar() // 2).limit(1).scalar()
+    game = median_id(Game.id)
+    char_id = busiest_character or median_id(Character.id)
+    tagged = db.session.query(page_characters).filter_by(page_id=panel, character_id=char_id).first() is not None
+    return {
+        "page_id": panel,
+        "item_id": panel,
+        "book_id": median_id(Book.id),
+        "game_id": game,
+        "user_id": busiest_user,
+        "char_id": char_id,
+        "tagged": tagged,
+        "date_str": str(db.session.get(Game, game).date) if game else '2024-01-01',
+        "kind": 'panels',
+        "table_name": 'pages',
+        "model_type": 'character',
+    }
+
+
+def build_cases(app):
+    """[(label, method, url, form)] for every route, plus {rule: reason} for skipped ones."""
+    from flask import url_for
+    from models import db, Game
+
+    with app.app_context():
+        ids = _sample_ids()
+        game = db.session.get(Game, ids["game_id"]) if ids["game_id"] else None
+
+    cases, skipped = [], {}
+    with app.test_request_context():
+        for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+            if rule.endpoint in SKIPPED:
+                if rule.endpoint not in ('static', 'asset'):
+                    skipped[rule.rule] = SKIPPED[rule.endpoint]
+                continue
+            if 'GET' not in rule.methods:
+                continue  # the undoable POSTs are added below
+            values = {arg: ids.get(arg) for arg in rule.arguments}
+            if None in values.values():
+                skipped[rule.rule] = "no sample row in this database"
+                continue
+            cases.append((rule.rule, 'GET', url_for(rule.endpoint, **values), None))
+
+        # Routes with the query strings people actually use
+        cases += [
+            ('/search?q=', 'GET', '/search?q=cat', None),
+            ('/advanced-search?...', 'GET', f"/advanced-search?whitelist_characters={ids['char_id']}", None),
+            ('/user/<id>?page=', 'GET', f"/user/{ids['user_id']}?page=5", None),
+            ('/api/v1/books?include=', 'GET', '/api/v1/books?include=users,characters&limit=20', None),
+        ]
+
+        # POSTs that leave the database as they found it
+        if ids["page_id"] and ids["char_id"]:
+            tag = {"page_id": ids["page_id"], "character_id": ids["char_id"]}
+            pair = [('/admin/tag-character', 'POST', '/admin/tag-character', tag),
+                    ('/admin/untag-character', 'POST', '/admin/untag-character', tag)]
+            cases += pair[::-1] if ids["tagged"] else pair
+        if game:
+            cases.append(('/admin/edit-game-name/<int:game_id>', 'POST', f'/admin/edit-game-name/{game.id}',
+                          {"new_name": game.title or ''}))
+            cases.append(('/admin/edit-game-video/<int:game_id>', 'POST', f'/admin/edit-game-video/{game.id}',
+                          {"video_link": game.video_link or ''}))
+    return cases, skipped
+
+
+class QueryCounter:
+    def __init__(self, engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def run(repeat=20, only=None):
+    from app import app
+    from models import db
+
+    cases, skipped = build_cases(app)
+    if only:
+        cases = [c for c in cases if only in c[0] or only in c[2]]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['is_admin'] = True
+    with app.app_context():
+        counter = QueryCounter(db.engines.values())
+
+    def request(method, url, form):
+        if method == 'GET':
+            response = client.get(url)
+        else:
+            response = client.post(url, data=form)
+        response.get_data()  # drain streamed responses
+        return response.status_code
+
+    results = {}
+    for label, method, url, form in cases:
+        started = time.perf_counter()
+        status = request(method, url, form)
+        cold = time.perf_counter() - started
+
+        timings, queries = [], []
+        for _ in range(repeat):
+            counter.count = 0
+            started = time.perf_counter()
+            request(method, url, form)
+            timings.append(time.perf_counter() - started)
+            queries.append(counter.count)
+
+        tracemalloc.start()
+        request(method, url, form)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        timings.sort()
+        results[label] = {
+            "url": url,
+            "status": status,
+            "cold_ms": cold * 1000,
+            "p50_ms": statistics.median(timings) * 1000,
+            "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+            "queries": max(queries),
+            "peak_kb": peak / 1024,
+        }
+        r = results[label]
+        print(f"{label[:44]:44} {status:4} {r['cold_ms']:9.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} "
+              f"{r['queries']:6} {r['peak_kb']:9.0f}", flush=True)
+
+    return results, skipped
+
+
+def compare(results, baseline):
+    """Print the changes against a saved run; returns the labels that regressed."""
+    regressions = []
+    print(f"\n{'route':44} {'p50 ms':>17} {'queries':>11} {'peak KB':>16}")
+    for label, r in results.items():
+        old = baseline.get(label)
+        if not old:
+            print(f"{label[:44]:44} (new)")
+            continue
+        flags = []
+        if r["p50_ms"] > old["p50_ms"] * SLOWER and r["p50_ms"] - old["p50_ms"] > SLOWER_MIN_MS:
+            flags.append("slower")
+        if r["queries"] > old["queries"]:
+            flags.append("more queries")
+        if r["peak_kb"] > old["peak_kb"] * MORE_MEMORY and r["peak_kb"] - old["peak_kb"] > MORE_MEMORY_MIN_KB:
+            flags.append("more memory")
+        if r["status"] != old["status"]:
+            flags.append(f"status {old['status']} -> {r['status']}")
+        if flags:
+            regressions.append(label)
+        print(f"{label[:44]:44} {old['p50_ms']:7.1f} -> {r['p50_ms']:6.1f} {old['queries']:4} -> {r['queries']:4} "
+              f"{old['peak_kb']:6.0f} -> {r['peak_kb']:6.0f}  {', '.join(flags)}")
+    for label in baseline.keys() - results.keys():
+        print(f"{label[:44]:44} (gone)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every route through the test client.")
+    parser.add_argument('--repeat', type=int, default=20, help="timed requests per route")
+    parser.add_argument('--only', help="only routes whose rule or URL contains this")
+    parser.add_argument('--save', help="write the results as JSON")
+    parser.add_argument('--compare', help="compare with a saved run; exit 1 on regressions")
+    args = parser.parse_args()
+
+    print(f"{'route':44} {'HTTP':>4} {'cold ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'SQL':>6} {'peak KB':>9}")
+    results, skipped = run(args.repeat, args.only)
+    for rule, reason in sorted(skipped.items()):
+        print(f"skipped {rule}: {reason}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"\n{len(regressions)} route(s) regressed")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import sqlite_mode
+
+# Concurrent read/write benchmark for the SQLite mode (see sqlite_mode.py).
+#
+# Copies the database, then runs N reader processes (like gunicorn workers
+# rendering book pages) against one writer process (like the import thread,
+# inserting books of PAGES_PER_BOOK pages and deleting them again) for a fixed
+# time. Reports latency percentiles and "database is locked" errors for both.
+#
+#   python bench_sqlite.py --db instance/brokenpicturephone.db --readers 8 --seconds 20
+#   python bench_sqlite.py --db instance/brokenpicturephone.db --baseline   # rollback journal, no pragmas
+
+PAGES_PER_BOOK = 20
+
+READ_QUERIES = [
+    # book_detail
+    """SELECT p.id, p.sequence, p.type, p.content_text, p.content_url, a.name, a.user_id
+       FROM page p LEFT JOIN alias a ON a.id = p.alias_id
+       WHERE p.book_id = ? ORDER BY p.sequence""",
+    # a user's panel count
+    """SELECT COUNT(*) FROM page p JOIN alias a ON a.id = p.alias_id
+       WHERE a.user_id = (SELECT a2.user_id FROM page p2 JOIN alias a2 ON a2.id = p2.alias_id
+                          WHERE p2.book_id = ? LIMIT 1) AND p.type = 'image'""",
+]
+
+
+def _connect(path, baseline):
+    if baseline:
+        return sqlite3.connect(path)  # the sqlite3 module's defaults: 5 s timeout, implicit BEGIN
+    conn = sqlite3.connect(path)
+    sqlite_mode.apply_pragmas(conn)
+    return conn
+
+
+def _reader(path, baseline, seconds, book_ids, results):
+    conn = _connect(path, baseline)
+    rng = random.Random(os.getpid())
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        book_id = rng.choice(book_ids)
+        start = time.perf_counter()
+        try:
+            for query in READ_QUERIES:
+                conn.execute(query, (book_id,)).fetchall()
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    results.put(("read", latencies, errors))
+
+
+def _writer(path, baseline, seconds, game_ids, alias_ids, results):
+    conn = _connect(path, baseline)
+    rng = random.Random(0)
+    latencies, errors = [], 0
+    written = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if not baseline:
+                conn.execute("BEGIN IMMEDIATE")  # what serialized_writes() does for the import thread
+            if written and rng.random() < 0.5:
+                book_id = written.pop()
+                conn.execute("DELETE FROM page WHERE book_id = ?", (book_id,))
+                conn.execute("DELETE FROM book WHERE id = ?", (book_id,))
+            else:
+                book_id = conn.execute("INSERT INTO book (game_id) VALUES (?)", (rng.choice(game_ids),)).lastrowid
+                conn.executemany(
+                    "INSERT INTO page (book_id, alias_id, sequence, type, content_text, content_url) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(book_id, rng.choice(alias_ids), n, 'text' if n % 2 else 'image',
+                      f"bench caption {n}" if n % 2 else None, None if n % 2 else f"/bench/{book_id}/{n}.png")
+                     for n in range(1, PAGES_PER_BOOK + 1)]
+                )
+                written.append(book_id)
+            conn.commit()
+            latencies.append(time.perf_counter() - start)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+    conn.close()
+    results.put(("write", latencies, errors))
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(db_path, readers=4, seconds=10, baseline=False):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(path)
+        src.backup(dst)
+        src.close()
+        dst.execute(f"PRAGMA journal_mode={'DELETE' if baseline else 'WAL'}")
+        book_ids = [r[0] for r in dst.execute("SELECT id FROM book")]
+        game_ids = [r[0] for r in dst.execute("SELECT id FROM game")]
+        alias_ids = [r[0] for r in dst.execute("SELECT id FROM alias")]
+        dst.close()
+        if not book_ids or not alias_ids:
+            raise SystemExit("The database has no books to read; seed or import something first")
+
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_reader, args=(path, baseline, seconds, book_ids, results))
+                 for _ in range(readers)]
+        procs.append(multiprocessing.Process(target=_writer,
+                                             args=(path, baseline, seconds, game_ids, alias_ids, results)))
+        for p in procs:
+            p.start()
+        collected = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    print(f"{'baseline (rollback journal)' if baseline else 'WAL + pragmas'}: "
+          f"{readers} readers, 1 writer, {seconds}s")
+    for kind in ("read", "write"):
+        latencies = [v for k, values, _ in collected if k == kind for v in values]
+        errors = sum(e for k, _, e in collected if k == kind)
+        print(f"  {kind:5}  {len(latencies) / seconds:9.1f} ops/s   "
+              f"p50 {_percentile(latencies, 50) * 1000:7.2f} ms   "
+              f"p95 {_percentile(latencies, 95) * 1000:7.2f} ms   "
+              f"p99 {_percentile(latencies, 99) * 1000:7.2f} ms   "
+              f"max {max(latencies, default=0) * 1000:7.1f} ms   "
+              f"{errors} locked")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent read/write benchmark for SQLite mode.")
+    parser.add_argument('--db', default=os.path.join('instance', 'brokenpicturephone.db'))
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--baseline', action='store_true', help="default journal and settings, for comparison")
+    args = parser.parse_args()
+
+    run(args.db, args.readers, args.seconds, args.baseline)
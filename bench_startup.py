@@ -0,0 +1,120 @@
+import argparse
+import http.client
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+# Startup benchmark: how long a fresh process takes to import app.py, build the
+# app, and answer its first requests, plus which heavy libraries got loaded on
+# the way. Each run is a new interpreter, like a new gunicorn worker.
+#
+#   python bench_startup.py                              # import, create_app, first GET /
+#   python bench_startup.py --url / --url /book/1        # first response for each URL in turn
+#   python bench_startup.py --cold-templates             # without the Jinja bytecode cache
+#   python bench_startup.py --gunicorn                   # gunicorn start to first 200
+#   python bench_startup.py --save before.json / --compare before.json
+#
+# Uses DATABASE_URL like the app does.
+
+HEAVY = ('numpy', 'scipy', 'PIL', 'bs4', 'b2sdk', 'pytz')
+SLOWER = 1.25  # --compare flags medians this much slower...
+SLOWER_MIN_MS = 20  # ...and at least this many ms slower
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+client = app.test_client()
+result = {"import_ms": (imported - started) * 1000, "create_ms": (created - imported) * 1000, "urls": {},
+          "loaded": [m for m in HEAVY if m in sys.modules]}
+for url in sys.argv[1:]:
+    t = time.perf_counter()
+    status = client.get(url).status_code
+    result["urls"][url] = {"ms": (time.perf_counter() - t) * 1000, "status": status,
+                           "loaded": [m for m in HEAVY if m in sys.modules]}
+print(json.dumps(result))
+'''
+
+
+def run_once(urls, cold_templates):
+    if cold_templates:
+        shutil.rmtree(os.getenv("JINJA_CACHE_DIR", os.path.join('instance', 'jinja_cache')), ignore_errors=True)
+    output = subprocess.run([sys.executable, '-c', f"HEAVY = {HEAVY!r}\n" + CHILD, *urls],
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def gunicorn_once(port):
+    started = time.perf_counter()
+    proc = subprocess.Popen(['gunicorn', '--workers', '1', '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < 60:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                conn.request('GET', '/')
+                if conn.getresponse().status == 200:
+                    return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise SystemExit("gunicorn didn't answer within 60s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app startup and time to first response.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--url', action='append', help="first requests to time, in order (default: /)")
+    parser.add_argument('--cold-templates', action='store_true', help="clear the Jinja bytecode cache before each run")
+    parser.add_argument('--gunicorn', action='store_true', help="also time gunicorn start to first 200")
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--save', help="write the medians as JSON")
+    parser.add_argument('--compare', help="compare with saved medians; exit 1 if slower")
+    args = parser.parse_args()
+    urls = args.url or ['/']
+
+    runs = [run_once(urls, args.cold_templates) for _ in range(args.runs)]
+    medians = {
+        "import app": statistics.median(r["import_ms"] for r in runs),
+        "create_app()": statistics.median(r["create_ms"] for r in runs),
+    }
+    for url in urls:
+        medians[f"first GET {url}"] = statistics.median(r["urls"][url]["ms"] for r in runs)
+    medians["total"] = sum(medians.values())
+    if args.gunicorn:
+        medians["gunicorn to first 200"] = statistics.median(gunicorn_once(args.port) for _ in range(args.runs))
+
+    print(f"{args.runs} runs, median ms{' (cold templates)' if args.cold_templates else ''}")
+    for label, ms in medians.items():
+        print(f"  {label:32} {ms:8.1f}")
+    print(f"  heavy modules after startup: {', '.join(runs[0]['loaded']) or 'none'}")
+    for url in urls:
+        first = runs[0]["urls"][url]
+        print(f"    after {url} (HTTP {first['status']}): {', '.join(first['loaded']) or 'none'}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(medians, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = [label for label, ms in medians.items() if label in baseline
+                  and ms > baseline[label] * SLOWER and ms - baseline[label] > SLOWER_MIN_MS]
+        for label in [label for label in medians if label in baseline]:
+            print(f"  {label:32} {baseline[label]:8.1f} -> {medians[label]:8.1f}"
+                  f"{'  slower' if label in slower else ''}")
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import fcntl
+import os
+import pickle
+import re
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+import numpy as np
+from scipy import sparse
+from models import db, Alias, Page
+
+# "Chain drift" analytics: how far each caption in a book wandered from the
+# original prompt, and how faithfully each user keeps a chain on track.
+#
+# Every text page becomes a row in a hashed word/bigram TF-IDF matrix (scipy
+# sparse, no vocabulary to maintain), and similarities are computed for all
+# rows at once. Results are cached in instance/analytics so workers don't
+# recompute them, and new games are folded in incrementally after an import.
+# Run `python chain_drift.py` to rebuild everything from scratch; the first
+# import builds it too if it's missing (or unreadable). Pages never build it
+# themselves, they just show no drift until it exists. Writers hold an flock on
+# chain_drift.pkl.lock while they read, change and replace the file.
+
+N_FEATURES = 2 ** 18
+CACHE_PATH = os.path.join('instance', 'analytics', 'chain_drift.pkl')
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+    words = _TOKEN_RE.findall((text or '').lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def hash_matrix(texts):
+    """Term counts for each text, hashed into N_FEATURES columns."""
+    rows, cols = [], []
+    for i, text in enumerate(texts):
+        for token in tokenize(text):
+            rows.append(i)
+            cols.append(zlib.crc32(token.encode('utf-8')) % N_FEATURES)
+
+    counts = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float64), (rows, cols)),
+        shape=(len(texts), N_FEATURES)
+    )
+    counts.sum_duplicates()
+    return counts
+
+
+def document_frequencies(counts):
+    return np.bincount(counts.indices, minlength=N_FEATURES).astype(np.int64)
+
+
+def tfidf(counts, df, n_docs):
+    """Sublinear TF-IDF with L2-normalized rows."""
+    weights = counts.copy()
+    weights.data = 1.0 + np.log(weights.data)
+    idf = np.log((1.0 + n_docs) / (1.0 + df)) + 1.0
+    weights = weights.multiply(idf).tocsr()
+
+    norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ weights
+
+
+def score_chains(rows, df, n_docs):
+    """
+    rows: (page_id, book_id, sequence, user_id, text), sorted by book then sequence.
+    Returns (books, user_totals):
+        books[book_id] = {"pages": [...], "to_prompt": [...], "to_prev": [...]}
+        user_totals[user_id] = (sum of similarity to previous caption, number of captions)
+    """
+    if not rows:
+        return {}, {}
+
+    page_ids, book_ids, _, user_ids, texts = zip(*rows)
+    weights = tfidf(hash_matrix(texts), df, n_docs)
+
+    n = len(rows)
+    idx = np.arange(n)
+    book_arr = np.asarray(book_ids)
+    starts = np.r_[True, book_arr[1:] != book_arr[:-1]]
+    first_idx = np.maximum.accumulate(np.where(starts, idx, 0))
+    prev_idx = np.where(starts, idx, idx - 1)
+
+    to_prompt = np.asarray(weights.multiply(weights[first_idx]).sum(axis=1)).ravel()
+    to_prev = np.asarray(weights.multiply(weights[prev_idx]).sum(axis=1)).ravel()
+
+    books = {}
+    for i in range(n):
+        book = books.setdefault(book_ids[i], {"pages": [], "to_prompt": [], "to_prev": []})
+        book["pages"].append(page_ids[i])
+        book["to_prompt"].append(float(to_prompt[i]))
+        book["to_prev"].append(float(to_prev[i]))
+
+    # Fidelity: how close each caption stays to the caption before it (one
+    # drawing in between), credited to the user who wrote the caption
+    user_totals = {}
+    captions = ~starts & np.array([u is not None for u in user_ids])
+    if captions.any():
+        caption_users = np.array([u for u, c in zip(user_ids, captions) if c])
+        unique_users, inverse = np.unique(caption_users, return_inverse=True)
+        sums = np.bincount(inverse, weights=to_prev[captions])
+        counts = np.bincount(inverse)
+        user_totals = {int(u): (float(s), int(c)) for u, s, c in zip(unique_users, sums, counts)}
+
+    return books, user_totals
+
+
+def _text_rows(book_ids=None):
+    query = db.session.query(Page.id, Page.book_id, Page.sequence, Alias.user_id, Page.content_text) \
+        .outerjoin(Alias, Page.alias_id == Alias.id) \
+        .filter(Page.type == 'text')
+    if book_ids is not None:
+        query = query.filter(Page.book_id.in_(book_ids))
+    return query.order_by(Page.book_id, Page.sequence).all()
+
+
+class ChainDrift:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()        # this process's copy (state, _mtime)
+        self._write_lock = threading.Lock()  # writers in this process; see _writing()
+        self._mtime = None
+        self.state = None
+
+    def _empty_state(self):
+        return {"df": np.zeros(N_FEATURES, dtype=np.int64), "n_docs": 0, "books": {}, "users": {}}
+
+    @contextmanager
+    def _writing(self):
+        """
+        Load-modify-save is locked against every process, so two imports on
+        different workers can't each fold in their books and drop the other's.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._write_lock, open(f"{self.path}.lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _read(self):
+        """(state, mtime) from the cache file; state is None if it's missing or unreadable."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return None, None
+        try:
+            with open(self.path, 'rb') as f:
+                return pickle.load(f), mtime
+        except Exception as e:
+            # Same as no cache: pages show no drift until the next import or `python chain_drift.py`
+            print(f"Chain drift: ignoring unreadable cache {self.path}: {e}")
+            return None, mtime
+
+    def _publish(self, state):
+        tmp_path = f"{self.path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        with self._lock:
+            self.state, self._mtime = state, os.path.getmtime(self.path)
+
+    def _load(self):
+        """Pick up the cache file if another process wrote a newer one."""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime != self._mtime:
+            # An unreadable file keeps its mtime too, so it's only tried once
+            self.state, self._mtime = self._read()
+        return self.state is not None
+
+    def _rebuild(self):
+        rows = _text_rows()
+        state = self._empty_state()
+        if rows:
+            state["df"] = document_frequencies(hash_matrix([r[4] for r in rows]))
+            state["n_docs"] = len(rows)
+            state["books"], state["users"] = score_chains(rows, state["df"], state["n_docs"])
+        self._publish(state)
+
+    def rebuild(self):
+        """Score every book in one batch and replace the cache."""
+        with self._writing():
+            self._rebuild()
+
+    def update(self, book_ids):
+        """Fold newly imported books into the cache without rescoring old ones."""
+        with self._writing():
+            # Always the file as it is now, whatever this process saw last
+            state, _ = self._read()
+            if state is None:
+                # No cache yet: score the whole archive (these books included), so
+                # df/n_docs cover every caption and not just this import
+                self._rebuild()
+                return
+
+            new_ids = [b for b in book_ids if b not in state["books"]]
+            rows = _text_rows(new_ids) if new_ids else []
+            if not rows:
+                return
+
+            state["df"] += document_frequencies(hash_matrix([r[4] for r in rows]))
+            state["n_docs"] += len(rows)
+            books, users = score_chains(rows, state["df"], state["n_docs"])
+
+            state["books"].update(books)
+            for user_id, (total, count) in users.items():
+                old_total, old_count = state["users"].get(user_id, (0.0, 0))
+                state["users"][user_id] = (old_total + total, old_count + count)
+            self._publish(state)
+
+    def _ensure(self):
+        # Reads never build the cache (that's a full-archive TF-IDF pass); the
+        # import thread or `python chain_drift.py` does, until then pages show no drift
+        with self._lock:
+            return self._load()
+
+    # --- reads ---
+
+    def book_drift(self, book_id):
+        """{page_id: {"step", "similarity", "drift"}} for the book's text pages."""
+        if not self._ensure():
+            return {}
+        book = self.state["books"].get(book_id)
+        if not book:
+            return {}
+        return {
+            page_id: {
+                "step": step,
+                "similarity": round(sim, 3),
+                "drift": round(1.0 - sim, 3)
+            }
+            for step, (page_id, sim) in enumerate(zip(book["pages"], book["to_prompt"]))
+        }
+
+    def user_fidelity(self, user_id):
+        """Mean caption-to-caption similarity for the user, with their rank among all users."""
+        if not self._ensure():
+            return None
+        users = self.state["users"]
+        if user_id not in users:
+            return None
+        total, count = users[user_id]
+        score = total / count
+        scores = sorted((t / c for t, c in users.values()), reverse=True)
+        return {
+            "score": round(score, 3),
+            "captions": count,
+            "rank": scores.index(score) + 1,
+            "out_of": len(scores)
+        }
+
+
+chain_drift = ChainDrift()
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        chain_drift.rebuild()
+        print(f"Scored {len(chain_drift.state['books'])} books, {chain_drift.state['n_docs']} captions.")
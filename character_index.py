@@ -0,0 +1,152 @@
+import bisect
+import threading
+import time
+from sqlalchemy import func
+from models import db, Character, page_characters
+
+# In-memory name index behind the character typeahead.
+# Each gunicorn worker keeps its own copy; changes made in this process are
+# applied incrementally via model events (see app.py), and the whole index is
+# reloaded every MAX_AGE seconds so edits made by other workers show up too.
+
+MAX_AGE = 600  # seconds
+
+
+def normalize(name):
+    return ' '.join((name or '').lower().split())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CharacterIndex:
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._chars = {}     # id -> {"id", "name", "imgSrc"}
+        self._norm = {}      # id -> normalized name
+        self._counts = {}    # id -> number of tagged panels
+        self._prefixes = []  # sorted (word suffix, id), one per word start in the name
+        self._trigrams = {}  # trigram -> set of ids
+
+    def load(self):
+        """(Re)build the whole index with one grouped query."""
+        rows = db.session.query(
+            Character.id,
+            Character.name,
+            Character.image_url,
+            func.count(page_characters.c.page_id)
+        ).outerjoin(page_characters, page_characters.c.character_id == Character.id) \
+         .group_by(Character.id, Character.name, Character.image_url) \
+         .all()
+
+        with self._lock:
+            self._chars = {}
+            self._norm = {}
+            self._counts = {}
+            self._prefixes = []
+            self._trigrams = {}
+            for char_id, name, image_url, count in rows:
+                self._add(char_id, name, image_url)
+                self._counts[char_id] = count
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def _add(self, char_id, name, image_url):
+        norm = normalize(name)
+        self._chars[char_id] = {"id": char_id, "name": name, "imgSrc": image_url or None}
+        self._norm[char_id] = norm
+        for i, ch in enumerate(norm):
+            if i == 0 or norm[i - 1] == ' ':
+                bisect.insort(self._prefixes, (norm[i:], char_id))
+        for gram in trigrams(norm):
+            self._trigrams.setdefault(gram, set()).add(char_id)
+
+    def _discard(self, char_id):
+        norm = self._norm.pop(char_id, None)
+        self._chars.pop(char_id, None)
+        if norm is None:
+            return
+        for i, ch in enumerate(norm):
+            if i == 0 or norm[i - 1] == ' ':
+                pos = bisect.bisect_left(self._prefixes, (norm[i:], char_id))
+                if pos < len(self._prefixes) and self._prefixes[pos] == (norm[i:], char_id):
+                    del self._prefixes[pos]
+        for gram in trigrams(norm):
+            ids = self._trigrams.get(gram)
+            if ids:
+                ids.discard(char_id)
+                if not ids:
+                    del self._trigrams[gram]
+
+    # --- incremental updates (called from model events) ---
+
+    def upsert(self, char_id, name, image_url, count=None):
+        if char_id is None or self._loaded_at is None:
+            return
+        with self._lock:
+            self._discard(char_id)
+            self._add(char_id, name, image_url)
+            if count is not None:
+                self._counts[char_id] = count
+            else:
+                self._counts.setdefault(char_id, 0)
+
+    def remove(self, char_id):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._discard(char_id)
+            self._counts.pop(char_id, None)
+
+    def bump(self, char_id, delta):
+        if char_id is None or self._loaded_at is None:
+            return
+        with self._lock:
+            if char_id in self._counts:
+                self._counts[char_id] = max(0, self._counts[char_id] + delta)
+
+    # --- lookups ---
+
+    def suggest(self, query, limit=10):
+        self.ensure_fresh()
+        q = normalize(query)
+
+        with self._lock:
+            if not q:
+                ranked = sorted(self._chars, key=lambda i: (-self._counts.get(i, 0), self._norm[i]))
+                return [dict(self._chars[i], count=self._counts.get(i, 0)) for i in ranked[:limit]]
+
+            # Word prefixes: "gru" matches "Grumpy Cat" and "cat" matches "Grumpy Cat"
+            matches = set()
+            pos = bisect.bisect_left(self._prefixes, (q,))
+            while pos < len(self._prefixes) and self._prefixes[pos][0].startswith(q):
+                matches.add(self._prefixes[pos][1])
+                pos += 1
+
+            # Substrings anywhere in the name, narrowed down by trigrams first
+            if len(q) >= 3:
+                grams = trigrams(q)
+                candidates = set.intersection(*(self._trigrams.get(g, set()) for g in grams))
+                matches.update(i for i in candidates if q in self._norm[i])
+
+            def rank(char_id):
+                norm = self._norm[char_id]
+                if norm.startswith(q):
+                    kind = 0
+                elif (' ' + norm).find(' ' + q) != -1:
+                    kind = 1
+                else:
+                    kind = 2
+                return (kind, -self._counts.get(char_id, 0), norm)
+
+            ranked = sorted(matches, key=rank)
+            return [dict(self._chars[i], count=self._counts.get(i, 0)) for i in ranked[:limit]]
+
+
+character_index = CharacterIndex()
@@ -0,0 +1,211 @@
+import threading
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, insert, select
+import sqlite_mode
+from models import db, User, Alias, Book, Page, Character, Neighbor, page_characters
+
+# "Frequent collaborators" (users who played in the same books/games) and
+# "often appears with" (characters tagged on the same panels).
+#
+# Both come from sparse incidence matrices multiplied in one batch
+# (users x books, characters x panels), and only the top TOP_K neighbors per
+# user/character are stored in the Neighbor table, so detail pages do a single
+# keyed read. After an import only the game's participants are rescored, and
+# after tagging only the characters on the touched panels; either way the
+# matrices are built from just the games (or panels) those ids appear in, since
+# that's the only place their co-occurrences can come from.
+#
+# Pages never build anything: until the first import or tag after a fresh
+# deploy (which scores everyone once), or `python cooccurrence.py`, the lists
+# are just empty. Run `python cooccurrence.py` to rebuild everything from scratch.
+
+TOP_K = 10
+
+_dirty_characters = set()
+_dirty_lock = threading.Lock()
+_built_kinds = set()
+
+
+def _incidence(pairs):
+    """Binary sparse matrix from (row_key, col_key) pairs, plus the row keys in order."""
+    row_keys = np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs))
+    col_keys = np.fromiter((p[1] for p in pairs), dtype=np.int64, count=len(pairs))
+    row_ids, row_idx = np.unique(row_keys, return_inverse=True)
+    col_ids, col_idx = np.unique(col_keys, return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (row_idx, col_idx)),
+        shape=(len(row_ids), len(col_ids))
+    )
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, row_ids
+
+
+def _top_neighbors(primary, secondary, row_ids, source_rows):
+    """
+    For each source row, rank the other rows by (primary, secondary) co-occurrence.
+    primary/secondary are incidence matrices with the same rows (secondary may be None).
+    Returns {source_id: [(neighbor_id, weight, weight_secondary), ...]}.
+    """
+    co_primary = (primary[source_rows] @ primary.T).tocsr()
+    co_secondary = (secondary[source_rows] @ secondary.T).tocsr() if secondary is not None else None
+
+    result = {}
+    for i, row in enumerate(source_rows):
+        # Candidates are everyone sharing at least one game (or book/panel)
+        candidates = co_secondary if co_secondary is not None else co_primary
+        start, end = candidates.indptr[i], candidates.indptr[i + 1]
+        cols = candidates.indices[start:end]
+        keep = cols != row
+        cols = cols[keep]
+        if not len(cols):
+            result[int(row_ids[row])] = []
+            continue
+
+        weights = np.asarray(co_primary[i, cols].todense()).ravel()
+        seconds = candidates.data[start:end][keep] if co_secondary is not None else np.zeros(len(cols))
+        order = np.lexsort((row_ids[cols], -seconds, -weights))[:TOP_K]
+
+        result[int(row_ids[row])] = [
+            (int(row_ids[cols[j]]), int(weights[j]), int(seconds[j]) if co_secondary is not None else None)
+            for j in order
+        ]
+    return result
+
+
+def _store(kind, neighbors):
+    if not neighbors:
+        return
+    source_ids = list(neighbors)
+    rows = [
+        {
+            "kind": kind,
+            "source_id": source_id,
+            "neighbor_id": neighbor_id,
+            "rank": rank,
+            "weight": weight,
+            "weight_secondary": weight_secondary
+        }
+        for source_id, items in neighbors.items()
+        for rank, (neighbor_id, weight, weight_secondary) in enumerate(items, start=1)
+    ]
+    # Scoring read first; the write lock is only held for the swap
+    with sqlite_mode.serialized_writes(db.session):
+        db.session.execute(delete(Neighbor).where(Neighbor.kind == kind, Neighbor.source_id.in_(source_ids)))
+        if rows:
+            db.session.execute(insert(Neighbor), rows)
+        db.session.commit()
+
+
+# --- users ---
+
+def refresh_users(user_ids=None):
+    """Rescore collaborators for user_ids (everyone if None)."""
+    if user_ids is not None and not _is_built('user'):
+        user_ids = None  # first scoring on this archive: everyone at once
+    query = db.session.query(Alias.user_id, Page.book_id, Book.game_id) \
+        .join(Page, Page.alias_id == Alias.id) \
+        .join(Book, Page.book_id == Book.id) \
+        .filter(Alias.user_id.isnot(None))
+    if user_ids is not None:
+        # Only the games these users played in
+        games = select(Book.game_id) \
+            .join(Page, Page.book_id == Book.id) \
+            .join(Alias, Page.alias_id == Alias.id) \
+            .where(Alias.user_id.in_(list(user_ids)))
+        query = query.filter(Book.game_id.in_(games))
+    pairs = query.distinct().all()
+    if not pairs:
+        _store('user', {u: [] for u in user_ids or ()})
+        return
+
+    by_book, row_ids = _incidence([(u, b) for u, b, _ in pairs])
+    by_game, _ = _incidence([(u, g) for u, _, g in pairs])  # same users, same row order
+
+    if user_ids is None:
+        source_rows = np.arange(len(row_ids))
+    else:
+        source_rows = np.flatnonzero(np.isin(row_ids, list(user_ids)))
+
+    # Requested users with no pages left still get their old list cleared
+    neighbors = {u: [] for u in user_ids or ()}
+    neighbors.update(_top_neighbors(by_book, by_game, row_ids, source_rows))
+    _store('user', neighbors)
+
+
+# --- characters ---
+
+def refresh_characters(char_ids=None):
+    """Rescore co-appearances for char_ids (everyone if None)."""
+    if char_ids is not None and not _is_built('character'):
+        char_ids = None  # first scoring on this archive: everyone at once
+    query = db.session.query(page_characters.c.character_id, page_characters.c.page_id)
+    if char_ids is not None:
+        # Only the panels these characters are tagged on
+        pages = select(page_characters.c.page_id).where(page_characters.c.character_id.in_(list(char_ids)))
+        query = query.filter(page_characters.c.page_id.in_(pages))
+    pairs = query.all()
+    if not pairs:
+        _store('character', {c: [] for c in char_ids or ()})
+        return
+
+    by_page, row_ids = _incidence(pairs)
+
+    if char_ids is None:
+        source_rows = np.arange(len(row_ids))
+    else:
+        source_rows = np.flatnonzero(np.isin(row_ids, list(char_ids)))
+
+    # Requested characters with no tags left still get their old list cleared
+    neighbors = {c: [] for c in char_ids or ()}
+    neighbors.update(_top_neighbors(by_page, None, row_ids, source_rows))
+    _store('character', neighbors)
+
+
+def mark_characters_dirty(char_ids):
+    with _dirty_lock:
+        _dirty_characters.update(c for c in char_ids if c is not None)
+
+
+def refresh_dirty_characters():
+    """Rescore the characters touched by tagging since the last call."""
+    with _dirty_lock:
+        char_ids = set(_dirty_characters)
+        _dirty_characters.clear()
+    if char_ids:
+        refresh_characters(char_ids)
+
+
+def _is_built(kind):
+    if kind not in _built_kinds and Neighbor.query.filter_by(kind=kind).first() is not None:
+        _built_kinds.add(kind)
+    return kind in _built_kinds
+
+
+# --- reads ---
+
+def frequent_collaborators(user_id):
+    return db.session.query(User.id, User.true_name, Neighbor.weight, Neighbor.weight_secondary) \
+        .join(Neighbor, Neighbor.neighbor_id == User.id) \
+        .filter(Neighbor.kind == 'user', Neighbor.source_id == user_id) \
+        .order_by(Neighbor.rank) \
+        .all()
+
+
+def often_appears_with(char_id):
+    return db.session.query(Character.id, Character.name, Character.image_url, Neighbor.weight) \
+        .join(Neighbor, Neighbor.neighbor_id == Character.id) \
+        .filter(Neighbor.kind == 'character', Neighbor.source_id == char_id) \
+        .order_by(Neighbor.rank) \
+        .all()
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        refresh_users()
+        refresh_characters()
+        print(f"Stored {Neighbor.query.count()} neighbor rows.")
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+import metrics
+
+# Connection pools and read/write routing.
+#
+# Each gunicorn worker gets up to three pools (SQLAlchemy engines):
+#   primary     requests that write, admin pages, and everything without a replica
+#   background  the import thread, so a long import can't starve page requests
+#   replica     anonymous GET/HEAD requests, when DATABASE_REPLICA_URL is set
+#
+# Sizes come from DB_POOL_SIZE, or are worked out from DB_MAX_CONNECTIONS (the
+# database's connection budget) split across WEB_CONCURRENCY workers. Routing
+# happens in RoutingSession.get_bind: a session sent to the replica reads from
+# it until its first write, then sticks to the primary so the rest of the
+# request sees what it just wrote.
+#
+# Local stand-ins for a primary and a read-only replica:
+#   DATABASE_URL=sqlite:////tmp/primary.db
+#   DATABASE_REPLICA_URL="sqlite:///file:/tmp/primary.db?mode=ro&uri=true"
+# (point the replica at a copy of the file instead to see replica lag)
+
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))  # gunicorn reads this too
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", 0))  # 0 = no budget, use DB_POOL_SIZE
+DB_BACKGROUND_POOL_SIZE = int(os.getenv("DB_BACKGROUND_POOL_SIZE", 2))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 0))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_SLOW_MS = float(os.getenv("DB_POOL_SLOW_MS", 100))  # log checkouts that wait longer
+
+BACKGROUND = 'background'
+REPLICA = 'replica'
+
+
+def pool_size():
+    if os.getenv("DB_POOL_SIZE"):
+        return int(os.getenv("DB_POOL_SIZE"))
+    if DB_MAX_CONNECTIONS:
+        per_worker = DB_MAX_CONNECTIONS // max(WEB_CONCURRENCY, 1)
+        return max(per_worker - DB_BACKGROUND_POOL_SIZE - DB_MAX_OVERFLOW, 1)
+    return 5
+
+
+# --- checkout wait times ---
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            entry = super()._do_get()
+        except PoolTimeout:
+            self._record(time.perf_counter() - start, timed_out=True)
+            raise
+        self._record(time.perf_counter() - start)
+        return entry
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        metrics.pool_changed(self._orig_logging_name or 'primary', self)
+
+    def _record(self, waited, timed_out=False):
+        name = self._orig_logging_name or 'primary'
+        metrics.pool_checkout(name, self, waited, timed_out)
+        slow = waited * 1000 >= DB_POOL_SLOW_MS
+        with _stats_lock:
+            s = _stats.setdefault(name, {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0,
+                                         "slow": 0, "timeouts": 0})
+            s["checkouts"] += 1
+            s["wait_total"] += waited
+            s["wait_max"] = max(s["wait_max"], waited)
+            s["slow"] += slow
+            s["timeouts"] += timed_out
+        if slow:
+            print(f"DB pool {name}: waited {waited * 1000:.0f} ms for a connection"
+                  f"{' and timed out' if timed_out else ''}")
+
+
+def pool_stats(engines):
+    """{pool name: size, in use, checkouts and wait times} for this process."""
+    result = {}
+    for engine in engines.values():
+        pool = engine.pool
+        name = getattr(pool, '_orig_logging_name', None) or 'primary'
+        with _stats_lock:
+            s = dict(_stats.get(name, {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0,
+                                       "slow": 0, "timeouts": 0}))
+        s["size"] = pool.size() if isinstance(pool, QueuePool) else None
+        s["checked_out"] = pool.checkedout() if isinstance(pool, QueuePool) else None
+        s["wait_avg"] = s["wait_total"] / s["checkouts"] if s["checkouts"] else 0.0
+        result[name] = s
+    return result
+
+
+# --- configuration ---
+
+def _options(name, size):
+    return {
+        "pool_pre_ping": True,
+        "poolclass": TimedQueuePool,
+        "pool_size": size,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_logging_name": name,
+    }
+
+
+def configure(app, database_url):
+    """Set the engine options and binds. Call before db.init_app(app)."""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = _options('primary', pool_size())
+    binds = {BACKGROUND: {"url": database_url, **_options(BACKGROUND, DB_BACKGROUND_POOL_SIZE)}}
+    if DATABASE_REPLICA_URL:
+        binds[REPLICA] = {"url": DATABASE_REPLICA_URL, **_options(REPLICA, pool_size())}
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def use_replica(db):
+    """Send reads in the current session to the replica (if there is one)."""
+    if REPLICA in db.engines:
+        db.session.info['route'] = REPLICA
+
+
+def use_background(db):
+    """Run everything in the current session on the background pool."""
+    db.session.info['route'] = BACKGROUND
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        route = self.info.get('route')
+        if bind is None and route == BACKGROUND:
+            return self._db.engines[BACKGROUND]
+        if bind is None and route == REPLICA:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['route'] = None  # wrote something; the primary from here on
+            else:
+                return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
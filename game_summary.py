@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case, func
+from models import db, User, Alias, Book, Page
+
+# Per-game summary (participants with their drawing/caption counts) built from
+# one grouped query. Archived games rarely change, so summaries are cached per
+# process and dropped by the model events in app.py when something they depend
+# on is edited. Those events only reach the worker that made the edit, so like
+# the character index every summary is also rebuilt once it's MAX_AGE seconds
+# old, and edits made on other workers show up within that.
+
+MAX_CACHED_GAMES = 256
+MAX_AGE = 600  # seconds
+
+_cache = OrderedDict()  # game_id -> (built at, summary)
+_lock = threading.Lock()
+
+
+def _build_summary(game_id):
+    rows = db.session.query(
+        User.id,
+        User.true_name,
+        Alias.name,
+        func.sum(case((Page.type == 'image', 1), else_=0)),
+        func.sum(case((Page.type == 'text', 1), else_=0))
+    ).select_from(Page) \
+     .join(Book, Page.book_id == Book.id) \
+     .join(Alias, Page.alias_id == Alias.id) \
+     .join(User, Alias.user_id == User.id) \
+     .filter(Book.game_id == game_id) \
+     .group_by(User.id, User.true_name, Alias.name) \
+     .all()
+
+    participants = {}
+    for user_id, true_name, alias_name, drawings, captions in rows:
+        p = participants.setdefault(user_id, {
+            "id": user_id,
+            "true_name": true_name,
+            "aliases": [],
+            "drawings": 0,
+            "captions": 0
+        })
+        p["aliases"].append(alias_name)
+        p["drawings"] += int(drawings or 0)
+        p["captions"] += int(captions or 0)
+
+    for p in participants.values():
+        p["aliases"].sort(key=str.lower)
+
+    return {
+        "game_id": game_id,
+        "participants": sorted(participants.values(), key=lambda p: p["true_name"].lower()),
+        "drawings": sum(p["drawings"] for p in participants.values()),
+        "captions": sum(p["captions"] for p in participants.values())
+    }
+
+
+def get_game_summary(game_id):
+    with _lock:
+        cached = _cache.get(game_id)
+        if cached is not None and time.monotonic() - cached[0] <= MAX_AGE:
+            _cache.move_to_end(game_id)
+            return cached[1]
+
+    summary = _build_summary(game_id)
+
+    with _lock:
+        _cache[game_id] = (time.monotonic(), summary)
+        _cache.move_to_end(game_id)
+        while len(_cache) > MAX_CACHED_GAMES:
+            _cache.popitem(last=False)
+    return summary
+
+
+def invalidate(game_id=None):
+    with _lock:
+        if game_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(game_id, None)
@@ -0,0 +1,36 @@
+import os
+import shutil
+
+# gunicorn reads this file from the working directory on startup.
+#
+# Metrics: each worker writes its Prometheus values to files in
+# PROMETHEUS_MULTIPROC_DIR so /metrics can add them up across workers (see
+# metrics.py). It has to be set before the workers import the app, hence here.
+# The directory is emptied when gunicorn starts, and a worker's live gauges
+# (connections in use, imports running) are dropped when it exits.
+#
+# Workers: threaded (gthread), because /admin/export streams the whole archive
+# for as long as it takes. A sync worker is killed by the arbiter after
+# `timeout` seconds of one request, which left a truncated ZIP with a 200; a
+# gthread worker's main thread keeps checking in while requests run, so
+# `timeout` only catches workers that are truly stuck. Keep GUNICORN_THREADS
+# within DB_POOL_SIZE (see db_routing.py), or requests queue for a connection.
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join('instance', 'metrics'))
+
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+
+def on_starting(server):
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,211 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from b2blaze import IMAGE_SERVER_URL
+
+# Read-through disk cache for images, served by the /img/<path> route.
+# The first request for a path fetches it from the origin (IMAGE_SERVER_URL by
+# default) and keeps it under IMAGE_CACHE_DIR; later requests are plain sendfile.
+# The cache is bounded by IMAGE_CACHE_MAX_MB and evicts least recently used files.
+#
+# Workers share one cache directory, so the byte total lives in a .usage file
+# there, updated under flock() after each fetch. Once it goes over the limit,
+# whoever notices rescans the directory and evicts by atime (hits touch their
+# file) down to LOW_WATER of the limit. Temp files of interrupted fetches are
+# cleaned up on a rescan once they're TMP_MAX_AGE old.
+#
+# With IMAGE_CACHE=1 the `img` template filter rewrites image URLs to /img/...,
+# so pages load everything from this server (dev, offline demos, slow CDN days).
+# In production nginx can serve /img/ itself or skip it entirely.
+
+IMAGE_CACHE = os.getenv("IMAGE_CACHE", "0") == "1"
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join('instance', 'image_cache'))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", 1024))
+IMAGE_CACHE_ORIGIN = os.getenv("IMAGE_CACHE_ORIGIN", IMAGE_SERVER_URL)
+
+LOW_WATER = 0.9
+TOUCH_EVERY = 60  # seconds; hits update atime at most this often
+TMP_MAX_AGE = 3600  # seconds; far longer than any fetch
+
+
+class HTTPFetcher:
+    """Fetches paths from an HTTP origin. Any object with open(path) will do."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def open(self, path):
+        try:
+            return urllib.request.urlopen(f"{self.base_url}/{path}", timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                raise FileNotFoundError(path) from e
+            raise
+
+
+class DirectoryFetcher:
+    """Serves paths out of a local directory, e.g. a copy of the bucket."""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def open(self, path):
+        full = os.path.abspath(os.path.join(self.root, path))
+        if not full.startswith(self.root + os.sep):
+            raise FileNotFoundError(path)
+        return open(full, 'rb')
+
+
+class ImageCache:
+    def __init__(self, root=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_MB * 1024 * 1024, fetcher=None):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher or HTTPFetcher(IMAGE_CACHE_ORIGIN)
+        self._lock = threading.Lock()
+        self._fetch_locks = {}  # path -> lock, so each file is only fetched once per process
+
+    def _local_path(self, path):
+        full = os.path.abspath(os.path.join(self.root, path))
+        if not full.startswith(self.root + os.sep):
+            raise FileNotFoundError(path)
+        return full
+
+    def _touch(self, full):
+        """True if the file is cached; marks it used (atime is the LRU order)."""
+        try:
+            st = os.stat(full)
+        except FileNotFoundError:
+            return False
+        now = time.time()
+        if now - st.st_atime > TOUCH_EVERY:
+            try:
+                os.utime(full, (now, st.st_mtime))
+            except OSError:
+                pass  # evicted meanwhile, it's still ours to send
+        return True
+
+    def get(self, path):
+        """Local file path for `path`, fetching it from the origin on a miss."""
+        full = self._local_path(path)
+        if self._touch(full):
+            return full
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(path, threading.Lock())
+
+        with fetch_lock:
+            try:
+                # Someone else may have fetched it while we waited
+                if self._touch(full):
+                    return full
+                size = self._fetch(path, full)
+                self._account(size, keep=full)
+                return full
+            finally:
+                with self._lock:
+                    self._fetch_locks.pop(path, None)
+
+    def _fetch(self, path, full):
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        # The pid in the name keeps other workers' in-flight fetches apart
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full), prefix=f'.tmp{os.getpid()}-')
+        try:
+            with self.fetcher.open(path) as src, os.fdopen(fd, 'wb') as out:
+                shutil.copyfileobj(src, out, 1024 * 1024)
+            os.replace(tmp_path, full)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return os.path.getsize(full)
+
+    # --- size accounting, shared by every worker ---
+
+    @contextmanager
+    def _usage(self):
+        """The shared byte total in .usage, locked against other processes and threads."""
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, '.usage'), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            text = f.read().strip()
+            usage = {"total": int(text) if text.isdigit() else None}
+            yield usage
+            f.seek(0)
+            f.truncate()
+            f.write(str(usage["total"]))
+
+    def _scan(self):
+        """[(atime, full path, size)] for the cached files, oldest use first."""
+        found = []
+        now = time.time()
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                if name.startswith('.tmp'):
+                    if now - st.st_mtime > TMP_MAX_AGE:
+                        os.remove(full)  # left behind by an interrupted fetch
+                    continue
+                if not name.startswith('.'):
+                    found.append((st.st_atime, full, st.st_size))
+        found.sort()
+        return found
+
+    def _account(self, size, keep=None):
+        with self._usage() as usage:
+            if usage["total"] is None:
+                usage["total"] = sum(size for _, _, size in self._scan())  # includes the new file
+            else:
+                usage["total"] += size
+            if usage["total"] > self.max_bytes:
+                usage["total"] = self._evict(keep)
+
+    def _evict(self, keep=None):
+        # Down to LOW_WATER so a full cache doesn't rescan on every miss
+        found = self._scan()
+        total = sum(size for _, _, size in found)
+        for _, full, size in found:
+            if total <= self.max_bytes * LOW_WATER:
+                break
+            if full == keep:
+                continue
+            try:
+                os.remove(full)
+            except OSError:
+                continue
+            total -= size
+        return total
+
+    def clear(self):
+        with self._usage() as usage:
+            for _, full, _ in self._scan():
+                os.remove(full)
+            usage["total"] = 0
+
+    def stats(self):
+        with self._usage() as usage:
+            found = self._scan()
+            usage["total"] = sum(size for _, _, size in found)
+            return {"files": len(found), "bytes": usage["total"], "max_bytes": self.max_bytes}
+
+
+image_cache = ImageCache()
+
+
+def cached_url(url):
+    """Rewrite an origin URL to go through /img/ when IMAGE_CACHE is on."""
+    if IMAGE_CACHE and url and url.startswith(IMAGE_CACHE_ORIGIN.rstrip('/') + '/'):
+        return '/img/' + url[len(IMAGE_CACHE_ORIGIN.rstrip('/')) + 1:]
+    return url
@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import threading
+from PIL import Image
+
+# Lossless recompression for uploaded drawings.
+# BPP exports embed canvas PNGs that are barely compressed. Before upload we
+# re-encode them losslessly (optimized PNG, a palette PNG when the drawing has
+# few enough colors, or lossless WebP when IMAGE_FORMAT=webp), drop metadata, and
+# keep whichever is smallest. Every result is logged to SAVINGS_LOG.
+#
+# `python recompress_b2.py` applies the same treatment to files already in B2.
+
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "png").lower()  # "png" or "webp"
+SAVINGS_LOG = os.path.join('instance', 'analytics', 'recompression.jsonl')
+
+CONTENT_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg", "gif": "image/gif"}
+
+_log_lock = threading.Lock()
+
+
+def _encode_png(img):
+    out = io.BytesIO()
+    img.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def _encode_palette_png(img):
+    """Palette PNG, only if it round-trips to exactly the same pixels."""
+    rgba = img.convert('RGBA')
+    if rgba.getcolors(256) is None:
+        return None
+    paletted = rgba.quantize(colors=256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    if paletted.convert('RGBA').tobytes() != rgba.tobytes():
+        return None
+    return _encode_png(paletted)
+
+
+def _encode_webp(img):
+    out = io.BytesIO()
+    img.save(out, format='WEBP', lossless=True, quality=100, method=6)
+    return out.getvalue()
+
+
+def recompress(image, allow_format_change=True):
+    """
+    image is bytes or a seekable file object. Returns (data, extension, content_type);
+    data is the re-encoded bytes, or `image` itself (rewound) when it isn't a PNG
+    or couldn't be made smaller.
+    """
+    source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+    start = source.tell()
+    original_size = source.seek(0, os.SEEK_END) - start
+    source.seek(start)
+
+    def unchanged(ext='png'):
+        source.seek(start)
+        return image, ext, CONTENT_TYPES.get(ext, 'application/octet-stream')
+
+    try:
+        with Image.open(source) as img:
+            source_format = (img.format or '').lower()
+            if source_format != 'png':
+                return unchanged(source_format if source_format in CONTENT_TYPES else 'png')
+
+            img.load()
+            # Re-encoding from pixel data drops text chunks, EXIF and other metadata
+            if img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+                img = img.convert('RGBA')
+
+            candidates = [('png', _encode_png(img))]
+            palette = _encode_palette_png(img)
+            if palette:
+                candidates.append(('png', palette))
+            if allow_format_change and IMAGE_FORMAT == 'webp':
+                candidates.append(('webp', _encode_webp(img)))
+    except Exception as e:
+        print(f"Recompression skipped, could not decode image: {e}")
+        return unchanged()
+
+    ext, best = min(candidates, key=lambda c: len(c[1]))
+    if len(best) >= original_size:
+        return unchanged()
+    return best, ext, CONTENT_TYPES[ext]
+
+
+def data_size(data):
+    """Length of bytes, or of what's left in a seekable file."""
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    position = data.tell()
+    size = data.seek(0, os.SEEK_END) - position
+    data.seek(position)
+    return size
+
+
+def record_savings(name, before, after):
+    os.makedirs(os.path.dirname(SAVINGS_LOG), exist_ok=True)
+    with _log_lock:
+        with open(SAVINGS_LOG, 'a') as f:
+            f.write(json.dumps({"name": name, "before": before, "after": after}) + "\n")
+
+
+def total_savings():
+    """(files, bytes before, bytes after) across everything logged so far."""
+    files = before = after = 0
+    if os.path.exists(SAVINGS_LOG):
+        with open(SAVINGS_LOG) as f:
+            for line in f:
+                entry = json.loads(line)
+                files += 1
+                before += entry["before"]
+                after += entry["after"]
+    return files, before, after
@@ -1,4 +1,5 @@
 import re
+import hashlib
 from bs4 import BeautifulSoup
 from datetime import datetime
 
@@ -67,6 +68,36 @@ def process_html_content(content):
         })
 
     game["books"] = books
+    fingerprint_game(game)
+    return game
+
+def book_fingerprint(pages):
+    # Who wrote each page and what the captions said. Drawings only count by
+    # position, so books already in the database can be fingerprinted the same
+    # way without downloading their images.
+    digest = hashlib.sha256()
+    for page in pages:
+        is_text = page["type"] in ("description", "text")
+        digest.update("\x1f".join([
+            str(page["sequence"]),
+            "text" if is_text else "image",
+            page["author"] or "",
+            (page["content"] or "") if is_text else ""
+        ]).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+def export_fingerprint(date_str, book_fingerprints):
+    digest = hashlib.sha256(date_str[:10].encode("utf-8"))
+    for fp in sorted(book_fingerprints):
+        digest.update(fp.encode("utf-8"))
+    return digest.hexdigest()
+
+def fingerprint_game(game):
+    # Adds a content hash to the game and each of its books, used to detect re-imports
+    for book in game["books"]:
+        book["fingerprint"] = book_fingerprint(book["pages"])
+    game["fingerprint"] = export_fingerprint(game["date"], [b["fingerprint"] for b in game["books"]])
     return game
 
 if __name__ == "__main__":
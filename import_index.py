@@ -0,0 +1,91 @@
+from sqlalchemy import insert
+from models import db, Alias, Game, Book, Page, ImportFingerprint
+from import_bpp import book_fingerprint, export_fingerprint
+
+# Detects BPP exports (or single books) that are already in the archive, using the
+# content hashes from import_bpp.fingerprint_game. import_step1 checks them before
+# anything is uploaded; import_step2 skips known books and adds the rest to the
+# game they overlap with. Run `python import_index.py` once to fingerprint games
+# imported before this existed.
+
+
+def find_existing(game_data):
+    """
+    Returns (game_id, existing_books):
+        game_id: the game this export was already imported as, or the game its
+                 books overlap with, or None
+        existing_books: {book fingerprint: existing book id}
+    """
+    book_digests = [b["fingerprint"] for b in game_data["books"]]
+
+    # Joining Game/Book skips fingerprints of deleted rows (SQLite doesn't cascade)
+    exported = db.session.query(ImportFingerprint.game_id) \
+        .join(Game, Game.id == ImportFingerprint.game_id) \
+        .filter(ImportFingerprint.kind == 'export', ImportFingerprint.digest == game_data["fingerprint"]) \
+        .first()
+
+    books = db.session.query(ImportFingerprint.digest, ImportFingerprint.book_id, ImportFingerprint.game_id) \
+        .join(Book, Book.id == ImportFingerprint.book_id) \
+        .filter(ImportFingerprint.kind == 'book', ImportFingerprint.digest.in_(book_digests)) \
+        .all()
+
+    existing_books = {digest: book_id for digest, book_id, _ in books}
+    if exported:
+        return exported[0], existing_books
+
+    # Partial overlap: merge into the game that already holds most of these books
+    game_counts = {}
+    for _, _, game_id in books:
+        game_counts[game_id] = game_counts.get(game_id, 0) + 1
+    game_id = max(game_counts, key=game_counts.get) if game_counts else None
+    return game_id, existing_books
+
+
+def record(game_id, export_digest, books):
+    """books: (book_id, book fingerprint) for books just added to game_id."""
+    rows = [
+        {"kind": 'book', "digest": digest, "game_id": game_id, "book_id": book_id}
+        for book_id, digest in books
+    ]
+    rows.append({"kind": 'export', "digest": export_digest, "game_id": game_id, "book_id": None})
+    db.session.execute(insert(ImportFingerprint), rows)
+    db.session.commit()
+
+
+def backfill():
+    """Fingerprint every game and book imported before fingerprints were recorded."""
+    known = {book_id for (book_id,) in db.session.query(ImportFingerprint.book_id)
+             .filter(ImportFingerprint.kind == 'book')}
+
+    pages = db.session.query(Book.game_id, Page.book_id, Page.sequence, Page.type, Alias.name, Page.content_text) \
+        .join(Book, Page.book_id == Book.id) \
+        .outerjoin(Alias, Page.alias_id == Alias.id) \
+        .order_by(Book.game_id, Page.book_id, Page.sequence) \
+        .yield_per(5000)
+
+    games = {}  # game_id -> {book_id: [pages]}
+    for game_id, book_id, sequence, page_type, author, content in pages:
+        games.setdefault(game_id, {}).setdefault(book_id, []).append({
+            "sequence": sequence, "type": page_type, "author": author or "Unknown", "content": content
+        })
+
+    dates = dict(db.session.query(Game.id, Game.date).filter(Game.id.in_(list(games))).all())
+    added = 0
+    for game_id, books in games.items():
+        if all(book_id in known for book_id in books):
+            continue
+        digests = [(book_id, book_fingerprint(book_pages)) for book_id, book_pages in books.items()]
+        record(
+            game_id,
+            export_fingerprint(dates[game_id].isoformat(), [d for _, d in digests]),
+            [(book_id, d) for book_id, d in digests if book_id not in known]
+        )
+        added += 1
+    return added
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        print(f"Fingerprinted {backfill()} games.")
@@ -0,0 +1,249 @@
+import base64
+import gc
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+from flask import Blueprint, current_app, render_template, request, session, redirect, url_for, flash, copy_current_request_context
+from models import db, User, Alias, Game, Book, Page
+from b2blaze import upload_file
+from search_index import page_index
+from admin_routes import admin_required
+from alias_resolver import alias_index, create_aliases
+import archive_stats
+import db_routing
+import metrics
+import sqlite_mode
+
+# The two-step game import: step 1 parses a Broken Picturephone export and asks
+# who each author is, step 2 uploads the drawings and inserts everything on a
+# background thread.
+#
+# The parser (BeautifulSoup), image hashing and recompression (Pillow) and the
+# analytics refreshed afterwards (numpy/scipy) are imported when an import
+# runs, not when the worker starts.
+
+bp = Blueprint('import', __name__)
+
+# 3. upload logic
+@bp.route('/admin/import/step1', methods=['POST'])
+@admin_required
+def import_step1():
+    from import_bpp import process_html_content
+    import import_index
+
+    file = request.files.get('game_file')
+    if not file: return "No file", 400
+    
+    # Use your existing process_html_content function
+    html_content = file.read().decode('utf-8')
+    game_data = process_html_content(html_content)
+
+    # Has this export (or some of its books) been imported before? Check before anything is uploaded
+    existing_game_id, existing_books = import_index.find_existing(game_data)
+    new_books = [b for b in game_data['books'] if b['fingerprint'] not in existing_books]
+    if existing_game_id and not new_books:
+        flash("This export has already been imported.")
+        return redirect(url_for('public.game_detail', game_id=existing_game_id))
+
+    # Only the new books get imported, into the game the others already belong to
+    game_data['books'] = new_books
+    game_data['merge_game_id'] = existing_game_id
+    merge_game = db.session.get(Game, existing_game_id) if existing_game_id else None
+    
+    # Extract unique authors from the parsed data
+    found_authors = set()
+    for book in game_data['books']:
+        for page in book['pages']:
+            found_authors.add(page['author'])
+    
+    # Store game data in session (Careful: sessions have size limits, 
+    # for very large games, saving to a temp JSON file is better)
+    # session['temp_game_data'] = game_data
+
+    # Instead, save to a temp JSON file and store the filename in session
+    temp_filename = f"temp_game_{uuid.uuid4()}.json"
+    temp_filepath = os.path.join('instance', 'temp', temp_filename)
+    os.makedirs(os.path.dirname(temp_filepath), exist_ok=True)
+    with open(temp_filepath, 'w') as f:
+        json.dump(game_data, f)
+    session['temp_game_data_file'] = temp_filename
+    
+    # Fetch all existing users for the mapping dropdown
+    existing_users = User.query.all()
+
+    # sort users by true_name
+    existing_users = sorted(existing_users, key=lambda u: u.true_name.lower())
+
+    # Guess who each author is, so the form comes pre-filled (see alias_resolver.py)
+    matches = alias_index.resolve(found_authors)
+    
+    return render_template('admin/import_map.html', 
+                           authors=sorted(list(found_authors)), 
+                           users=existing_users,
+                           matches=matches,
+                           merge_game=merge_game,
+                           skipped_books=len(existing_books),
+                           new_books=len(new_books))
+
+@bp.route('/admin/import/step2', methods=['POST'])
+@admin_required
+def import_step2():
+    from chain_drift import chain_drift
+    from image_optimize import recompress, record_savings
+    from panel_hash import fingerprint, find_duplicate, store_fingerprints
+    import cooccurrence
+    import import_index
+
+    temp_filename = session.get('temp_game_data_file')
+    if not temp_filename: return "Session expired", 400
+    temp_filepath = os.path.join('instance', 'temp', temp_filename)
+    
+    with open(temp_filepath, 'r') as f:
+        game_data = json.load(f)
+    
+    mapping = request.form.to_dict()
+    
+    # --- PRE-PROCESS USERS (Do this in the main thread to get IDs) ---
+    # Maps author_name string to Alias.id; new users and aliases are inserted all at once
+    user_map = create_aliases(mapping)
+
+    db.session.commit() # Save the users so the background thread can see them
+
+    # 2. DEFINE THE BACKGROUND TASK
+    app = current_app._get_current_object()
+
+    @copy_current_request_context
+    def run_combined_import(data, user_id_map, filepath):
+        with app.app_context():
+            db_routing.use_background(db)
+            import_started = metrics.import_started()
+            import_failed = False
+            try:
+                # Someone may have imported the same books since step 1
+                existing_game_id, existing_books = import_index.find_existing(data)
+                data['books'] = [b for b in data['books'] if b['fingerprint'] not in existing_books]
+                if not data['books']:
+                    print("Import: every book in this export is already archived, nothing to do")
+                    return
+                merge_game_id = data.get('merge_game_id') or existing_game_id
+
+                # A. Parallel Uploads First
+                # Byte-identical drawings (already archived, or repeated in this
+                # export) reuse the existing file instead of uploading again
+                image_tasks = []
+                uploaded = {} # sha256 -> url, for repeats within this export
+                skipped = 0
+                for b in data['books']:
+                    for p in b['pages']:
+                        if p['type'] == 'drawing':
+                            # Lossless recompression first, so the stored bytes and
+                            # their fingerprint match what a re-import would produce
+                            # (the base64 text is dropped as soon as it's decoded)
+                            raw = base64.b64decode(p.pop('content').split("base64,")[-1])
+                            image_data, _, content_type = recompress(raw)
+                            phash, sha256 = fingerprint(image_data)
+                            p['fingerprint'] = (phash, sha256)
+
+                            b2_url = uploaded.get(sha256)
+                            if not b2_url:
+                                duplicate_id = find_duplicate(sha256)
+                                if duplicate_id:
+                                    b2_url = db.session.get(Page, duplicate_id).content_url
+                            if b2_url:
+                                skipped += 1
+                            else:
+                                b2_url = upload_file(image_data, 'panels', content_type=content_type)
+                                record_savings(b2_url, len(raw), len(image_data))
+                            del raw, image_data
+                            uploaded[sha256] = b2_url
+                            p['b2_url'] = b2_url
+
+                if skipped:
+                    print(f"Import: reused {skipped} duplicate drawing(s) instead of uploading")
+
+                # B. Database Insertion (Now fast since images are done)
+                # One import writes at a time; on SQLite each transaction takes the write lock up front
+                with sqlite_mode.serialized_writes(db.session):
+                    if merge_game_id:
+                        # Partial re-import: add the missing books to the existing game
+                        new_game = db.session.get(Game, merge_game_id)
+                    else:
+                        new_game = Game(date=datetime.fromisoformat(data['date']).date())
+                        db.session.add(new_game)
+                        db.session.flush()
+                    new_images = []
+                    new_books = []
+
+                    for book_data in data['books']:
+                        new_book = Book(game_id=new_game.id)
+                        db.session.add(new_book)
+                        db.session.flush()
+                        new_books.append((new_book, book_data['fingerprint']))
+
+                        for page_data in book_data['pages']:
+                            p_type = 'image' if page_data['type'] == 'drawing' else 'text'
+                            content = page_data.get('b2_url') if p_type == 'image' else page_data['content']
+
+                            new_page = Page(
+                                book_id=new_book.id,
+                                alias_id=user_id_map[page_data['author']],
+                                sequence=page_data['sequence'],
+                                type=p_type,
+                                content_text=content if p_type == 'text' else None,
+                                content_url=content if p_type == 'image' else None
+                            )
+                            db.session.add(new_page)
+                            if p_type == 'image':
+                                new_images.append((new_page, page_data['fingerprint']))
+                
+                    db.session.commit()
+
+                # Everything below runs after the write lock is released: the scans and
+                # numpy work shouldn't hold up tagging, edits and /daily. Each step only
+                # takes the lock for its own short write.
+
+                # Remember this export and its books so re-imports are caught in step 1,
+                # and fingerprint the new panels for duplicate detection and similar-panel lookups
+                with sqlite_mode.serialized_writes(db.session):
+                    import_index.record(new_game.id, data['fingerprint'], [(b.id, fp) for b, fp in new_books])
+                    store_fingerprints((p.id, phash, sha256) for p, (phash, sha256) in new_images)
+
+                # Add the new panels to the advanced search index
+                alias_users = dict(db.session.query(Alias.id, Alias.user_id)
+                                   .filter(Alias.id.in_(set(user_id_map.values()))).all())
+                page_index.add_pages(
+                    (p.id, p.book_id, p.sequence, alias_users.get(p.alias_id), new_game.date)
+                    for p, _ in new_images
+                )
+
+                # Score the new books' captions for the drift analytics
+                chain_drift.update([b.id for b, _ in new_books])
+
+                # Rescore collaborators for everyone who played in this game
+                cooccurrence.refresh_users({u for u in alias_users.values() if u is not None})
+
+                # Roll the new books into the /stats tables
+                archive_stats.flush_dirty()
+                
+                # Explicitly clean up
+                del data
+                db.session.remove()
+                gc.collect() # Force Python to release memory back to the OS
+                
+            except Exception as e:
+                print(f"ASYNC IMPORT ERROR: {e}")
+                import_failed = True
+                db.session.rollback()
+            finally:
+                metrics.import_finished(import_started, import_failed)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+
+    # 3. FIRE AND FORGET
+    thread = threading.Thread(target=run_combined_import, args=(game_data, user_map, temp_filepath))
+    thread.start()
+
+    flash("Background import started! Check back in a few seconds.")
+    return redirect(url_for('admin.admin_dashboard'))
@@ -0,0 +1,356 @@
+import argparse
+import http.client
+import http.cookiejar
+import json
+import os
+import random
+import re
+import secrets
+import statistics
+import subprocess
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+
+# Load test against a real gunicorn, with traffic mixes modeled on what the
+# site actually sees:
+#   rollover  everyone opening /daily right after midnight Eastern; each wave
+#             asks for a day with no challenge yet, so requests race to create it
+#   random    the Random button: /api/panel/random and /panel/random, over and over
+#   deep      user_detail paginated far back (big OFFSETs on the busiest players)
+#   search    text and character searches
+#   browse    home, games, books, panels
+#   mixed     all of the above
+#
+#   python synth_archive.py --reset --derived                       # a realistic archive
+#   python load_test.py --start-server --mix mixed --concurrency 32 --seconds 60
+#   python load_test.py --start-server --mix browse --import        # an import halfway through
+#
+# --start-server runs gunicorn on the database in DATABASE_URL (as wsgi:app);
+# otherwise --url points at a server that's already up, on the same database
+# (ids for the URLs are picked from it). With --import, a generated game export
+# is uploaded through the admin import, and latencies are reported separately
+# for before, during and after the import.
+
+MIXES = {
+    "rollover": {"daily": 70, "home": 20, "api_random": 10},
+    "random": {"api_random": 80, "panel_random": 20},
+    "deep": {"user_deep": 90, "user": 10},
+    "search": {"search": 60, "advanced_search": 40},
+    "browse": {"home": 25, "games": 10, "game": 15, "book": 25, "panel": 15, "user": 10},
+    "mixed": {"home": 15, "daily": 10, "api_random": 20, "panel_random": 5, "user_deep": 10, "user": 5,
+              "search": 10, "advanced_search": 5, "game": 5, "book": 10, "panel": 5},
+}
+
+SEARCH_TERMS = ["cat", "pizza", "dragon", "robot", "a", "the", "ghost taco", "zzz"]
+
+
+class Targets:
+    """Ids to build URLs from, picked from the database the server uses."""
+
+    def __init__(self, rollover_every):
+        from app import app
+        from models import db, Alias, Game, Book, Page, DailyChallenge, page_characters
+        from sqlalchemy import func
+
+        with app.app_context():
+            self.games = [g for (g,) in db.session.query(Game.id)]
+            self.books = [b for (b,) in db.session.query(Book.id)]
+            self.panels = [p for (p,) in db.session.query(Page.id).filter(Page.type == 'image')]
+            self.characters = [c for (c,) in db.session.query(page_characters.c.character_id)
+                               .group_by(page_characters.c.character_id).order_by(func.count().desc()).limit(50)]
+            # Busiest players first, with how many pages of drawings they have (20 per page)
+            self.users = [(u, max(1, n // 20)) for u, n in db.session.query(Alias.user_id, func.count(Page.id))
+                          .join(Page, Page.alias_id == Alias.id)
+                          .filter(Page.type == 'image', Alias.user_id.isnot(None))
+                          .group_by(Alias.user_id).order_by(func.count(Page.id).desc()).limit(20)]
+            first_daily = db.session.query(func.min(DailyChallenge.date)).scalar() or date.today()
+        if not self.books or not self.users:
+            raise SystemExit("The database is empty; run synth_archive.py first")
+
+        # Rollover waves go backwards from before the oldest challenge, so every wave is a new day
+        self.rollover_start = first_daily - timedelta(days=1)
+        self.rollover_every = rollover_every
+        self.started = time.monotonic()
+
+    def url(self, kind, rng):
+        if kind == "home":
+            return "/"
+        if kind == "daily":
+            wave = int((time.monotonic() - self.started) / self.rollover_every)
+            return f"/daily/{self.rollover_start - timedelta(days=wave)}"
+        if kind == "api_random":
+            return "/api/panel/random"
+        if kind == "panel_random":
+            return "/panel/random"
+        if kind == "user":
+            return f"/user/{rng.choice(self.users)[0]}"
+        if kind == "user_deep":
+            user_id, pages = rng.choice(self.users)
+            return f"/user/{user_id}?page={rng.randint(max(1, pages // 2), pages)}"
+        if kind == "search":
+            return "/search?" + urllib.parse.urlencode({"q": rng.choice(SEARCH_TERMS)})
+        if kind == "advanced_search":
+            chars = rng.sample(self.characters, min(len(self.characters), rng.randint(1, 2)))
+            return "/advanced-search?" + urllib.parse.urlencode([("whitelist_characters", c) for c in chars])
+        if kind == "games":
+            return f"/games?page={rng.randint(1, max(1, len(self.games) // 12))}"
+        if kind == "game":
+            return f"/game/{rng.choice(self.games)}"
+        if kind == "book":
+            return f"/book/{rng.choice(self.books)}"
+        if kind == "panel":
+            return f"/panel/{rng.choice(self.panels)}"
+        raise ValueError(kind)
+
+
+# --- server ---
+
+def start_server(port, workers, threads, log_path):
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    log = open(log_path, 'w')
+    proc = subprocess.Popen(
+        ['gunicorn', '--workers', str(workers), '--threads', str(threads), '--bind', f'127.0.0.1:{port}',
+         '--timeout', '120', 'wsgi:app'],
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited, see {log_path}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/api/v1/games?limit=1')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise SystemExit(f"gunicorn didn't come up, see {log_path}")
+
+
+# --- the import running alongside ---
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: text/html\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Importer(threading.Thread):
+    """Logs in as admin, uploads a generated export and waits for its game to appear."""
+
+    def __init__(self, base_url, admin_key, books, delay):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.admin_key = admin_key
+        self.books = books
+        self.delay = delay
+        self.started_at = self.finished_at = None
+        self.error = None
+
+    def run(self):
+        from synth_archive import export_html
+
+        try:
+            html = export_html(self.books, seed=random.randrange(1 << 30)).encode()
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+            opener.open(self.base_url + '/admin/auth', urllib.parse.urlencode({'admin_key': self.admin_key}).encode())
+            before = json.load(opener.open(self.base_url + '/api/v1/games?limit=1'))["data"]
+            time.sleep(self.delay)
+
+            self.started_at = time.monotonic()
+            body, content_type = _multipart({}, {'game_file': ('load_test.html', html)})
+            step1 = opener.open(urllib.request.Request(self.base_url + '/admin/import/step1', data=body,
+                                                       headers={'Content-Type': content_type})).read().decode()
+            authors = re.findall(r'<select name="([^"]+)"', step1)
+            if not authors:
+                raise RuntimeError("the import didn't get to the author mapping step (is the admin key right?)")
+            # Authors who already have a user (from an earlier run) are linked to it, the rest are new
+            users = {name: user_id for user_id, name in re.findall(r'<option value="(\d+)"(?: selected)?>([^<]*)</option>', step1)}
+            opener.open(self.base_url + '/admin/import/step2',
+                        urllib.parse.urlencode({a: users.get(a, 'NEW') for a in authors}).encode())
+
+            # The import runs in a background thread on the server; wait for its game
+            while True:
+                latest = json.load(opener.open(self.base_url + '/api/v1/games?limit=1'))["data"]
+                if latest and latest != before and len(latest[0]["book_ids"]) == self.books:
+                    break
+                time.sleep(0.2)
+            self.finished_at = time.monotonic()
+        except Exception as e:
+            self.error = e
+
+
+def temporary_admin_key():
+    from app import app
+    from models import db, AdminKey
+
+    key = secrets.token_urlsafe(16)
+    with app.app_context():
+        admin_key = AdminKey(key_name='load_test.py')
+        admin_key.set_key(key)
+        db.session.add(admin_key)
+        db.session.commit()
+        return key, admin_key.id
+
+
+def drop_admin_key(key_id):
+    from app import app
+    from models import db, AdminKey
+
+    with app.app_context():
+        AdminKey.query.filter_by(id=key_id).delete()
+        db.session.commit()
+
+
+# --- load ---
+
+def _worker(host, port, mix, targets, deadline, results, seed):
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    while time.monotonic() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        url = targets.url(kind, rng)
+        started = time.monotonic()
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            conn.request('GET', url)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            status = response.status
+        except OSError:
+            status = None
+        results.append((started, kind, status, time.monotonic() - started))
+
+
+def _percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def summarize(rows, seconds):
+    latencies = sorted(r[3] for r in rows)
+    errors = sum(1 for r in rows if r[2] is None or r[2] >= 500)
+    return {
+        "requests": len(rows),
+        "rps": len(rows) / seconds if seconds else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "errors": errors,
+        "error_rate": errors / len(rows) if rows else 0.0,
+    }
+
+
+def _print_row(label, s):
+    print(f"{label:18} {s['requests']:8} {s['rps']:8.1f} {s['p50_ms']:8.1f} {s['p95_ms']:8.1f} "
+          f"{s['p99_ms']:8.1f} {s['max_ms']:8.0f} {s['error_rate'] * 100:6.2f}%")
+
+
+def run(base_url, mix_name, concurrency, seconds, rollover_every, importer=None):
+    parsed = urllib.parse.urlparse(base_url)
+    targets = Targets(rollover_every)
+    mix = MIXES[mix_name]
+
+    results = []  # list.append is atomic, so the workers share it
+    deadline = time.monotonic() + seconds
+    started = time.monotonic()
+    if importer:
+        importer.start()
+    threads = [threading.Thread(target=_worker, args=(parsed.hostname, parsed.port or 80, mix, targets,
+                                                      deadline, results, n))
+               for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    print(f"\n{mix_name} mix, {concurrency} clients, {elapsed:.0f}s")
+    print(f"{'':18} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+    report = {"total": summarize(results, elapsed), "routes": {}, "phases": {}}
+    _print_row("total", report["total"])
+    by_kind = defaultdict(list)
+    for row in results:
+        by_kind[row[1]].append(row)
+    for kind in sorted(by_kind):
+        report["routes"][kind] = summarize(by_kind[kind], elapsed)
+        _print_row(f"  {kind}", report["routes"][kind])
+
+    if importer:
+        importer.join(timeout=max(0.0, deadline - time.monotonic()) + 120)
+        if importer.error or importer.finished_at is None:
+            print(f"\nImport failed or didn't finish: {importer.error}")
+        else:
+            print(f"\nImport took {importer.finished_at - importer.started_at:.1f}s")
+            phases = {
+                "before import": (started, importer.started_at),
+                "during import": (importer.started_at, importer.finished_at),
+                "after import": (importer.finished_at, started + elapsed),
+            }
+            for phase, (start, end) in phases.items():
+                rows = [r for r in results if start <= r[0] < end]
+                report["phases"][phase] = summarize(rows, max(end - start, 1e-9))
+                _print_row(phase, report["phases"][phase])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test with realistic traffic mixes.")
+    parser.add_argument('--mix', choices=sorted(MIXES), default='mixed')
+    parser.add_argument('--concurrency', type=int, default=16, help="simultaneous clients")
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--url', default='http://127.0.0.1:8765', help="server to test (default: the one started here)")
+    parser.add_argument('--start-server', action='store_true', help="start gunicorn on --url's port")
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn workers with --start-server")
+    parser.add_argument('--threads', type=int, default=1, help="gunicorn threads per worker with --start-server")
+    parser.add_argument('--rollover-every', type=float, default=10, help="seconds between daily rollover waves")
+    parser.add_argument('--import', dest='do_import', action='store_true', help="run an import during the load")
+    parser.add_argument('--import-books', type=int, default=12)
+    parser.add_argument('--admin-key', help="for --import against a server you started (otherwise a temporary one)")
+    parser.add_argument('--save', help="write the report as JSON")
+    args = parser.parse_args()
+
+    server = key_id = None
+    try:
+        if args.start_server:
+            port = urllib.parse.urlparse(args.url).port or 80
+            log_path = os.path.join('instance', 'load_test', 'gunicorn.log')
+            server = start_server(port, args.workers, args.threads, log_path)
+            print(f"gunicorn: {args.workers} workers x {args.threads} threads on port {port} (log: {log_path})")
+
+        importer = None
+        if args.do_import:
+            admin_key = args.admin_key
+            if not admin_key:
+                admin_key, key_id = temporary_admin_key()
+            importer = Importer(args.url.rstrip('/'), admin_key, args.import_books, delay=args.seconds / 3)
+
+        report = run(args.url.rstrip('/'), args.mix, args.concurrency, args.seconds, args.rollover_every, importer)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(report, f, indent=1)
+    finally:
+        if key_id:
+            drop_admin_key(key_id)
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import hmac
+import os
+import threading
+import time
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+
+# Prometheus metrics, served at /metrics in the text exposition format:
+#   bpp_request_duration_seconds     per endpoint and method, plus bpp_requests_total by status
+#   bpp_template_render_seconds      render_template() time per template
+#   bpp_db_pool_*                    connections checked out / in overflow, checkout waits and timeouts
+#   bpp_imports_in_progress          background imports running, with bpp_imports_total by result
+#   bpp_storage_*                    uploads, replaces and deletes in b2blaze: count, errors, bytes, time
+#
+# Under gunicorn every worker has its own counters. gunicorn.conf.py points
+# PROMETHEUS_MULTIPROC_DIR at a shared directory (instance/metrics by default),
+# each worker writes its values to mmap'd files there, and /metrics adds them up
+# across workers, so any worker can answer a scrape. Without it (python app.py)
+# the numbers are just this process's.
+#
+# Updating a metric is a dict lookup and a write to shared memory, cheap enough
+# to leave on. Labels are endpoint and template names, never URLs or ids, to
+# keep the number of series bounded. /metrics is closed by default: scrapes
+# need METRICS_TOKEN set and "Authorization: Bearer <token>", and logged-in
+# admins can look at it in the browser.
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Most pages take 5-500 ms; the slow tail is what we want to see
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+REQUEST_LATENCY = Histogram('bpp_request_duration_seconds', "Time to handle a request",
+                            ['endpoint', 'method'], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter('bpp_requests', "Requests handled", ['endpoint', 'method', 'status'])
+TEMPLATE_RENDER = Histogram('bpp_template_render_seconds', "Time in render_template()",
+                            ['template'], buckets=LATENCY_BUCKETS)
+
+POOL_CHECKED_OUT = Gauge('bpp_db_pool_checked_out', "Connections in use", ['pool'], multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge('bpp_db_pool_overflow', "Connections open beyond pool_size", ['pool'],
+                      multiprocess_mode='livesum')
+POOL_SIZE = Gauge('bpp_db_pool_size', "Configured pool size", ['pool'], multiprocess_mode='livesum')
+POOL_WAIT = Histogram('bpp_db_pool_wait_seconds', "Time waiting for a free connection", ['pool'],
+                      buckets=WAIT_BUCKETS)
+POOL_TIMEOUTS = Counter('bpp_db_pool_timeouts', "Checkouts that gave up waiting", ['pool'])
+
+IMPORTS_IN_PROGRESS = Gauge('bpp_imports_in_progress', "Background imports running", multiprocess_mode='livesum')
+IMPORTS = Counter('bpp_imports', "Background imports finished", ['result'])
+IMPORT_DURATION = Histogram('bpp_import_duration_seconds', "Time for a background import",
+                            buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+STORAGE_OPS = Counter('bpp_storage_operations', "Image storage operations", ['op', 'result'])
+STORAGE_BYTES = Counter('bpp_storage_bytes', "Bytes written to image storage", ['op'])
+STORAGE_DURATION = Histogram('bpp_storage_duration_seconds', "Time per image storage operation", ['op'],
+                             buckets=LATENCY_BUCKETS)
+
+
+# --- requests and templates ---
+
+_local = threading.local()
+
+
+def request_started():
+    _local.request_start = time.perf_counter()
+    _local.templates = []  # whatever a failed render left behind
+
+
+def request_finished(endpoint, method, status):
+    start = getattr(_local, 'request_start', None)
+    if start is None:
+        return
+    _local.request_start = None
+    endpoint = endpoint or 'none'  # 404s and the like
+    REQUEST_LATENCY.labels(endpoint, method).observe(time.perf_counter() - start)
+    REQUESTS.labels(endpoint, method, str(status)).inc()
+
+
+def template_started(name):
+    # A stack, since a template can render another through a helper
+    if not hasattr(_local, 'templates'):
+        _local.templates = []
+    _local.templates.append(time.perf_counter())
+
+
+def template_finished(name):
+    stack = getattr(_local, 'templates', None)
+    if stack:
+        TEMPLATE_RENDER.labels(name or 'string').observe(time.perf_counter() - stack.pop())
+
+
+# --- database pools (called from db_routing.TimedQueuePool) ---
+
+def pool_checkout(name, pool, waited, timed_out=False):
+    POOL_WAIT.labels(name).observe(waited)
+    if timed_out:
+        POOL_TIMEOUTS.labels(name).inc()
+    pool_changed(name, pool)
+
+
+def pool_changed(name, pool):
+    POOL_SIZE.labels(name).set(pool.size())
+    POOL_CHECKED_OUT.labels(name).set(pool.checkedout())
+    POOL_OVERFLOW.labels(name).set(max(pool.overflow(), 0))
+
+
+# --- imports and storage ---
+
+def import_started():
+    IMPORTS_IN_PROGRESS.inc()
+    return time.perf_counter()
+
+
+def import_finished(started, failed=False):
+    IMPORTS_IN_PROGRESS.dec()
+    IMPORT_DURATION.observe(time.perf_counter() - started)
+    IMPORTS.labels('error' if failed else 'ok').inc()
+
+
+@contextmanager
+def track_storage(op, size=None):
+    """Times one storage call and counts it as ok or error (and its bytes, if it worked)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STORAGE_OPS.labels(op, 'error').inc()
+        raise
+    else:
+        STORAGE_OPS.labels(op, 'ok').inc()
+        if size:
+            STORAGE_BYTES.labels(op).inc(size)
+    finally:
+        STORAGE_DURATION.labels(op).observe(time.perf_counter() - start)
+
+
+# --- exposition ---
+
+def exposition():
+    """(body, content type) for a scrape, summed across workers in multiprocess mode."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def authorized(authorization_header, is_admin=False):
+    if is_admin:
+        return True
+    return bool(METRICS_TOKEN) and hmac.compare_digest(authorization_header or '', f"Bearer {METRICS_TOKEN}")
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession picks the primary, replica or background pool (see db_routing.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Association table for Characters appearing in Pages (Many-to-Many)
 page_characters = db.Table('page_characters',
@@ -19,7 +21,7 @@ class User(db.Model):
 class Alias(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete="SET NULL"), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete="SET NULL"), nullable=True, index=True)
     pages = db.relationship('Page', backref='author_alias', lazy=True)
 
 class Game(db.Model):
@@ -49,7 +51,7 @@ class Game(db.Model):
 
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id'), nullable=False, index=True)
     # Order pages by sequence number
     pages = db.relationship('Page', backref='book', lazy='dynamic', order_by='Page.sequence', cascade="all, delete-orphan")
 
@@ -73,8 +75,8 @@ class Book(db.Model):
 
 class Page(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
-    alias_id = db.Column(db.Integer, db.ForeignKey('alias.id'), nullable=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False, index=True)
+    alias_id = db.Column(db.Integer, db.ForeignKey('alias.id'), nullable=True, index=True)
     
     sequence = db.Column(db.Integer, nullable=False) # 1, 2, 3...
     type = db.Column(db.String(10), nullable=False) # 'text' or 'image'
@@ -108,4 +110,58 @@ class DailyChallenge(db.Model):
     page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False)
     
     # Relationship to get the panel easily
-    panel = db.relationship('Page', backref='daily_challenges')
\ No newline at end of file
+    panel = db.relationship('Page', backref='daily_challenges')
+
+class Neighbor(db.Model):
+    # Precomputed top-k co-occurrence lists (see cooccurrence.py)
+    # kind='user': neighbor_id is a User, weight = shared books, weight_secondary = shared games
+    # kind='character': neighbor_id is a Character, weight = panels tagged with both
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    source_id = db.Column(db.Integer, nullable=False)
+    neighbor_id = db.Column(db.Integer, nullable=False)
+    rank = db.Column(db.Integer, nullable=False)
+    weight = db.Column(db.Integer, nullable=False)
+    weight_secondary = db.Column(db.Integer, nullable=True)
+
+    __table_args__ = (db.Index('ix_neighbor_kind_source', 'kind', 'source_id', 'rank'),)
+
+class PanelFingerprint(db.Model):
+    # Perceptual hash (dHash, 16 hex chars) and content digest of an image panel (see panel_hash.py)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id', ondelete="CASCADE"), primary_key=True)
+    phash = db.Column(db.String(16), nullable=False, index=True)
+    sha256 = db.Column(db.String(64), nullable=False, index=True)
+
+class ImportFingerprint(db.Model):
+    # Content hashes of imported exports (kind='export') and books (kind='book'), see import_index.py
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    digest = db.Column(db.String(64), nullable=False, index=True)
+    game_id = db.Column(db.Integer, db.ForeignKey('game.id', ondelete="CASCADE"), nullable=False)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete="CASCADE"), nullable=True)
+
+# Statistics rollups for /stats (see archive_stats.py). Rebuildable from the tables above.
+class DailyStat(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    games = db.Column(db.Integer, nullable=False, default=0)
+    books = db.Column(db.Integer, nullable=False, default=0)
+    text_pages = db.Column(db.Integer, nullable=False, default=0)
+    image_pages = db.Column(db.Integer, nullable=False, default=0)
+
+class UserDailyStat(db.Model):
+    user_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    panels = db.Column(db.Integer, nullable=False, default=0)
+    captions = db.Column(db.Integer, nullable=False, default=0)
+
+class CharacterStat(db.Model):
+    character_id = db.Column(db.Integer, primary_key=True)
+    appearances = db.Column(db.Integer, nullable=False, default=0, index=True)
+    first_day = db.Column(db.Date)
+    last_day = db.Column(db.Date)
+
+class BookStat(db.Model):
+    book_id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    pages = db.Column(db.Integer, nullable=False, default=0, index=True)
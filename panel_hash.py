@@ -0,0 +1,210 @@
+import hashlib
+import io
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from sqlalchemy import insert
+from models import db, Page, PanelFingerprint
+from b2blaze import open_file
+
+# Perceptual hashing of image panels, for duplicate detection at import time
+# and the /panel/<id>/similar lookup.
+#
+# Each panel gets a 64-bit dHash plus a sha256 of its bytes. The dHashes live in
+# a multi-index Hamming structure: the hash is split into four 16-bit chunks with
+# one dict per chunk, so by the pigeonhole principle every hash within distance
+# 4r+3 shares a chunk within distance r of the query. Nearest-neighbor lookups
+# are a few hundred dict probes instead of a scan over every panel.
+#
+# Run `python panel_hash.py backfill` to fingerprint panels imported before this.
+
+MAX_AGE = 600  # seconds
+HASH_SIZE = 8
+CHUNKS = 4
+CHUNK_BITS = 16
+MAX_CHUNK_RADIUS = 2  # exact results up to distance 4 * 2 + 3 = 11
+
+
+def dhash(image_bytes):
+    """64-bit difference hash of an image (transparent areas count as white)."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = img.convert('RGBA')
+        background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        gray = Image.alpha_composite(background, img).convert('L')
+        small = gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS)
+        pixels = list(small.getdata())
+
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+
+def fingerprint(image_bytes):
+    """(phash hex, sha256 hex) for the raw image bytes."""
+    return f"{dhash(image_bytes):016x}", hashlib.sha256(image_bytes).hexdigest()
+
+
+def _chunks(bits):
+    mask = (1 << CHUNK_BITS) - 1
+    return [(bits >> (i * CHUNK_BITS)) & mask for i in range(CHUNKS)]
+
+
+def _variants(chunk, radius):
+    """Every chunk value at exactly `radius` bit flips from chunk."""
+    if radius == 0:
+        return [chunk]
+    if radius == 1:
+        return [chunk ^ (1 << i) for i in range(CHUNK_BITS)]
+    return [chunk ^ (1 << i) ^ (1 << j) for i in range(CHUNK_BITS) for j in range(i + 1, CHUNK_BITS)]
+
+
+class HammingIndex:
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._hashes = {}  # page_id -> int hash
+        self._tables = [{} for _ in range(CHUNKS)]  # chunk value -> set of page_ids
+
+    def load(self):
+        rows = db.session.query(PanelFingerprint.page_id, PanelFingerprint.phash).yield_per(5000)
+        with self._lock:
+            self._hashes = {}
+            self._tables = [{} for _ in range(CHUNKS)]
+            for page_id, phash in rows:
+                self._add(page_id, int(phash, 16))
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def _add(self, page_id, bits):
+        self._hashes[page_id] = bits
+        for table, chunk in zip(self._tables, _chunks(bits)):
+            table.setdefault(chunk, set()).add(page_id)
+
+    def add(self, page_id, phash):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self.remove(page_id)
+            self._add(page_id, int(phash, 16))
+
+    def remove(self, page_id):
+        with self._lock:
+            bits = self._hashes.pop(page_id, None)
+            if bits is None:
+                return
+            for table, chunk in zip(self._tables, _chunks(bits)):
+                ids = table.get(chunk)
+                if ids:
+                    ids.discard(page_id)
+                    if not ids:
+                        del table[chunk]
+
+    def hash_of(self, page_id):
+        self.ensure_fresh()
+        return self._hashes.get(page_id)
+
+    def nearest(self, bits, k=12, max_distance=10, exclude=None):
+        """[(distance, page_id)] for the k closest panels within max_distance."""
+        self.ensure_fresh()
+        query_chunks = _chunks(bits)
+        seen = set()
+        found = []
+
+        with self._lock:
+            for radius in range(MAX_CHUNK_RADIUS + 1):
+                for table, chunk in zip(self._tables, query_chunks):
+                    for variant in _variants(chunk, radius):
+                        for page_id in table.get(variant, ()):
+                            if page_id in seen or page_id == exclude:
+                                continue
+                            seen.add(page_id)
+                            distance = (bits ^ self._hashes[page_id]).bit_count()
+                            if distance <= max_distance:
+                                found.append((distance, page_id))
+
+                # Everything within this distance is guaranteed to have been seen
+                complete_to = CHUNKS * radius + CHUNKS - 1
+                exact = sorted(f for f in found if f[0] <= complete_to)
+                if len(exact) >= k or complete_to >= max_distance:
+                    return exact[:k]
+
+        return sorted(found)[:k]
+
+
+panel_hashes = HammingIndex()
+
+
+def find_duplicate(sha256):
+    """
+    Page id of a byte-identical panel already in the archive, if any. Asks the
+    database (sha256 is indexed) rather than this worker's phash index, which
+    misses panels imported elsewhere since its last reload.
+    """
+    return db.session.query(PanelFingerprint.page_id) \
+        .filter(PanelFingerprint.sha256 == sha256) \
+        .limit(1) \
+        .scalar()
+
+
+def store_fingerprints(rows):
+    """rows: (page_id, phash, sha256) for freshly inserted panels."""
+    rows = list(rows)
+    if not rows:
+        return
+    db.session.execute(insert(PanelFingerprint), [
+        {"page_id": page_id, "phash": phash, "sha256": sha256} for page_id, phash, sha256 in rows
+    ])
+    db.session.commit()
+    for page_id, phash, _ in rows:
+        panel_hashes.add(page_id, phash)
+
+
+# --- backfill ---
+
+def _fetch_and_hash(page_id, url):
+    try:
+        with open_file(url) as f:
+            return page_id, fingerprint(f.read())
+    except Exception as e:
+        print(f"Could not fingerprint panel {page_id} ({url}): {e}")
+        return page_id, None
+
+
+def backfill(workers=8, batch_size=200):
+    """Fingerprint every image panel that doesn't have one yet."""
+    missing = db.session.query(Page.id, Page.content_url) \
+        .outerjoin(PanelFingerprint, PanelFingerprint.page_id == Page.id) \
+        .filter(Page.type == 'image', Page.content_url.isnot(None), PanelFingerprint.page_id.is_(None)) \
+        .all()
+    print(f"{len(missing)} panels to fingerprint")
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            results = pool.map(lambda row: _fetch_and_hash(*row), batch)
+            store_fingerprints(
+                (page_id, fp[0], fp[1]) for page_id, fp in results if fp is not None
+            )
+            done += len(batch)
+            print(f"{done}/{len(missing)}")
+
+
+if __name__ == "__main__":
+    from app import app
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+        with app.app_context():
+            backfill()
+    else:
+        print("Usage: python panel_hash.py backfill")
@@ -0,0 +1,215 @@
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+# On-demand sampling profiler for live requests.
+#
+# While a request is profiled, a sampler thread looks at the request thread's
+# stack every PROFILE_INTERVAL_MS (sys._current_frames(), no tracing hooks), so
+# the request runs at close to normal speed and nothing at all happens for
+# requests that aren't profiled. Jinja templates compile to Python functions
+# whose code points at the template file, so macros like panel_component show
+# up as "macro (components.html)" next to the ORM and SQL driver frames.
+#
+# A request is profiled when:
+#   - an admin adds ?_profile=1 to the URL or sends "X-Profile: 1", or
+#   - it falls in the PROFILE_SAMPLE_RATE fraction of all traffic (0 = off)
+#
+# Profiles are saved as speedscope JSON (https://www.speedscope.app) under
+# PROFILE_DIR, newest PROFILE_KEEP kept, and listed on the admin dashboard;
+# they can also be downloaded as collapsed stacks for flamegraph.pl. Each has a
+# small <id>.meta.json next to it, so the listing doesn't parse the samples.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join('instance', 'profiles'))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 5))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200))
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _frame_key(code):
+    filename = code.co_filename
+    if filename.endswith('.html'):
+        return f"{code.co_name} ({os.path.basename(filename)})", filename, code.co_firstlineno
+    if filename.startswith(_ROOT):
+        filename = os.path.relpath(filename, _ROOT)
+    elif 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]  # sqlalchemy/orm/session.py
+    return code.co_name, filename, code.co_firstlineno
+
+
+class Sampler:
+    """Samples one thread's stack on a background thread until stop()."""
+
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = interval_ms / 1000
+        self.frames = {}   # (name, file, line) -> index
+        self.samples = []  # [frame indexes, outermost first]
+        self.weights = []  # ms per sample
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break  # the thread is gone
+            stack = []
+            while frame is not None:
+                key = _frame_key(frame.f_code)
+                index = self.frames.get(key)
+                if index is None:
+                    index = self.frames[key] = len(self.frames)
+                stack.append(index)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append((now - last) * 1000)
+            last = now
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+        return self
+
+
+# --- per-request hooks (app.py) ---
+
+_local = threading.local()
+
+
+def should_profile(is_admin, flag):
+    if is_admin and flag in ('1', 'true', 'yes'):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start():
+    _local.sampler = Sampler(threading.get_ident()).start()
+
+
+def finish(endpoint, method, path, status):
+    """Stop profiling the current request (if it is) and save it; returns the profile id."""
+    sampler = getattr(_local, 'sampler', None)
+    if sampler is None:
+        return None
+    _local.sampler = None
+    sampler.stop()
+    return save(sampler, {"endpoint": endpoint or 'none', "method": method, "path": path, "status": status})
+
+
+# --- storage ---
+
+def save(sampler, meta):
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    meta = dict(meta, id=profile_id, created=datetime.now().isoformat(timespec='seconds'),
+                duration_ms=round(sampler.duration * 1000, 1), samples=len(sampler.samples))
+    frames = sorted(sampler.frames, key=sampler.frames.get)
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{meta['method']} {meta['path']} ({meta['endpoint']})",
+        "exporter": "bpp profiler",
+        "shared": {"frames": [{"name": name, "file": file, "line": line} for name, file, line in frames]},
+        "profiles": [{
+            "type": "sampled",
+            "name": meta['endpoint'],
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": meta['duration_ms'],
+            "samples": sampler.samples,
+            "weights": sampler.weights,
+        }],
+        "meta": meta,  # ignored by speedscope
+    }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    # Metadata first: a profile that's listed always has its sidecar
+    _write_json(_meta_path(profile_id), meta)
+    _write_json(_path(profile_id), document)
+    _prune()
+    return profile_id
+
+
+def _write_json(path, value):
+    tmp_path = os.path.join(PROFILE_DIR, f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def _path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{os.path.basename(profile_id)}.speedscope.json")
+
+
+def _meta_path(profile_id):
+    return os.path.join(PROFILE_DIR, f"{os.path.basename(profile_id)}.meta.json")
+
+
+def _profile_ids():
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return []
+    # Ids start with the timestamp, so newest first is reverse name order
+    return sorted((n[:-len('.speedscope.json')] for n in names if n.endswith('.speedscope.json')), reverse=True)
+
+
+def _prune():
+    for profile_id in _profile_ids()[PROFILE_KEEP:]:
+        for path in (_path(profile_id), _meta_path(profile_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker got there first
+
+
+def load(profile_id):
+    """The speedscope document, or None."""
+    try:
+        with open(_path(profile_id)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def recent(limit=20):
+    """Metadata of the newest profiles, newest first."""
+    result = []
+    for profile_id in _profile_ids()[:limit]:
+        try:
+            with open(_meta_path(profile_id)) as f:
+                result.append(json.load(f))
+        except FileNotFoundError:
+            # Saved before the sidecars existed
+            document = load(profile_id)
+            if document:
+                result.append(document["meta"])
+        except ValueError:
+            pass
+    return result
+
+
+def collapsed(document):
+    """Collapsed stacks ("outer;inner;leaf count" per line, counts in ms) for flamegraph.pl."""
+    frames = document["shared"]["frames"]
+    totals = {}
+    for profile in document["profiles"]:
+        for stack, weight in zip(profile["samples"], profile["weights"]):
+            key = ";".join(frames[i]["name"] if frames[i]["file"].endswith('.html')
+                           else f"{frames[i]['name']} ({frames[i]['file']})" for i in stack)
+            totals[key] = totals.get(key, 0) + weight
+    return "".join(f"{stack} {round(ms)}\n" for stack, ms in sorted(totals.items()))
@@ -0,0 +1,616 @@
+import os
+import random
+from datetime import datetime, timedelta
+from flask import Blueprint, render_template, request, abort, redirect, url_for, jsonify, send_from_directory, send_file, make_response
+from sqlalchemy import func, text, select
+from sqlalchemy.orm import aliased, joinedload
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Alias, Game, Book, Page, Character, DailyChallenge
+from b2blaze import STORAGE_BACKEND, LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL
+from search_index import page_index, BitmapPagination
+from game_summary import get_game_summary
+from image_cache import IMAGE_CACHE, image_cache, cached_url
+import archive_stats
+import sqlite_mode
+
+# The public archive: home, games, books, panels, users, characters, search,
+# /stats and the daily challenge.
+#
+# Analytics that need numpy/scipy (chain_drift, cooccurrence) and Pillow
+# (panel_hash) are imported inside the views that use them, so a worker only
+# loads them when those pages are first requested.
+
+bp = Blueprint('public', __name__)
+
+# Book pages ask the browser to preload this many drawings (Link header)
+PRELOAD_IMAGES = int(os.getenv("PRELOAD_IMAGES", 2))
+
+
+def _today_eastern():
+    # The daily challenge rolls over at midnight Eastern
+    import pytz
+
+    return datetime.now(pytz.timezone('America/New_York')).date()
+
+@bp.route('/')
+def index():
+    # Show the 3 most recent games at the top
+    recent_games = Game.query.order_by(Game.date.desc()).limit(4).all()
+
+    # Get today's challenge ID to pass to the JS
+    today_date = _today_eastern()
+    challenge = DailyChallenge.query.filter_by(date=today_date).first()
+    challenge_id = challenge.id if challenge else None
+
+    return render_template('index.html', recent_games=recent_games, challenge_id=challenge_id)
+
+@bp.route(LOCAL_STORAGE_URL.rstrip('/') + '/<path:filename>')
+def local_upload(filename):
+    # Only used with STORAGE_BACKEND=local; with B2 the files are served by the CDN
+    if STORAGE_BACKEND != 'local':
+        abort(404)
+    return send_from_directory(os.path.abspath(LOCAL_STORAGE_DIR), filename, max_age=31536000)
+
+@bp.route('/img/<path:path>')
+def cached_image(path):
+    # Read-through cache in front of IMAGE_SERVER_URL, see image_cache.py
+    # (off unless IMAGE_CACHE=1, so it isn't an open proxy writing to disk)
+    if not IMAGE_CACHE:
+        abort(404)
+    try:
+        local_path = image_cache.get(path)
+    except FileNotFoundError:
+        abort(404)
+    except Exception as e:
+        print(f"Image cache: could not fetch {path}: {e}")
+        abort(502)
+    return send_file(local_path, max_age=31536000)
+
+@bp.route('/search')
+def search():
+    query = request.args.get('q', '')
+    if not query:
+        return render_template('search.html')
+
+    books = []
+    characters = []
+    users = []
+    games = []
+    advanced_pages = None
+    
+    # 1. Advanced Character Search (Comma-separated)
+    if ',' in query:
+        parts = [p.strip() for p in query.split(',') if p.strip()]
+        if len(parts) > 1:
+            # For each part, find characters that match
+            matching_pages_sets = []
+            for part in parts:
+                # Find characters matching this part
+                chars_for_part = Character.query.filter(Character.name.ilike(f'%{part}%')).all()
+                
+                if not chars_for_part:
+                    # If any part finds no characters, no pages can match all parts
+                    matching_pages_sets.append(set())
+                    break
+                
+                # Find pages that contain at least one of these matching characters
+                char_ids = [c.id for c in chars_for_part]
+                pages_for_part = Page.query.filter(
+                    Page.type == 'image',
+                    Page.characters.any(Character.id.in_(char_ids))
+                ).all()
+                
+                matching_pages_sets.append(set(p.id for p in pages_for_part))
+            
+            # Find the intersection of all page sets
+            if matching_pages_sets:
+                intersected_page_ids = set.intersection(*matching_pages_sets)
+                if intersected_page_ids:
+                    # Fetch the actual Page objects for the intersection
+                    advanced_pages = Page.query.filter(Page.id.in_(intersected_page_ids)).all()
+                else:
+                    advanced_pages = [] # Empty list to indicate we tried but found nothing
+
+    # If it wasn't an advanced search, or we want to show standard results as well:
+    # We still show standard results for the FULL query string, just in case
+    
+    # 2. Books by first text page
+    books = Book.query.join(Page).filter(
+        Page.type == 'text',
+        Page.sequence == 1,
+        Page.content_text.ilike(f'%{query}%')
+    ).all()
+    
+    # 3. Characters by name
+    characters = Character.query.filter(Character.name.ilike(f'%{query}%')).all()
+    
+    # 4. Users by True Name
+    users = User.query.filter(User.true_name.ilike(f'%{query}%')).all()
+
+    # 5. Games by Title
+    games = Game.query.filter(Game.title.ilike(f'%{query}%')).all()
+
+    return render_template('search.html', 
+                            query=query, 
+                            books=books, 
+                            characters=characters, 
+                            users=users, 
+                            games=games,
+                            advanced_pages=advanced_pages)
+
+@bp.route('/advanced-search')
+def advanced_search():
+    # 1. Fetch Users and Characters for the form
+    users = User.query.order_by(User.true_name).all()
+    characters = Character.query.order_by(Character.name).all()
+
+    # 2. Extract arguments
+    start_date_str = request.args.get('start_date')
+    end_date_str = request.args.get('end_date')
+    artists = request.args.getlist('artists') # List of User IDs
+    artist_filter_type = request.args.get('artist_filter_type', 'include') # 'include' or 'exclude'
+    whitelist_chars = request.args.getlist('whitelist_characters') # List of Character IDs
+    blacklist_chars = request.args.getlist('blacklist_characters') # List of Character IDs
+
+    # Are there any active filters?
+    has_filters = any([start_date_str, end_date_str, artists, whitelist_chars, blacklist_chars])
+
+    results = None
+    if has_filters:
+        # Every filter is ANDed together and evaluated against the in-memory bitmap index
+        conditions = []
+
+        # Date Filters
+        start_date = end_date = None
+        if start_date_str:
+            try:
+                start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                pass
+        
+        if end_date_str:
+            try:
+                end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+            except ValueError:
+                pass
+
+        if start_date or end_date:
+            conditions.append(('dates', start_date, end_date))
+
+        # Artist Filters
+        if artists:
+            artist_ids = [int(a) for a in artists if a.isdigit()]
+            if artist_ids:
+                any_artist = ('or',) + tuple(('user', a) for a in artist_ids)
+                if artist_filter_type == 'include':
+                    conditions.append(any_artist)
+                elif artist_filter_type == 'exclude':
+                    # Like SQL's NOT IN, panels by unlinked aliases don't match
+                    conditions.append(('linked',))
+                    conditions.append(('not', any_artist))
+
+        # Character Filters
+        if whitelist_chars:
+            char_ids = [int(c) for c in whitelist_chars if c.isdigit()]
+            for char_id in char_ids:
+                conditions.append(('character', char_id))
+        
+        if blacklist_chars:
+            char_ids = [int(c) for c in blacklist_chars if c.isdigit()]
+            if char_ids:
+                conditions.append(('not', ('or',) + tuple(('character', c) for c in char_ids)))
+
+        bits, sort_key = page_index.search(('and',) + tuple(conditions))
+        page = request.args.get('page', 1, type=int)
+        results = BitmapPagination(page=page, per_page=20, error_out=False, bits=bits, sort_key=sort_key)
+
+    # Build query args excluding 'page' for pagination links
+    query_args = {}
+    for key in request.args.keys():
+        if key != 'page':
+            # use getlist to preserve multiple values for artists, characters, etc.
+            vals = request.args.getlist(key)
+            query_args[key] = vals if len(vals) > 1 else vals[0]
+
+    return render_template('advanced_search.html', 
+                           users=users, 
+                           characters=characters, 
+                           results=results,
+                           query_args=query_args)
+
+@bp.route('/panel/<int:page_id>')
+def panel_detail(page_id):
+    panel = Page.query.get_or_404(page_id)
+    # The admin tagging widget fetches characters from /api/characters/suggest as you type
+    return render_template('panel_detail.html', panel=panel)
+
+@bp.route('/panel/<int:page_id>/similar')
+def panel_similar(page_id):
+    from panel_hash import panel_hashes
+
+    bits = panel_hashes.hash_of(page_id)
+    if bits is None:
+        return jsonify({"error": "Panel has no fingerprint"}), 404
+
+    limit = min(request.args.get('limit', 12, type=int), 50)
+    matches = panel_hashes.nearest(bits, k=limit, exclude=page_id)
+
+    urls = dict(db.session.query(Page.id, Page.content_url)
+                .filter(Page.id.in_([page_id for _, page_id in matches])).all())
+    return jsonify({
+        "id": page_id,
+        "similar": [
+            {"id": match_id, "distance": distance, "content_url": cached_url(urls[match_id])}
+            for distance, match_id in matches if match_id in urls
+        ]
+    })
+
+@bp.route('/panel/random')
+def panel_random():
+    # This just loads the empty "shell" page
+    return render_template('panel_random.html')
+
+@bp.route('/game/<int:game_id>')
+def game_detail(game_id):
+    game = Game.query.get_or_404(game_id)
+    summary = get_game_summary(game.id)
+    return render_template('game_detail.html', game=game, participants=summary['participants'])
+
+@bp.route('/games')
+def game_list():
+    page = request.args.get('page', 1, type=int)
+    sort = request.args.get('sort', 'desc') # 'desc' for newest first, 'asc' for oldest
+    
+    query = Game.query
+    if sort == 'asc':
+        query = query.order_by(Game.date.asc())
+    else:
+        query = query.order_by(Game.date.desc())
+        
+    pagination = query.paginate(page=page, per_page=12, error_out=False)
+    games = pagination.items
+    
+    return render_template('game_list.html', 
+                           games=games, 
+                           pagination=pagination, 
+                           current_sort=sort)
+
+def _book_bundle(book_id):
+    """
+    A book's pages with their authors, users and tags, the book and its game,
+    and the previous/next book in the game, in one query. Returns
+    (book, pages, prev_id, next_id), or None if there's no such book.
+    """
+    game_id = select(Book.game_id).where(Book.id == book_id).scalar_subquery()
+    siblings = aliased(Book)
+    prev_id = select(func.max(siblings.id)).where(siblings.game_id == game_id, siblings.id < book_id).scalar_subquery()
+    next_id = select(func.min(siblings.id)).where(siblings.game_id == game_id, siblings.id > book_id).scalar_subquery()
+
+    rows = db.session.query(Page, prev_id, next_id) \
+        .filter(Page.book_id == book_id) \
+        .options(joinedload(Page.author_alias).joinedload(Alias.user),
+                 joinedload(Page.characters),
+                 joinedload(Page.book).joinedload(Book.game)) \
+        .order_by(Page.sequence) \
+        .all()
+    if not rows:
+        # A book without pages (or no book at all): nothing to join from
+        book = db.session.get(Book, book_id)
+        if book is None:
+            return None
+        return book, [], None, None
+    pages = [row[0] for row in rows]
+    return pages[0].book, pages, rows[0][1], rows[0][2]
+
+@bp.route('/book/<int:book_id>')
+def book_detail(book_id):
+    from chain_drift import chain_drift
+
+    bundle = _book_bundle(book_id)
+    if bundle is None:
+        abort(404)
+    book, pages, prev_id, next_id = bundle
+    drift = chain_drift.book_drift(book.id)
+    preview_text = next((p.content_text for p in pages if p.type == 'text'), "Unnamed book.")
+    preview_image = next((p.content_url for p in pages if p.type == 'image'), None)
+    response = make_response(render_template('book_detail.html', book=book, pages=pages, drift=drift,
+                                             preview_text=preview_text, preview_image=preview_image,
+                                             prev_id=prev_id, next_id=next_id))
+
+    # Start on the first drawings before the HTML is parsed, and fetch the
+    # neighbouring books while this one is read, so clicking through is instant
+    links = [f'<{cached_url(p.content_url)}>; rel=preload; as=image'
+             for p in pages if p.type == 'image' and p.content_url][:PRELOAD_IMAGES]
+    links += [f'<{url_for("public.book_detail", book_id=i)}>; rel=prefetch' for i in (next_id, prev_id) if i]
+    if links:
+        response.headers['Link'] = ', '.join(links)
+    return response
+
+@bp.route('/users')
+def user_list():
+    page = request.args.get('page', 1, type=int)
+
+    random_page = (
+        select(Page.content_url.label("page_image_url"), Alias.user_id)
+        .select_from(Alias)
+        .join(Page, Page.alias_id == Alias.id)
+        .where(
+            Alias.user_id == User.id,
+            Page.type == "image"
+        )
+        .order_by(func.random())
+        .limit(1)
+    )
+
+    if db.engine.dialect.name == 'postgresql':
+        random_page = random_page.lateral()
+        query = (
+            db.session.query(
+                User,
+                func.count(Page.id).label('page_count'),
+                random_page.c.page_image_url
+            )
+            .join(Alias, User.id == Alias.user_id)
+            .join(Page, Alias.id == Page.alias_id)
+            .join(random_page, random_page.c.user_id == Alias.user_id)
+            .group_by(User.id, random_page.c.page_image_url)
+        )
+    else:
+        # No LATERAL on SQLite: page through the counts first, then pick a
+        # random panel for just the users on this page (one windowed query)
+        query = (
+            db.session.query(User, func.count(Page.id).label('page_count'))
+            .join(Alias, User.id == Alias.user_id)
+            .join(Page, Alias.id == Page.alias_id)
+            .group_by(User.id)
+        )
+
+    pagination = (
+        query
+        .filter(Page.type == "image")
+        .order_by(func.count(Page.id).desc())
+        .paginate(page=page, per_page=18, error_out=False)
+    )
+
+    if db.engine.dialect.name != 'postgresql' and pagination.items:
+        ranked = (
+            select(Alias.user_id, Page.content_url,
+                   func.row_number().over(partition_by=Alias.user_id, order_by=func.random()).label('n'))
+            .join(Page, Page.alias_id == Alias.id)
+            .where(Alias.user_id.in_([u.id for u, _ in pagination.items]), Page.type == "image")
+            .subquery()
+        )
+        images = dict(db.session.execute(select(ranked.c.user_id, ranked.c.content_url).where(ranked.c.n == 1)).all())
+        pagination.items = [(u, count, images.get(u.id)) for u, count in pagination.items]
+
+    users = pagination.items
+    return render_template('user_list.html', users=users, pagination=pagination)
+
+@bp.route('/user/<int:user_id>')
+def user_detail(user_id):
+    from chain_drift import chain_drift
+    import cooccurrence
+
+    user = User.query.get_or_404(user_id)
+    
+    # 1. Get the current page from the query string (default to 1)
+    page_num = request.args.get('page', 1, type=int)
+    
+    # 2. Define how many drawings to show per page
+    per_page = 20 
+    
+    # 3. Get alias IDs
+    aliases_ids = [a.id for a in user.aliases]
+    
+    # 4. Change .all() to .paginate()
+    # This returns a Pagination object instead of a list
+    drawings_pagination = Page.query\
+        .join(Book, Page.book_id == Book.id)\
+        .join(Game, Book.game_id == Game.id)\
+        .filter(
+            Page.alias_id.in_(aliases_ids), 
+            Page.type == 'image'
+        )\
+        .order_by(Game.date.desc(), Page.book_id.desc(), Page.sequence.desc())\
+        .paginate(page=page_num, per_page=per_page, error_out=False)
+    
+    fidelity = chain_drift.user_fidelity(user.id)
+    collaborators = cooccurrence.frequent_collaborators(user.id)
+
+    return render_template('user_detail.html', 
+                           user=user, 
+                           drawings=drawings_pagination,
+                           fidelity=fidelity,
+                           collaborators=collaborators)
+
+@bp.route('/stats')
+def stats():
+    return render_template('stats.html', stats=archive_stats.dashboard())
+
+@bp.route('/characters')
+def character_list():
+    page = request.args.get('page', 1, type=int)
+    # Sort by count
+    pagination = db.session.query(
+        Character, 
+        func.count(Page.id).label('appearance_count')
+    ).outerjoin(Character.pages) \
+     .group_by(Character.id) \
+     .order_by(func.count(Page.id).desc()) \
+     .paginate(
+        page=page, per_page=18, error_out=False
+    )
+    characters = pagination.items
+    return render_template('character_list.html', characters=characters, pagination=pagination)
+
+@bp.route('/character/<int:char_id>')
+def character_detail(char_id):
+    character = Character.query.get_or_404(char_id)
+    
+    # Get current page from URL
+    page_num = request.args.get('page', 1, type=int)
+    per_page = 15  # 5 columns x 3 rows looks great on a grid
+    
+    pagination = Page.query\
+        .join(Book, Page.book_id == Book.id)\
+        .join(Game, Book.game_id == Game.id)\
+        .filter(
+            Page.characters.any(id=char_id), 
+            Page.type == 'image'
+        )\
+        .order_by(Game.date.desc(), Page.book_id.desc(), Page.sequence.desc())\
+        .paginate(page=page_num, per_page=per_page, error_out=False)
+        
+    return render_template('character_detail.html', 
+                           character=character, 
+                           drawings=pagination)
+
+@bp.route('/character/<int:char_id>/statistics')
+def character_statistics(char_id):
+    import cooccurrence
+
+    character = Character.query.get_or_404(char_id)
+    
+    # Query 1: Appearances over time
+    appearances = db.session.query(Page.id, Game.date)\
+        .join(Book, Page.book_id == Book.id)\
+        .join(Game, Book.game_id == Game.id)\
+        .filter(Page.characters.any(id=char_id), Page.type == 'image')\
+        .all()
+    
+    monthly_counts = {}
+    yearly_counts = {}
+    for _, game_date in appearances:
+        if game_date:
+            month_key = game_date.strftime('%Y-%m') # "YYYY-MM"
+            year_key = game_date.strftime('%Y')     # "YYYY"
+            monthly_counts[month_key] = monthly_counts.get(month_key, 0) + 1
+            yearly_counts[year_key] = yearly_counts.get(year_key, 0) + 1
+            
+    # Sort chronologically
+    monthly_counts = {k: v for k, v in sorted(monthly_counts.items())}
+    yearly_counts = {k: v for k, v in sorted(yearly_counts.items())}
+    
+    # Query 2: Artist Distribution
+    artist_data = db.session.query(User.id, User.true_name, func.count(Page.id).label('count'))\
+        .join(Alias, Alias.user_id == User.id)\
+        .join(Page, Page.alias_id == Alias.id)\
+        .filter(Page.characters.any(id=char_id), Page.type == 'image')\
+        .group_by(User.id, User.true_name)\
+        .order_by(func.count(Page.id).desc())\
+        .all()
+        
+    artist_counts = [{"id": row[0], "name": row[1], "count": row[2]} for row in artist_data]
+
+    # Precomputed by cooccurrence.py
+    appears_with = cooccurrence.often_appears_with(char_id)
+    
+    return render_template('character_statistics.html',
+                           character=character,
+                           monthly_counts=monthly_counts,
+                           yearly_counts=yearly_counts,
+                           artist_counts=artist_counts,
+                           appears_with=appears_with)
+
+@bp.route('/daily')
+@bp.route('/daily/<date_str>')
+def daily_game(date_str=None):
+    today_date = _today_eastern()
+
+    target_date = today_date
+    if date_str:
+        try:
+            target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            target_date = today_date
+            
+        if target_date > today_date:
+            return redirect(url_for('public.daily_game'))
+
+    # 1. Check if the challenge already exists
+    challenge = DailyChallenge.query.filter_by(date=target_date).first()
+
+    if not challenge:
+        candidates = """
+            from page p
+            join alias a on a.id = p.alias_id
+            where p.type = 'image'
+            and a.user_id is not null
+            and not exists (
+                select 1
+                from page_characters pc
+                where pc.page_id = p.id
+                and (pc.character_id = 164 or pc.character_id = 169 or pc.character_id = 253)
+            )
+        """
+
+        if db.engine.dialect.name == 'postgresql':
+            # 2. Convert date to a float between -1 and 1 for Postgres setseed()
+            # We use the integer timestamp and a bit of math to generate a seed
+            seed_value = int(target_date.strftime('%Y%m%d')) / 100000000.0
+
+            # 3. Set the seed in the current database session
+            db.session.execute(text(f"SELECT setseed({seed_value})"))
+
+            # 4. Use the DB to pick the panel.
+            # Because the seed is set, func.random() will return the SAME panel for this date.
+            daily_panel = db.session.execute(text(f"select p.* {candidates} order by random() limit 1")).fetchone()
+        else:
+            # No setseed() elsewhere (SQLite): a date-seeded RNG picks the offset instead
+            count = db.session.execute(text(f"select count(*) {candidates}")).scalar()
+            daily_panel = None
+            if count:
+                offset = random.Random(int(target_date.strftime('%Y%m%d'))).randrange(count)
+                daily_panel = db.session.execute(
+                    text(f"select p.* {candidates} order by p.id limit 1 offset :offset"), {"offset": offset}
+                ).fetchone()
+
+        if daily_panel:
+            new_challenge = DailyChallenge(date=target_date, page_id=daily_panel.id)
+            # At rollover every visitor races to insert the same row; on SQLite a read-then-write
+            # transaction would fail with "database is locked" rather than wait for the winner
+            with sqlite_mode.serialized_writes(db.session):
+                db.session.add(new_challenge)
+                try:
+                    db.session.commit()
+                    challenge = new_challenge
+                except IntegrityError:
+                    # Someone else's request finished a millisecond faster
+                    db.session.rollback()
+                    challenge = DailyChallenge.query.filter_by(date=target_date).first()
+
+    # 3. Use the stored panel
+    panel = challenge.panel
+    
+    # Get the first text prompt for the clue
+    first_prompt = Page.query.filter_by(book_id=panel.book_id, type='text')\
+                             .order_by(Page.sequence.asc()).first()
+    
+    correct_author_id = panel.author_alias.user_id if panel.author_alias else None
+
+    authors = db.session.query(User.id, User.true_name).all()
+    # sort authors by true_name
+    authors = sorted(authors, key=lambda u: u.true_name.lower())
+    
+    # Navigation logic
+    prev_date = target_date - timedelta(days=1)
+    next_date = target_date + timedelta(days=1) if target_date < today_date else None
+    
+    # History for calendar (14-day window centered around target_date)
+    window_end = min(today_date, target_date + timedelta(days=6))
+    history_dates = [(window_end - timedelta(days=i)) for i in range(14)]
+    recent_challenges = DailyChallenge.query.filter(DailyChallenge.date.in_(history_dates)).all()
+    history_dict = {c.date.strftime('%Y-%m-%d'): c.id for c in recent_challenges}
+    
+    return render_template('daily.html', 
+                           panel=panel, 
+                           challenge=challenge,
+                           correct_author_id=correct_author_id,
+                           first_prompt=first_prompt, 
+                           authors=authors,
+                           target_date=target_date,
+                           prev_date=prev_date,
+                           next_date=next_date,
+                           history_dates=[d.strftime('%Y-%m-%d') for d in history_dates],
+                           history_dict=history_dict,
+                           today_date=today_date)
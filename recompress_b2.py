@@ -0,0 +1,113 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from app import app
+from models import db, Page, Character, Game, PanelFingerprint
+from b2blaze import filename_from_url, open_file, replace_b2_file
+from image_optimize import SAVINGS_LOG, recompress, record_savings, total_savings
+
+# Losslessly recompresses images already in storage, in place (same file names, so no
+# URLs change). Progress is the savings log itself: files listed there are
+# skipped, so an interrupted run picks up where it stopped.
+#
+#   python recompress_b2.py --workers 4
+#   python recompress_b2.py --dry-run --limit 50
+
+
+def _done_urls():
+    done = set()
+    if os.path.exists(SAVINGS_LOG):
+        with open(SAVINGS_LOG) as f:
+            for line in f:
+                done.add(json.loads(line)["name"])
+    return done
+
+
+def _all_image_urls():
+    urls = set()
+    urls.update(u for (u,) in db.session.query(Page.content_url).filter(Page.type == 'image'))
+    urls.update(u for (u,) in db.session.query(Character.image_url))
+    urls.update(u for (u,) in db.session.query(Game.override_image_url))
+    # Only our own storage; characters may point at placeholder images elsewhere
+    return sorted(u for u in urls if u and filename_from_url(u))
+
+
+def _process(url, dry_run):
+    try:
+        with open_file(url) as f:
+            original = f.read()
+        # Keep the PNG format so existing URLs stay valid
+        data, _, content_type = recompress(original, allow_format_change=False)
+        if len(data) < len(original) and not dry_run:
+            if not replace_b2_file(url, data, content_type=content_type):
+                return url, None
+        # Only the digest goes back, so finished results don't pin image bytes
+        return url, (len(original), len(data), hashlib.sha256(data).hexdigest())
+    except Exception as e:
+        print(f"Failed {url}: {e}")
+        return url, None
+
+
+def _run(pool, urls, window, dry_run):
+    """
+    (url, result) as files finish, with at most `window` submitted at a time,
+    so a large bucket doesn't queue every download up front.
+    """
+    urls = iter(urls)
+    pending = set()
+    while True:
+        for url in urls:
+            pending.add(pool.submit(_process, url, dry_run))
+            if len(pending) >= window:
+                break
+        if not pending:
+            return
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Losslessly recompress stored images.")
+    parser.add_argument('--workers', type=int, default=4, help="parallel downloads/uploads")
+    parser.add_argument('--limit', type=int, default=None, help="stop after this many files")
+    parser.add_argument('--dry-run', action='store_true', help="report savings without uploading")
+    args = parser.parse_args()
+
+    with app.app_context():
+        done = _done_urls()
+        todo = [u for u in _all_image_urls() if u not in done][:args.limit]
+        print(f"{len(todo)} images to process ({len(done)} already done)")
+
+        saved = 0
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for i, (url, result) in enumerate(_run(pool, todo, args.workers * 2, args.dry_run), start=1):
+                if result is None:
+                    continue
+                before, after, sha256 = result
+                saved += before - after
+                if args.dry_run:
+                    continue
+
+                record_savings(url, before, after)
+                if after < before:
+                    # The bytes changed, so the stored content digest has to follow
+                    page_ids = [p for (p,) in db.session.query(Page.id).filter(Page.content_url == url)]
+                    if page_ids:
+                        PanelFingerprint.query.filter(PanelFingerprint.page_id.in_(page_ids)) \
+                            .update({"sha256": sha256}, synchronize_session=False)
+                        db.session.commit()
+
+                if i % 50 == 0:
+                    print(f"{i}/{len(todo)}, {saved / 1024 / 1024:.1f} MB saved so far")
+
+        print(f"Done: {saved / 1024 / 1024:.1f} MB saved this run")
+        files, before, after = total_savings()
+        if files:
+            print(f"All time: {files} files, {before / 1024 / 1024:.1f} MB -> {after / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
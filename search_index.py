@@ -0,0 +1,227 @@
+import heapq
+import threading
+import time
+from flask_sqlalchemy.pagination import Pagination
+from models import db, Alias, Game, Book, Page, page_characters
+
+# Per-process bitmap index behind /advanced-search.
+# Every image panel is one bit (bit n == Page.id n) in a plain Python int, and we
+# keep one such bitset per character, per artist (User) and per game date. Boolean
+# filters become &, | and ~ on those ints, so the database is only asked for the
+# 20 panels on the current results page.
+#
+# Tagging and imports update the bitsets in place (see app.py). Anything else that
+# can move a panel between buckets (editing an alias or a game date in the admin
+# tables) just marks the index stale, and it reloads on the next search. Other
+# gunicorn workers catch up through the periodic reload.
+
+MAX_AGE = 600  # seconds
+
+
+def bits_to_ids(bits):
+    """Return the positions of the set bits, lowest first."""
+    ids = []
+    binary = bin(bits)[:1:-1]  # least significant bit first, without the '0b'
+    pos = binary.find('1')
+    while pos != -1:
+        ids.append(pos)
+        pos = binary.find('1', pos + 1)
+    return ids
+
+
+class PageBitmapIndex:
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self.images = 0          # every image panel with an author alias
+        self.linked = 0          # ...whose alias is linked to a user
+        self.by_character = {}   # character_id -> bits
+        self.by_user = {}        # user_id -> bits
+        self.by_date = {}        # game date -> bits
+        self._sort_keys = {}     # page_id -> (date ordinal, book_id, sequence)
+        self._page_user = {}     # page_id -> user_id
+        self._page_date = {}     # page_id -> game date
+
+    # --- building ---
+
+    def load(self):
+        """Rebuild every bitset with two streaming queries."""
+        rows = db.session.query(Page.id, Page.book_id, Page.sequence, Alias.user_id, Game.date) \
+            .join(Alias, Page.alias_id == Alias.id) \
+            .join(Book, Page.book_id == Book.id) \
+            .join(Game, Book.game_id == Game.id) \
+            .filter(Page.type == 'image') \
+            .yield_per(5000)
+
+        tags = db.session.query(page_characters.c.page_id, page_characters.c.character_id) \
+            .join(Page, Page.id == page_characters.c.page_id) \
+            .filter(Page.type == 'image') \
+            .yield_per(5000)
+
+        with self._lock:
+            self.images = 0
+            self.linked = 0
+            self.by_character = {}
+            self.by_user = {}
+            self.by_date = {}
+            self._sort_keys = {}
+            self._page_user = {}
+            self._page_date = {}
+
+            for page_id, book_id, sequence, user_id, game_date in rows:
+                self._add_page(page_id, book_id, sequence, user_id, game_date)
+
+            for page_id, char_id in tags:
+                if page_id in self._sort_keys:
+                    self.by_character[char_id] = self.by_character.get(char_id, 0) | (1 << page_id)
+
+            self._loaded_at = time.monotonic()
+
+    def ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _add_page(self, page_id, book_id, sequence, user_id, game_date):
+        bit = 1 << page_id
+        self.images |= bit
+        if user_id is not None:
+            self.linked |= bit
+            self.by_user[user_id] = self.by_user.get(user_id, 0) | bit
+        self.by_date[game_date] = self.by_date.get(game_date, 0) | bit
+        self._sort_keys[page_id] = (game_date.toordinal(), book_id, sequence)
+        self._page_user[page_id] = user_id
+        self._page_date[page_id] = game_date
+
+    # --- incremental updates (called from app.py) ---
+
+    def add_pages(self, rows, tags=()):
+        """rows: (page_id, book_id, sequence, user_id, game_date) for new image panels."""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            for row in rows:
+                self._add_page(*row)
+            for page_id, char_id in tags:
+                self.tag(page_id, char_id)
+
+    def remove_page(self, page_id):
+        if self._loaded_at is None or page_id not in self._sort_keys:
+            return
+        with self._lock:
+            mask = ~(1 << page_id)
+            self.images &= mask
+            self.linked &= mask
+            user_id = self._page_user.pop(page_id, None)
+            if user_id in self.by_user:
+                self.by_user[user_id] &= mask
+            game_date = self._page_date.pop(page_id, None)
+            if game_date in self.by_date:
+                self.by_date[game_date] &= mask
+            for char_id in self.by_character:
+                self.by_character[char_id] &= mask
+            del self._sort_keys[page_id]
+
+    def tag(self, page_id, char_id):
+        if self._loaded_at is None or page_id is None or char_id is None:
+            return
+        with self._lock:
+            if page_id in self._sort_keys:
+                self.by_character[char_id] = self.by_character.get(char_id, 0) | (1 << page_id)
+
+    def untag(self, page_id, char_id):
+        if self._loaded_at is None or page_id is None or char_id is None:
+            return
+        with self._lock:
+            if char_id in self.by_character:
+                self.by_character[char_id] &= ~(1 << page_id)
+
+    def remove_character(self, char_id):
+        with self._lock:
+            self.by_character.pop(char_id, None)
+
+    # --- evaluation ---
+
+    def evaluate(self, expr):
+        """
+        Evaluate a filter expression to a bitset of matching image panels.
+
+        expr is a nested tuple:
+            ('all',)                      every image panel
+            ('character', id)             panels tagged with the character
+            ('user', id)                  panels drawn by the user
+            ('linked',)                   panels whose alias has a user
+            ('dates', start, end)         game date within [start, end], either may be None
+            ('and', e1, e2, ...)
+            ('or', e1, e2, ...)
+            ('not', e)                    relative to every image panel
+        """
+        op = expr[0]
+        if op == 'all':
+            return self.images
+        if op == 'character':
+            return self.by_character.get(expr[1], 0)
+        if op == 'user':
+            return self.by_user.get(expr[1], 0)
+        if op == 'linked':
+            return self.linked
+        if op == 'dates':
+            start, end = expr[1], expr[2]
+            bits = 0
+            for game_date, date_bits in self.by_date.items():
+                if (start is None or game_date >= start) and (end is None or game_date <= end):
+                    bits |= date_bits
+            return bits
+        if op == 'and':
+            bits = self.images
+            for sub in expr[1:]:
+                bits &= self.evaluate(sub)
+                if not bits:
+                    break
+            return bits
+        if op == 'or':
+            bits = 0
+            for sub in expr[1:]:
+                bits |= self.evaluate(sub)
+            return bits
+        if op == 'not':
+            return self.images & ~self.evaluate(expr[1])
+        raise ValueError(f"Unknown search operator: {op}")
+
+    def search(self, expr):
+        """Return (bits, sort key function) for expr."""
+        self.ensure_fresh()
+        with self._lock:
+            bits = self.evaluate(expr)
+        sort_keys = self._sort_keys
+        return bits, lambda page_id: sort_keys.get(page_id, (0, 0, 0))
+
+
+class BitmapPagination(Pagination):
+    """
+    Paginates the set bits of a PageBitmapIndex result, newest game first.
+    Only the current page of ids is sorted and fetched from the database.
+    """
+
+    def _query_items(self):
+        ids = bits_to_ids(self._query_args["bits"])
+        sort_key = self._query_args["sort_key"]
+        self._total = len(ids)
+
+        # Game date desc, book desc, sequence desc, like the SQL version did
+        end = self._query_offset + self.per_page
+        page_ids = heapq.nlargest(end, ids, key=sort_key)[self._query_offset:end]
+        if not page_ids:
+            return []
+
+        pages = {p.id: p for p in Page.query.filter(Page.id.in_(page_ids)).all()}
+        return [pages[i] for i in page_ids if i in pages]
+
+    def _query_count(self):
+        return self._total
+
+
+page_index = PageBitmapIndex()
@@ -0,0 +1,66 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Settings for running the archive on SQLite (no DATABASE_URL). app.py applies
+# them to every new connection and begins transactions through begin_sql().
+#
+# WAL lets readers (every gunicorn worker) keep reading while one writer
+# commits; synchronous=NORMAL is safe under WAL and saves an fsync per commit.
+# SQLite still allows only one writer at a time, and a transaction that starts
+# out reading and then writes can fail straight away with "database is locked"
+# if someone else wrote in the meantime (busy_timeout doesn't help there).
+# Writers that read first (the import's inserts, the analytics rollups, the
+# /daily rollover insert) run inside serialized_writes(): their transactions
+# start with BEGIN IMMEDIATE, which takes the write lock up front and waits up
+# to busy_timeout for it. Keep the blocks to the writes themselves; any slow
+# reading or scoring goes before them, so other writers don't queue behind it.
+#
+# Benchmark: python bench_sqlite.py --db brokenpicturephone.db
+
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", 256))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", 64))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 10000))
+
+PRAGMAS = [
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("mmap_size", SQLITE_MMAP_MB * 1024 * 1024),
+    ("cache_size", -SQLITE_CACHE_MB * 1024),  # negative = KiB rather than pages
+    ("busy_timeout", SQLITE_BUSY_TIMEOUT_MS),
+    ("foreign_keys", "ON"),
+]
+
+_writer = threading.local()
+_write_lock = threading.Lock()
+
+
+def apply_pragmas(dbapi_connection):
+    # Let SQLAlchemy's begin event issue BEGIN instead of the sqlite3 module,
+    # which otherwise only begins before the first INSERT/UPDATE/DELETE
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def begin_sql():
+    return "BEGIN IMMEDIATE" if getattr(_writer, "active", False) else "BEGIN"
+
+
+@contextmanager
+def serialized_writes(session):
+    """
+    Transactions begun in this thread inside the block take the write lock up
+    front. Also keeps a second import in this process from interleaving with
+    the first. The session's current transaction (if any) is committed first,
+    so nothing read before the block is mistaken for part of it.
+    """
+    session.commit()
+    with _write_lock:
+        _writer.active = True
+        try:
+            yield
+        finally:
+            _writer.active = False
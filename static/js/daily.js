@@ -0,0 +1,235 @@
+// 1. Setup Variables from the page (data-* attributes on this script tag)
+const dailySettings = document.currentScript.dataset;
+const correctUserId = dailySettings.correctUserId;
+const challengeId = Number(dailySettings.challengeId);
+const storageKey = `daily_game_${challengeId}`;
+
+let guesses = 0;
+let gameOver = false;
+let pastGuesses = [];
+
+// Load saved state if exists
+window.addEventListener('DOMContentLoaded', () => {
+    // --- CALENDAR COLOR CODING ---
+    document.querySelectorAll('.history-day').forEach(el => {
+        const id = el.dataset.challengeId;
+        if(id) {
+            const storageKeyForPast = `daily_game_${id}`;
+            const data = localStorage.getItem(storageKeyForPast);
+
+            if(data) {
+                try {
+                    const parsed = JSON.parse(data);
+                    if(parsed.gameOver) {
+                        el.classList.remove('btn-outline-secondary', 'btn-secondary');
+                        if(parsed.won) {
+                            el.classList.add('btn-success');
+                        } else {
+                            el.classList.add('btn-danger');
+                        }
+                    } else if(parsed.guesses > 0) {
+                        el.classList.remove('btn-outline-secondary', 'btn-secondary');
+                        el.classList.add('btn-warning');
+                    }
+                } catch(e) {
+                    console.error("Failed parsing localStorage for history", e);
+                }
+            }
+        }
+    });
+
+    const savedState = localStorage.getItem(storageKey);
+    if (savedState) {
+        const data = JSON.parse(savedState);
+        guesses = data.guesses;
+        gameOver = data.gameOver;
+        const won = data.won;
+
+        if (data.pastGuesses) {
+            pastGuesses = data.pastGuesses;
+        }
+
+        if (gameOver) {
+            // If they finished previously, jump straight to the end
+            endGame(won, false); // false means "don't save again"
+            renderPastGuesses();
+        } else {
+            // If they were mid-game, restore their guess count
+            updateUI();
+            renderPastGuesses();
+
+            // Remove already guessed options
+            const selectEl = document.getElementById('author-search');
+            pastGuesses.forEach(pg => {
+                const opt = Array.from(selectEl.options).find(o => o.value === String(pg.id));
+                if (opt) selectEl.removeChild(opt);
+            });
+        }
+    }
+});
+
+function renderPastGuesses() {
+    if (pastGuesses.length > 0) {
+        document.getElementById('previous-guesses-area').classList.remove('d-none');
+        const list = document.getElementById('previous-guesses-list');
+        list.innerHTML = '';
+        pastGuesses.forEach(g => {
+            const li = document.createElement('li');
+            if (g.id == correctUserId) {
+                li.className = 'list-group-item text-success py-1';
+                li.innerText = '✅ ' + g.name;
+            } else {
+                li.className = 'list-group-item text-danger py-1';
+                li.innerText = '❌ ' + g.name;
+            }
+            list.appendChild(li);
+        });
+    }
+}
+
+// 2. The Main Guess Function
+function makeGuess() {
+    if (gameOver) return;
+
+    const selectEl = document.getElementById('author-search');
+
+    // Handle TomSelect or standard Select
+    const val = selectEl.tomselect ? selectEl.tomselect.getValue() : selectEl.value;
+
+    if (!val) {
+        alert("Please select an artist!");
+        return;
+    }
+
+    const optionEl = Array.from(selectEl.options).find(o => o.value === String(val));
+    const authorName = optionEl ? optionEl.text : "Unknown Artist";
+
+    if (val == correctUserId) {
+        pastGuesses.push({ id: val, name: authorName });
+        renderPastGuesses();
+        endGame(true);
+    } else {
+        pastGuesses.push({ id: val, name: authorName });
+        guesses++;
+        updateUI();
+        renderPastGuesses();
+        saveState(false);
+
+        if (selectEl.tomselect) selectEl.tomselect.clear();
+
+        if (optionEl) selectEl.removeChild(optionEl);
+
+        if (guesses >= 6) {
+            endGame(false);
+        }
+    }
+}
+
+function saveState(won) {
+    const state = {
+        guesses: guesses,
+        gameOver: gameOver,
+        won: won,
+        pastGuesses: pastGuesses
+    };
+    localStorage.setItem(storageKey, JSON.stringify(state));
+}
+
+// 3. Update Clues and Guesses Left
+function updateUI() {
+    // Update "Guesses Left" text
+    document.getElementById('guesses-left').innerText = 6 - guesses;
+
+    // Reveal Clues based on guess count
+    if (guesses >= 1) document.getElementById('clue-1').classList.remove('d-none');
+    if (guesses >= 2) document.getElementById('clue-2').classList.remove('d-none');
+    if (guesses >= 3) document.getElementById('clue-3').classList.remove('d-none');
+    if (guesses >= 4) document.getElementById('clue-4').classList.remove('d-none');
+    if (guesses >= 5) document.getElementById('clue-5').classList.remove('d-none');
+
+    // Start reducing blur slightly with each wrong guess (optional touch)
+    const img = document.getElementById('daily-image');
+    if (guesses < 6) {
+        img.style.filter = `blur(${15 - (guesses * 3)}px)`;
+    }
+}
+
+// 4. Handle Win/Loss
+function endGame(won, shouldSave = true) {
+    gameOver = true;
+    if (shouldSave) saveState(won);
+
+    // Unblur completely
+    document.getElementById('daily-image').style.filter = "none";
+
+    // Hide input, show results
+    document.getElementById('game-input-area').classList.add('d-none');
+    const overArea = document.getElementById('game-over-area');
+    overArea.classList.remove('d-none');
+
+    const alertBox = document.getElementById('status-alert');
+    const title = document.getElementById('status-title');
+
+    if (won) {
+        const currentStreak = updateStreak();
+
+        title.innerText = "🎉 Correct!";
+        alertBox.classList.add('alert-success');
+
+        const streakHtml = `<div class="mt-2"><span class="badge bg-warning text-dark">🔥 ${currentStreak} Day Streak</span></div>`;
+        alertBox.insertAdjacentHTML('beforeend', streakHtml);
+    } else {
+        localStorage.setItem(streakKey, JSON.stringify({ count: 0, lastId: challengeId }));
+        title.innerText = "❌ Game Over";
+        alertBox.classList.add('alert-danger');
+        // Reveal all clues on loss
+        for (let i = 1; i <= 4; i++) {
+            document.getElementById('clue-' + i).classList.remove('d-none');
+        }
+    }
+}
+
+// 5. Share Logic
+function shareScore() {
+    let squares = "";
+    for (let i = 0; i < 6; i++) {
+        if (gameOver && i === guesses && !document.getElementById('status-alert').classList.contains('alert-danger')) {
+            squares += "🟩";
+        } else if (i < guesses) {
+            squares += "🟥";
+        } else {
+            squares += "⬜";
+        }
+    }
+    const text = `BPP-dle #${challengeId}\n||${squares}||\n${window.location.href}`;
+    navigator.clipboard.writeText(text).then(() => alert("Copied to clipboard!"));
+}
+
+// 6. Streak Tracking
+const streakKey = 'daily_panel_streak';
+
+function updateStreak() {
+    let streakData = JSON.parse(localStorage.getItem(streakKey)) || { count: 0, lastId: 0 };
+
+    // 1. Check if they already counted today (prevents double-counting on refresh)
+    if (streakData.lastId === challengeId) return streakData.count;
+
+    // 2. Check if the last win was "Yesterday" (ChallengeID - 1)
+    // If they missed a day, the ID won't match, so reset to 1.
+    if (streakData.lastId === challengeId - 1) {
+        streakData.count += 1;
+    } else {
+        streakData.count = 1;
+    }
+
+    // 3. Update the storage
+    streakData.lastId = challengeId;
+    localStorage.setItem(streakKey, JSON.stringify(streakData));
+
+    return streakData.count;
+}
+
+function getDisplayStreak() {
+    const streakData = JSON.parse(localStorage.getItem(streakKey));
+    return streakData ? streakData.count : 0;
+}
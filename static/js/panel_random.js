@@ -0,0 +1,38 @@
+async function fetchRandomPanel(untagged = false) {
+    const display = document.getElementById('panel-display');
+    const loader = document.getElementById('loading-spinner');
+
+    display.classList.add('d-none');
+    loader.classList.remove('d-none');
+
+    // Construct the URL with the filter parameter
+    let url = '/api/panel/random';
+    if (untagged) {
+        url += '?untagged=true';
+    }
+
+    try {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error('Not found');
+
+        const data = await response.json();
+
+        document.getElementById('panel-img').classList.add('img-loading');
+        document.getElementById('panel-img').src = data.content_url;
+        document.getElementById('panel-author').innerHTML = `<a href="/user/${data.author_id}">${data.author}</a>`;
+        document.getElementById('panel-prompt').innerText = `"${data.prompt}"`;
+        document.getElementById('view-book-btn').href = `/book/${data.book_id}`;
+        document.getElementById('view-game-btn').href = `/game/${data.game_id}`;
+
+        window.currentPanelId = data.id;
+
+        display.classList.remove('d-none');
+        loader.classList.add('d-none');
+    } catch (err) {
+        loader.classList.add('d-none');
+        alert(untagged ? "No untagged panels left! (Or an error occurred)" : "Error fetching panel.");
+    }
+}
+
+// Load a standard random panel on start
+window.onload = () => fetchRandomPanel(false);
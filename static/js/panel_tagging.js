@@ -0,0 +1,195 @@
+// URLs and the panel come from data-* attributes on this script tag
+const tagging = document.currentScript.dataset;
+const maxRecentTags = 5;
+
+document.addEventListener("DOMContentLoaded", function () {
+    // Options come from the typeahead endpoint, already ranked by the server
+    const tomSelect = new TomSelect("#char-search", {
+        create: false,
+        valueField: "id",
+        labelField: "name",
+        searchField: ["name"],
+        // Keep the server's ranking instead of re-filtering on the client
+        score: () => () => 1,
+        shouldLoad: (query) => query.length > 0,
+        load: function (query, callback) {
+            fetch(tagging.suggestUrl + "?q=" + encodeURIComponent(query))
+                .then(response => response.json())
+                .then(data => {
+                    // With a constant score every option left over from an earlier
+                    // search would match too; drop them (the selected one is kept)
+                    this.clearOptions();
+                    callback(data.results);
+                })
+                .catch(() => callback());
+        }
+    });
+
+    const STORAGE_KEY = 'bpp_recent_characters';
+
+    function addCharToUI(id, name, imgSrc) {
+        const noCharsMsg = document.getElementById('no-chars-msg');
+        if (noCharsMsg) noCharsMsg.remove();
+
+        if (document.getElementById(`char-tag-${id}`)) return;
+
+        // Use the passed imgSrc, or a default if null
+        const finalImg = imgSrc || '/static/default_char.png';
+
+        const html = `
+            <div class="list-group-item d-flex justify-content-between align-items-center" id="char-tag-${id}">
+                <div class="d-flex align-items-center text-dark flex-grow-1">
+                    <img src="${finalImg}" class="rounded-circle me-3" style="width: 40px; height: 40px; object-fit: cover;">
+                    <div>
+                        <div class="fw-bold">${name}</div>
+                        <small class="text-success">Just added!</small>
+                    </div>
+                </div>
+            </div>`;
+        document.getElementById('character-list-container').insertAdjacentHTML('afterbegin', html);
+    }
+
+    async function silentTag(id, name, imgSrc) {
+        // 1. Update UI immediately (Optimistic)
+        addCharToUI(id, name, imgSrc);
+
+        const formData = new FormData();
+        formData.append('page_id', tagging.pageId);
+        formData.append('character_id', id);
+
+        try {
+            const response = await fetch(tagging.tagUrl, {
+                method: "POST",
+                body: formData,
+                headers: {
+                    'X-Requested-With': 'XMLHttpRequest'
+                }
+            });
+
+            if (response.ok) {
+                // 2. Success: Finalize the state
+                saveToRecent(id, name, imgSrc);
+                renderRecentTags();
+                tomSelect.clear();
+            } else {
+                // 3. Server error: Remove from UI and alert user
+                // (the character may have been deleted, so drop it from recents too)
+                removeFromRecent(id);
+                renderRecentTags();
+                handleTagError(id, "Server rejected the tag.");
+            }
+        } catch (error) {
+            // 4. Network error: Remove from UI
+            handleTagError(id, "Network error. Tag not saved.");
+            console.error("Network error:", error);
+        }
+    }
+
+    // Helper to undo the UI change
+    function handleTagError(id, message) {
+        const el = document.getElementById(`char-tag-${id}`);
+        if (el) {
+            el.style.transition = "all 0.4s";
+            el.style.backgroundColor = "#f8d7da"; // Red flash for error
+            setTimeout(() => {
+                el.remove();
+                alert(message);
+            }, 500);
+        }
+    }
+
+    function saveToRecent(id, name, imgSrc) {
+        let recent = JSON.parse(localStorage.getItem(STORAGE_KEY) || '[]');
+        recent = recent.filter(item => item.id !== id);
+        recent.unshift({ id, name, imgSrc }); // Store the image URL
+        localStorage.setItem(STORAGE_KEY, JSON.stringify(recent.slice(0, maxRecentTags)));
+    }
+
+    function removeFromRecent(id) {
+        let recent = JSON.parse(localStorage.getItem(STORAGE_KEY) || '[]');
+        recent = recent.filter(item => String(item.id) !== String(id));
+        localStorage.setItem(STORAGE_KEY, JSON.stringify(recent));
+    }
+
+    function renderRecentTags() {
+        // Characters that no longer exist are pruned when the server rejects the tag
+        const filteredRecent = JSON.parse(localStorage.getItem(STORAGE_KEY) || '[]');
+        const recentList = document.getElementById('recent-tags-list');
+
+        if (filteredRecent.length === 0) {
+            document.getElementById('recent-tags-container').classList.add('d-none');
+            return;
+        }
+
+        document.getElementById('recent-tags-container').classList.remove('d-none');
+        recentList.innerHTML = '';
+
+        filteredRecent.forEach(char => {
+            const btn = document.createElement('button');
+            btn.type = 'button';
+            btn.className = 'btn btn-sm btn-outline-secondary py-0 px-2 small';
+            btn.innerText = `+ ${char.name}`;
+            // Pass the stored image URL back into the tag function
+            btn.onclick = () => silentTag(char.id, char.name, char.imgSrc);
+            recentList.appendChild(btn);
+        });
+    }
+
+    const tagForm = document.querySelector(`form[action="${tagging.tagUrl}"]`);
+
+    tagForm.onsubmit = (e) => {
+        e.preventDefault();
+        const id = tomSelect.getValue();
+
+        // Check if an ID is actually selected
+        if (!id) return;
+
+        // 1. Look up the option the typeahead loaded for this ID
+        const option = tomSelect.options[id];
+
+        // 2. Safely grab the name and image
+        const name = option ? option.name : "Unknown";
+        const imgSrc = option ? option.imgSrc : '/static/default_char.png';
+
+        silentTag(id, name, imgSrc);
+    };
+
+    const createForm = document.querySelector(`form[action="${tagging.createUrl}"]`);
+
+    createForm.onsubmit = async (e) => {
+        e.preventDefault();
+
+        const formData = new FormData(createForm);
+        const nameInput = createForm.querySelector('input[name="name"]');
+
+        try {
+            const response = await fetch(tagging.createUrl, {
+                method: "POST",
+                body: formData,
+                headers: { "X-Requested-With": "XMLHttpRequest" }
+            });
+
+            if (response.ok) {
+                const data = await response.json();
+
+                console.log("Character created:", data);
+
+                const imgSrc = data.imgSrc || tagging.panelImg;
+
+                // 1. Add to the list on the right
+                addCharToUI(data.id, data.name, imgSrc);
+
+                // 2. Save to recent tags and re-render them
+                saveToRecent(data.id, data.name, imgSrc);
+                renderRecentTags();
+
+                // 3. Clear the input
+                nameInput.value = '';
+            }
+        } catch (error) {
+            console.error("Error creating character:", error);
+        }
+    };
+
+    renderRecentTags();
+});
@@ -0,0 +1,284 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+from collections import defaultdict
+
+# Renders the public pages of the archive to static HTML, so nginx or a CDN can
+# serve anonymous traffic without touching Python or the database.
+#
+# Pages are rendered through the real routes and templates (a Flask test client
+# per worker process). Every page gets a content hash built from the rows it
+# shows; the hashes are kept in <out>/.manifest.json, and a rerun only renders
+# pages whose hash changed, so after an import only that game's books, panels,
+# players and characters are redone. Editing a template rebuilds everything.
+# The paginated lists are cheap and always re-rendered.
+#
+#   python static_export.py --out static_site --workers 8
+#
+# Layout: /game/5 -> game/5/index.html, /user/3?page=2 -> user/3/page-2.html.
+# nginx, falling back to the app for anything not exported:
+#
+#   location / {
+#       root /srv/static_site;
+#       set $static $uri/index.html;
+#       if ($arg_page ~ "^[0-9]+$") { set $static $uri/page-$arg_page.html; }
+#       if ($args !~ "^(page=[0-9]+)?$") { set $static /nonexistent; }
+#       if ($request_method != GET) { set $static /nonexistent; }
+#       if ($cookie_session) { set $static /nonexistent; }  # logged in admins
+#       try_files $static @app;
+#   }
+
+SITE_VERSION = 1  # bump to force a full rebuild
+MANIFEST = '.manifest.json'
+
+GAMES_PER_PAGE = 12       # game_list
+USERS_PER_PAGE = 18       # user_list
+CHARACTERS_PER_PAGE = 18  # character_list
+USER_DRAWINGS_PER_PAGE = 20
+CHARACTER_DRAWINGS_PER_PAGE = 15
+
+
+def _digest(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def output_path(url):
+    """'/user/3?page=2' -> 'user/3/page-2.html'"""
+    path, _, query = url.partition('?')
+    path = path.strip('/')
+    page = int(query.split('=', 1)[1]) if query.startswith('page=') else 1
+    name = 'index.html' if page == 1 else f'page-{page}.html'
+    return os.path.join(path, name) if path else name
+
+
+def _template_version(root):
+    h = hashlib.sha1(str(SITE_VERSION).encode())
+    for dirpath, _, filenames in sorted(os.walk(os.path.join(root, 'templates'))):
+        for name in sorted(filenames):
+            with open(os.path.join(dirpath, name), 'rb') as f:
+                h.update(name.encode())
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def collect_pages():
+    """
+    [(url, content hash or None)] for every exported page. None means "always render".
+    Must run inside an app context.
+    """
+    from models import db, User, Alias, Game, Book, Page, Character, Neighbor, page_characters
+    from chain_drift import chain_drift
+
+    users = {u_id: name for u_id, name in db.session.query(User.id, User.true_name)}
+    aliases = {a_id: (name, user_id, users.get(user_id))
+               for a_id, name, user_id in db.session.query(Alias.id, Alias.name, Alias.user_id)}
+    characters = {c_id: (name, image_url)
+                  for c_id, name, image_url in db.session.query(Character.id, Character.name, Character.image_url)}
+    games = {g.id: (g.date.isoformat() if g.date else None, g.title, g.override_image_url, g.video_link)
+             for g in db.session.query(Game.id, Game.date, Game.title, Game.override_image_url, Game.video_link)}
+    book_game = dict(db.session.query(Book.id, Book.game_id))
+
+    tags = defaultdict(list)
+    for page_id, char_id in db.session.query(page_characters.c.page_id, page_characters.c.character_id):
+        tags[page_id].append(char_id)
+
+    neighbors = defaultdict(list)
+    for kind, source_id, neighbor_id, weight, second in db.session.query(
+            Neighbor.kind, Neighbor.source_id, Neighbor.neighbor_id, Neighbor.weight, Neighbor.weight_secondary) \
+            .order_by(Neighbor.kind, Neighbor.source_id, Neighbor.rank):
+        name = users.get(neighbor_id) if kind == 'user' else characters.get(neighbor_id)
+        neighbors[kind, source_id].append((neighbor_id, name, weight, second))
+
+    # One signature per panel: what it shows, who drew it, who's tagged on it
+    page_sig = {}
+    book_pages = defaultdict(list)
+    alias_pages = defaultdict(list)
+    char_pages = defaultdict(list)
+    rows = db.session.query(Page.id, Page.book_id, Page.sequence, Page.type, Page.content_url,
+                            Page.content_text, Page.alias_id).order_by(Page.book_id, Page.sequence)
+    for page_id, book_id, sequence, page_type, url, text, alias_id in rows:
+        char_sigs = sorted((c, characters.get(c)) for c in tags.get(page_id, ()))
+        page_sig[page_id] = _digest(page_id, sequence, page_type, url, text, aliases.get(alias_id), char_sigs)
+        book_pages[book_id].append(page_id)
+        if page_type == 'image':
+            alias_pages[alias_id].append(page_id)
+            for c in tags.get(page_id, ()):
+                char_pages[c].append(page_id)
+
+    page_book = {p: b for b, pages in book_pages.items() for p in pages}
+    book_sig = {}
+    for book_id, game_id in book_game.items():
+        book_sig[book_id] = _digest(games.get(game_id), [page_sig[p] for p in book_pages[book_id]],
+                                    sorted(chain_drift.book_drift(book_id).items()))
+    game_books = defaultdict(list)
+    for book_id, game_id in sorted(book_game.items()):
+        game_books[game_id].append(book_id)
+
+    pages = []
+
+    for game_id, game in games.items():
+        pages.append((f'/game/{game_id}', _digest(game, [book_sig[b] for b in game_books[game_id]])))
+
+    # Books link (and prefetch) the previous and next book in their game
+    for books in game_books.values():
+        for i, book_id in enumerate(books):
+            pages.append((f'/book/{book_id}', _digest(book_sig[book_id], books[i - 1] if i else None,
+                                                      books[i + 1] if i + 1 < len(books) else None)))
+
+    # Panels show their book's context (title, game, prompt)
+    for page_id, sig in page_sig.items():
+        pages.append((f'/panel/{page_id}', _digest(sig, book_sig[page_book[page_id]])))
+
+    def paged(base, page_ids, per_page, extra):
+        """Detail pages with a paginated drawing grid."""
+        # Panel grids are ordered newest game first, so sign them in that order
+        page_ids = sorted(page_ids, key=lambda p: (games[book_game[page_book[p]]][0] or '', page_book[p]),
+                          reverse=True)
+        sig = _digest(extra, [(page_sig[p], games[book_game[page_book[p]]]) for p in page_ids])
+        count = max(1, math.ceil(len(page_ids) / per_page))
+        pages.append((base, sig))
+        for n in range(2, count + 1):
+            pages.append((f'{base}?page={n}', sig))
+
+    user_aliases = defaultdict(list)
+    for alias_id, (name, user_id, _) in aliases.items():
+        user_aliases[user_id].append((alias_id, name))
+    for user_id, name in users.items():
+        drawn = [p for alias_id, _ in user_aliases[user_id] for p in alias_pages[alias_id]]
+        extra = (name, sorted(user_aliases[user_id]), chain_drift.user_fidelity(user_id),
+                 neighbors.get(('user', user_id)))
+        paged(f'/user/{user_id}', drawn, USER_DRAWINGS_PER_PAGE, extra)
+
+    for char_id, character in characters.items():
+        extra = (character, neighbors.get(('character', char_id)))
+        paged(f'/character/{char_id}', char_pages[char_id], CHARACTER_DRAWINGS_PER_PAGE, extra)
+        pages.append((f'/character/{char_id}/statistics', _digest(extra, [
+            (page_sig[p], games[book_game[page_book[p]]]) for p in char_pages[char_id]
+        ])))
+
+    # The lists depend on global ordering, so they're just re-rendered every run
+    user_count = db.session.query(Alias.user_id).join(Page, Page.alias_id == Alias.id) \
+        .filter(Page.type == 'image', Alias.user_id.isnot(None)).distinct().count()
+    for base, total, per_page in (('/games', len(games), GAMES_PER_PAGE),
+                                  ('/users', user_count, USERS_PER_PAGE),
+                                  ('/characters', len(characters), CHARACTERS_PER_PAGE)):
+        pages.append((base, None))
+        for n in range(2, max(1, math.ceil(total / per_page)) + 1):
+            pages.append((f'{base}?page={n}', None))
+    pages.append(('/', None))
+
+    return pages
+
+
+# --- rendering (worker processes) ---
+
+_client = None
+_out = None
+_base_url = None
+
+
+def _init_worker(out, base_url):
+    global _client, _out, _base_url
+    from app import app
+    from models import db
+
+    # Connections inherited from the parent must not be shared across processes
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    _client = app.test_client()
+    _out = out
+    _base_url = base_url
+
+
+def _render(url):
+    try:
+        response = _client.get(url, base_url=_base_url)
+    except Exception as e:
+        print(f"Failed {url}: {e}")
+        return url, 500
+    if response.status_code != 200:
+        return url, response.status_code
+
+    path = os.path.join(_out, output_path(url))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(response.get_data())
+    os.replace(tmp_path, path)
+    return url, 200
+
+
+def export_site(out, workers=None, base_url='http://localhost', full=False):
+    from app import app
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    manifest_path = os.path.join(out, MANIFEST)
+    manifest = {}
+    if not full and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    version = _template_version(root)
+    old_pages = manifest.get("pages", {}) if manifest.get("version") == version else {}
+
+    with app.app_context():
+        pages = collect_pages()
+
+    todo = [
+        url for url, sig in pages
+        if sig is None or old_pages.get(url) != sig or not os.path.exists(os.path.join(out, output_path(url)))
+    ]
+    print(f"{len(pages)} pages, {len(todo)} to render")
+
+    os.makedirs(out, exist_ok=True)
+    shutil.copytree(os.path.join(root, 'static'), os.path.join(out, 'static'), dirs_exist_ok=True)
+
+    signatures = dict(pages)
+    rendered = set()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(out, base_url)) as pool:
+        for i, (url, status) in enumerate(pool.imap_unordered(_render, todo, chunksize=16), start=1):
+            if status == 200:
+                rendered.add(url)
+            else:
+                print(f"{url}: HTTP {status}")
+            if i % 500 == 0:
+                print(f"{i}/{len(todo)}")
+
+    # Record hashes only for what's on disk and current, so failures are retried
+    failed = len(todo) - len(rendered)
+    attempted = set(todo)
+    new_pages = {
+        url: sig for url, sig in signatures.items()
+        if sig is not None and (url in rendered or url not in attempted)
+    }
+
+    # Drop pages for deleted games/books/panels/etc.
+    current = set(signatures)
+    for url in old_pages:
+        if url not in current:
+            try:
+                os.remove(os.path.join(out, output_path(url)))
+            except OSError:
+                pass
+
+    with open(manifest_path, 'w') as f:
+        json.dump({"version": version, "pages": new_pages}, f)
+
+    print(f"Rendered {len(todo) - failed} pages, {failed} failed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the archive as static HTML.")
+    parser.add_argument('--out', default='static_site', help="output directory")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--base-url', default='http://localhost', help="public URL, for absolute links")
+    parser.add_argument('--full', action='store_true', help="ignore the manifest and render everything")
+    args = parser.parse_args()
+
+    raise SystemExit(1 if export_site(args.out, args.workers, args.base_url, args.full) else 0)
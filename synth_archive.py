@@ -0,0 +1,222 @@
+import argparse
+import base64
+import io
+import itertools
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+from archive_export import FORMAT_VERSION
+
+# Synthetic archives at realistic sizes, for benchmarking (see bench_routes.py).
+#
+# Writes records in the archive_export format and loads them through its bulk
+# importer, so 100k pages take seconds rather than the minutes seed.py-style
+# ORM inserts would. The shape follows real games: a game a week, each with
+# a set of players who pass every book around in turn (text, drawing, text, ...),
+# a few regulars who play most weeks, and characters whose popularity falls
+# off as a power law.
+#
+#   python synth_archive.py --reset --games 500 --books 5000 --pages 100000 --characters 1000 --derived
+#   python synth_archive.py --pages 20000 --out synth.ndjson   # just write the file
+#   python synth_archive.py --export-html game.html             # a Broken Picturephone export to import
+#
+# Everything is seeded (--seed), so the same arguments give the same archive.
+
+WORDS = ("cat dog pizza alien robot wizard banana guitar tiger frisbee castle dragon ghost taco "
+         "spaceship pirate volcano penguin sandwich skeleton unicorn toaster ninja cowboy moon").split()
+VERBS = "eating riding fighting hugging painting chasing juggling launching melting summoning".split()
+
+
+def _zipf_weights(n, exponent):
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def _spread(total, buckets, rng):
+    """Split `total` into `buckets` positive parts that vary a bit, like real games do."""
+    weights = [rng.uniform(0.6, 1.4) for _ in range(buckets)]
+    scale = total / sum(weights)
+    parts = [max(1, int(w * scale)) for w in weights]
+    for i in range(total - sum(parts)):
+        parts[i % buckets] += 1
+    while sum(parts) > total:
+        i = max(range(buckets), key=parts.__getitem__)
+        parts[i] -= 1
+    return parts
+
+
+def _caption(rng):
+    return f"A {rng.choice(WORDS)} {rng.choice(VERBS)} a {rng.choice(WORDS)}"
+
+
+def generate(games=500, books=5000, pages=100000, users=300, characters=1000,
+             tag_rate=0.3, exponent=1.1, seed=0, start=date(2016, 1, 1)):
+    """Yield archive records (dicts) in the order archive_export.import_records wants them."""
+    if not 0 < games <= books <= pages:
+        raise ValueError("Need 0 < games <= books <= pages")
+    rng = random.Random(seed)
+    yield {"type": "meta", "version": FORMAT_VERSION}
+
+    aliases = {}  # user id -> alias ids
+    alias_id = 0
+    for user_id in range(1, users + 1):
+        yield {"type": "user", "id": user_id, "true_name": f"Player {user_id}", "description": None}
+        aliases[user_id] = []
+        for n in range(1 + (rng.random() < 0.3)):
+            alias_id += 1
+            aliases[user_id].append(alias_id)
+            yield {"type": "alias", "id": alias_id, "name": f"player{user_id}" + (f"_{n}" if n else ""),
+                   "user_id": user_id}
+
+    for char_id in range(1, characters + 1):
+        yield {"type": "character", "id": char_id, "name": f"Character {char_id}", "description": None,
+               "image_url": f"https://placehold.co/100x100?text=C{char_id}"}
+
+    # Regulars play most weeks; characters are tagged Zipf-style (popularity not in id order)
+    user_ids = list(range(1, users + 1))
+    user_weights = _zipf_weights(users, exponent)
+    char_ids = list(range(1, characters + 1))
+    rng.shuffle(char_ids)
+    char_weights = _zipf_weights(characters, exponent)
+
+    books_per_game = _spread(books, games, rng)
+    pages_per_book = iter(_spread(pages, books, rng))
+    book_id = page_id = 0
+
+    for game_id in range(1, games + 1):
+        n_books = books_per_game[game_id - 1]
+        # Usually one book per player; everyone passes books around in turn
+        players = set()
+        while len(players) < min(max(n_books, 3), users):
+            players.update(rng.choices(user_ids, cum_weights=user_weights, k=1))
+        seats = [rng.choice(aliases[u]) for u in sorted(players)]
+        rng.shuffle(seats)
+
+        game_books = []
+        for b in range(n_books):
+            book_id += 1
+            book_pages = []
+            for sequence in range(1, next(pages_per_book) + 1):
+                page_id += 1
+                is_image = sequence % 2 == 0
+                tags = []
+                if is_image and rng.random() < tag_rate:
+                    tags = sorted(set(char_ids[i] for i in rng.choices(range(characters), cum_weights=char_weights,
+                                                                      k=1 + (rng.random() < 0.2))))
+                book_pages.append({
+                    "id": page_id,
+                    "sequence": sequence,
+                    "type": 'image' if is_image else 'text',
+                    "alias_id": seats[(b + sequence - 1) % len(seats)],
+                    "content_text": None if is_image else _caption(rng),
+                    "content_url": f"https://placehold.co/400x300?text=Panel+{page_id}" if is_image else None,
+                    "characters": tags,
+                })
+            game_books.append({"id": book_id, "pages": book_pages})
+
+        yield {"type": "game", "id": game_id, "date": start + timedelta(weeks=game_id - 1),
+               "title": None if rng.random() < 0.8 else f"Special Game {game_id}",
+               "override_image_url": None, "video_link": None, "books": game_books}
+
+
+def _drawing(rng, width=500, height=375):
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.randint(10, 40)):
+        points = [(rng.randint(0, width), rng.randint(0, height)) for _ in range(rng.randint(2, 6))]
+        color = tuple(rng.randint(0, 255) for _ in range(3)) + (255,)
+        draw.line(points, fill=color, width=rng.randint(2, 8))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def export_html(books=12, pages_per_book=12, players=None, seed=0, day=None):
+    """A Broken Picturephone export page, as import_bpp.process_html_content reads it."""
+    rng = random.Random(seed)
+    players = players or [f"player{n}" for n in range(1, books + 1)]
+    day = day or date.today()
+    out = [f"<html><body><h1>Broken Picturephone - {day.strftime('%m/%d/%Y')}, 20:00</h1>"]
+    for b in range(books):
+        out.append(f"<article><h2>Book {b + 1}</h2>")
+        for sequence in range(1, pages_per_book + 1):
+            author = players[(b + sequence - 1) % len(players)]
+            out.append(f"<section><h3>Page {sequence}, {author}:</h3>")
+            if sequence % 2:
+                out.append(f"<h4>{_caption(rng)} (seed {seed})</h4>")
+            else:
+                out.append(f'<img src="data:image/png;base64,{_drawing(rng)}">')
+            out.append("</section>")
+        out.append("</article>")
+    out.append("</body></html>")
+    return "\n".join(out)
+
+
+def rebuild_derived():
+    import archive_stats
+    import cooccurrence
+    import import_index
+    from chain_drift import chain_drift
+
+    for name, step in (("stats rollups", archive_stats.rebuild), ("chain drift", chain_drift.rebuild),
+                       ("collaborators", cooccurrence.refresh_users),
+                       ("co-appearing characters", cooccurrence.refresh_characters),
+                       ("import fingerprints", import_index.backfill)):
+        started = time.perf_counter()
+        step()
+        print(f"  {name}: {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic archive.")
+    parser.add_argument('--games', type=int, default=500)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--pages', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--characters', type=int, default=1000)
+    parser.add_argument('--tag-rate', type=float, default=0.3, help="share of drawings with characters tagged")
+    parser.add_argument('--exponent', type=float, default=1.1, help="power-law exponent for players and characters")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="write NDJSON here ('-' for stdout) instead of loading the database")
+    parser.add_argument('--reset', action='store_true', help="drop and recreate every table first")
+    parser.add_argument('--derived', action='store_true', help="rebuild stats, drift and collaborator tables after")
+    parser.add_argument('--export-html', help="write a game export (HTML with drawings) here instead")
+    parser.add_argument('--export-books', type=int, default=12, help="books in --export-html")
+    args = parser.parse_args()
+
+    if args.export_html:
+        with open(args.export_html, 'w') as f:
+            f.write(export_html(args.export_books, seed=args.seed))
+        return
+
+    records = generate(args.games, args.books, args.pages, args.users, args.characters,
+                       args.tag_rate, args.exponent, args.seed)
+
+    if args.out:
+        out = sys.stdout.buffer if args.out == '-' else open(args.out, 'wb')
+        with out:
+            for record in records:
+                out.write((json.dumps(record, default=str) + "\n").encode('utf-8'))
+        return
+
+    from app import app
+    from models import db
+    import archive_export
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+            db.create_all()
+        started = time.perf_counter()
+        counts = archive_export.import_records(json.dumps(r, default=str) for r in records)
+        print(", ".join(f"{count} {table}" for table, count in counts.items()),
+              f"in {time.perf_counter() - started:.1f}s")
+        if args.derived:
+            rebuild_derived()
+
+
+if __name__ == "__main__":
+    main()
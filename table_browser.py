@@ -0,0 +1,136 @@
+from sqlalchemy import Text, func, select, tuple_
+from sqlalchemy.schema import CreateIndex
+from models import db
+from api_v1 import ApiError, encode_cursor, decode_cursor
+
+# The admin table view (/admin/table/<name>), built to stay fast on the full
+# page table:
+#   - only column values are selected (no ORM objects, so no Page.characters
+#     loads), with long text cut to TRUNCATE characters by the database
+#   - filters (?f.book_id=12) and sorting (?sort=date&dir=asc) only on indexed
+#     columns, so every page is an index range scan
+#   - keyset paging (?after=<cursor> / ?before=<cursor>) instead of OFFSET, and
+#     no COUNT(*), so page 4000 costs the same as page 1
+#   - ?start=<id> jumps straight to that id (newest first from there)
+#
+# Sorting needs a NOT NULL column (NULLs don't compare in a keyset); nullable
+# indexed columns like alias.user_id can still be filtered on.
+#
+# There are no migrations, and workers don't touch the schema when they boot
+# (several at once would race on the same CREATE TABLE). Run
+# `python table_browser.py` once after upgrading: it creates missing tables
+# (Neighbor, PanelFingerprint, ...) with create_all(), then the indexes added to
+# the models later (like the foreign key ones), which create_all() skips on
+# tables that already exist. On Postgres the indexes are built CONCURRENTLY, so
+# the site keeps taking writes meanwhile.
+
+PER_PAGE = 25
+TRUNCATE = 80
+
+
+def indexed_columns(table):
+    """Columns an index can answer equality and range lookups on (the leading column of each index)."""
+    columns = {c.name for c in table.primary_key.columns}
+    columns.update(c.name for c in table.columns if c.unique)
+    columns.update(list(index.columns)[0].name for index in table.indexes)
+    return [c for c in table.columns.keys() if c in columns]
+
+
+def ensure_indexes(engine):
+    """CREATE INDEX IF NOT EXISTS for every model index. Returns how many it asked for."""
+    indexes = [index for table in db.metadata.sorted_tables for index in table.indexes]
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as conn:
+            for index in indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+        return len(indexes)
+
+    # CONCURRENTLY doesn't block writes, but can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for index in indexes:
+            index.dialect_options['postgresql']['concurrently'] = True
+            try:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+            finally:
+                index.dialect_options['postgresql']['concurrently'] = False
+    return len(indexes)
+
+
+def _parse(column, value):
+    python_type = column.type.python_type
+    if hasattr(python_type, 'fromisoformat'):
+        return python_type.fromisoformat(value)
+    return python_type(value)
+
+
+def browse(model, args):
+    """One page of a table for the admin view, as plain rows."""
+    table = model.__table__
+    indexed = indexed_columns(table)
+    sortable = [c for c in indexed if not table.columns[c].nullable]
+    key = table.columns['id']
+
+    sort = args.get('sort') if args.get('sort') in sortable else 'id'
+    descending = args.get('dir', 'desc') != 'asc'
+    sort_column = table.columns[sort]
+    order = (sort_column, key) if sort != 'id' else (key,)
+
+    # Long text is cut short in SQL, so a page of drawings' captions stays small
+    shown = [func.substr(c, 1, TRUNCATE).label(c.name) if isinstance(c.type, Text) else c for c in table.columns]
+    query = select(*shown)
+
+    filters = {}
+    for name in indexed:
+        value = args.get(f'f.{name}', '').strip()
+        if value:
+            try:
+                query = query.where(table.columns[name] == _parse(table.columns[name], value))
+            except (ValueError, TypeError):
+                raise ApiError(f"Not a valid {name}: {value}")
+            filters[name] = value
+
+    before = args.get('before')
+    cursor = args.get('after') or before
+    if args.get('start', type=int) is not None:
+        # Jump to an id: newest first from there, whatever the sort was
+        order, descending, before, cursor = (key,), True, None, None
+        sort = 'id'
+        query = query.where(key <= args.get('start', type=int))
+    if cursor:
+        values = decode_cursor(cursor, order)
+        row_key, cursor_key = (order[0], values[0]) if len(order) == 1 else (tuple_(*order), tuple_(*values))
+        # Going back means walking the index the other way and flipping the result
+        forward = descending != bool(before)
+        query = query.where(row_key < cursor_key if forward else row_key > cursor_key)
+
+    backwards = descending == bool(before)
+    query = query.order_by(*[c.asc() if backwards else c.desc() for c in order]).limit(PER_PAGE + 1)
+    rows = db.session.execute(query).all()
+    more = len(rows) > PER_PAGE
+    rows = rows[:PER_PAGE]
+    if before:
+        rows.reverse()
+
+    def cursor_of(row):
+        return encode_cursor([row._mapping[c.name] for c in order])
+
+    return {
+        "columns": table.columns.keys(),
+        "rows": rows,
+        "filterable": indexed,
+        "sortable": sortable,
+        "sort": sort,
+        "descending": descending,
+        "filters": filters,
+        # A page reached with ?after= always has rows before it; with ?before= only if there were more
+        "prev": cursor_of(rows[0]) if rows and ((before and more) or args.get('after') or args.get('start')) else None,
+        "next": cursor_of(rows[-1]) if rows and (more if not before else True) else None,
+    }
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        db.create_all()
+        print(f"Checked {len(db.metadata.tables)} tables and {ensure_indexes(db.engine)} indexes.")